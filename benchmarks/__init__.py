@@ -0,0 +1 @@
+"""Offline benchmarks for the PDF services (see benchmarks/run.py)"""
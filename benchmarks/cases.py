@@ -0,0 +1,160 @@
+"""Benchmark cases: the core of each service, called without Telegram
+
+Each case takes the corpus (name -> path) and an output directory and
+returns the number of bytes it produced.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from benchmarks.corpus import PASSWORD
+from core.io import get_page_count
+from core.compress import compress_pdf_pikepdf, compress_pdf_ghostscript
+from core.security import encrypt_pdf, decrypt_pdf
+from core.split import inspect_pdf, plan_parts, plan_size_parts, extract_pages
+from core.merge import merge_pdfs
+from core.convert import pdf_to_docx_pages, assemble_docx, render_page
+from core.image_pdf import images_to_pdf
+from core.text import extract_text, extract_text_layout
+import config
+
+def _size(path):
+    return os.path.getsize(path)
+
+def compress_pikepdf(name):
+    def run(corpus, out_dir):
+        output_path = os.path.join(out_dir, 'compressed.pdf')
+        compress_pdf_pikepdf(corpus[name], output_path, 'medium')
+        return _size(output_path)
+    return run
+
+def compress_ghostscript(name):
+    def run(corpus, out_dir):
+        output_path = os.path.join(out_dir, 'compressed.pdf')
+        compress_pdf_ghostscript(corpus[name], output_path, 'medium')
+        return _size(output_path)
+    return run
+
+def encrypt(corpus, out_dir):
+    output_path = os.path.join(out_dir, 'encrypted.pdf')
+    encrypt_pdf(corpus['text'], output_path, 'secret')
+    return _size(output_path)
+
+def decrypt(corpus, out_dir):
+    output_path = os.path.join(out_dir, 'decrypted.pdf')
+    decrypt_pdf(corpus['encrypted'], output_path, PASSWORD)
+    return _size(output_path)
+
+def split_extract(corpus, out_dir):
+    output_path = os.path.join(out_dir, 'split.pdf')
+    extract_pages(corpus['many_pages'], output_path, [(1, 100), (200, 300)])
+    return _size(output_path)
+
+def split_every(corpus, out_dir):
+    parts = plan_parts('every', '50', inspect_pdf(corpus['many_pages']))
+    total = 0
+    for index, (_, ranges) in enumerate(parts):
+        output_path = os.path.join(out_dir, f'part_{index}.pdf')
+        extract_pages(corpus['many_pages'], output_path, ranges)
+        total += _size(output_path)
+    return total
+
+def split_by_size(corpus, out_dir):
+    parts = plan_size_parts(corpus['scanned'], 2 * 1024 * 1024)
+    total = 0
+    for index, (_, ranges) in enumerate(parts):
+        output_path = os.path.join(out_dir, f'part_{index}.pdf')
+        extract_pages(corpus['scanned'], output_path, ranges)
+        total += _size(output_path)
+    return total
+
+def merge(corpus, out_dir):
+    output_path = os.path.join(out_dir, 'merged.pdf')
+    merge_pdfs([corpus[name] for name in ('text', 'mixed', 'mixed', 'many_pages')], output_path)
+    return _size(output_path)
+
+def pdf_to_word(corpus, out_dir):
+    """The bot's path: page chunks in processes of their own, then one assembly"""
+    source = corpus['text']
+    page_count = get_page_count(source)
+    chunk = config.PDF_TO_WORD_CHUNK_PAGES
+    starts = range(0, page_count, chunk)
+    pages_paths = [os.path.join(out_dir, f'pages_{start}.jsonl') for start in starts]
+    
+    # A fresh process per chunk, as run_killable gives each one
+    with ProcessPoolExecutor(
+        max_workers=config.WORKER_PROCESSES,
+        mp_context=multiprocessing.get_context(config.WORKER_START_METHOD),
+        max_tasks_per_child=1
+    ) as pool:
+        futures = [
+            pool.submit(
+                pdf_to_docx_pages, source, start, min(start + chunk, page_count),
+                pages_path, None, config.PDF_TO_WORD_PAGE_TIMEOUT
+            )
+            for start, pages_path in zip(starts, pages_paths)
+        ]
+        for future in futures:
+            future.result()
+    
+    output_path = os.path.join(out_dir, 'converted.docx')
+    assemble_docx(source, pages_paths, output_path)
+    return _size(output_path)
+
+def word_to_pdf(corpus, out_dir):
+    from utils.office import office_pool
+
+    async def convert():
+        try:
+            await office_pool.convert_to_pdf(corpus['docx'], os.path.join(out_dir, 'converted.pdf'))
+        finally:
+            await office_pool.stop()
+
+    asyncio.run(convert())
+    return _size(os.path.join(out_dir, 'converted.pdf'))
+
+def pdf_to_images(corpus, out_dir):
+    source = corpus['mixed']
+    return sum(
+        len(render_page(source, index, 'jpeg', dpi=200))
+        for index in range(get_page_count(source))
+    )
+
+def images_to_pdf_case(corpus, out_dir):
+    output_path = os.path.join(out_dir, 'images.pdf')
+    images_to_pdf([corpus['jpeg'], corpus['png']], output_path)
+    return _size(output_path)
+
+def extract_fast(name):
+    def run(corpus, out_dir):
+        output_path = os.path.join(out_dir, 'text.txt')
+        extract_text(corpus[name], output_path)
+        return _size(output_path)
+    return run
+
+def extract_layout(corpus, out_dir):
+    output_path = os.path.join(out_dir, 'text.txt')
+    extract_text_layout(corpus['text'], output_path, 0, get_page_count(corpus['text']))
+    return _size(output_path)
+
+# case name -> (input names, function, external binary it needs)
+CASES = {
+    'compress_pikepdf_text': (['text'], compress_pikepdf('text'), None),
+    'compress_pikepdf_scanned': (['scanned'], compress_pikepdf('scanned'), None),
+    'compress_pikepdf_mixed': (['mixed'], compress_pikepdf('mixed'), None),
+    'compress_ghostscript_scanned': (['scanned'], compress_ghostscript('scanned'), config.GHOSTSCRIPT_BINARY),
+    'compress_ghostscript_mixed': (['mixed'], compress_ghostscript('mixed'), config.GHOSTSCRIPT_BINARY),
+    'encrypt_text': (['text'], encrypt, None),
+    'decrypt_encrypted': (['encrypted'], decrypt, None),
+    'split_extract_many_pages': (['many_pages'], split_extract, None),
+    'split_every_50_many_pages': (['many_pages'], split_every, None),
+    'split_by_size_scanned': (['scanned'], split_by_size, None),
+    'merge_mixed_set': (['text', 'mixed', 'many_pages'], merge, None),
+    'pdf_to_word_text': (['text'], pdf_to_word, None),
+    'word_to_pdf_docx': (['docx'], word_to_pdf, config.LIBREOFFICE_BINARY),
+    'pdf_to_images_mixed': (['mixed'], pdf_to_images, None),
+    'images_to_pdf_jpeg_png': (['jpeg', 'png'], images_to_pdf_case, None),
+    'extract_text_fast_text': (['text'], extract_fast('text'), None),
+    'extract_text_fast_many_pages': (['many_pages'], extract_fast('many_pages'), None),
+    'extract_text_layout_text': (['text'], extract_layout, None)
+}
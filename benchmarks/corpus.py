@@ -0,0 +1,160 @@
+"""Deterministic synthetic inputs for the benchmarks
+
+Every file is generated from a fixed seed, so two runs on different machines
+measure the same bytes. Files are only written when missing.
+"""
+import datetime
+import io
+import os
+import random
+import zipfile
+from core.lazy import lazy_import
+
+# Only the parent builds the corpus; case processes import this module for
+# PASSWORD and must not pay for these libraries in their peak RSS
+fitz = lazy_import('fitz')  # PyMuPDF
+pikepdf = lazy_import('pikepdf')
+Image = lazy_import('PIL.Image')
+ImageDraw = lazy_import('PIL.ImageDraw')
+docx = lazy_import('docx')
+
+SEED = 1234
+PASSWORD = 'bench'
+FIXED_PDF_DATE = "D:20240101000000Z"
+FIXED_DATE = datetime.datetime(2024, 1, 1)
+
+WORDS = (
+    "invoice contract party agreement term payment delivery clause section "
+    "schedule annex obligation liability notice period amount total date "
+    "signature witness company address tax rate service product"
+).split()
+
+def _paragraph(rng, words=120):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+def _noise_image(rng, width, height):
+    """A grey 'scan' with text-like strokes, which compresses like a real scan"""
+    image = Image.new('L', (width, height), 235)
+    draw = ImageDraw.Draw(image)
+    for line in range(40, height - 40, 28):
+        x = 60
+        while x < width - 80:
+            length = rng.randint(20, 90)
+            draw.rectangle([x, line, x + length, line + 12], fill=rng.randint(20, 90))
+            x += length + rng.randint(8, 20)
+    pixels = image.load()
+    for _ in range(width * height // 50):
+        pixels[rng.randrange(width), rng.randrange(height)] = rng.randint(150, 255)
+    return image
+
+def _jpeg_bytes(image, quality=85):
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=quality)
+    return out.getvalue()
+
+def _save_pdf(doc, path):
+    """Save without timestamps or a random file ID, so output is byte-stable"""
+    doc.set_metadata({
+        'creationDate': FIXED_PDF_DATE,
+        'modDate': FIXED_PDF_DATE,
+        'producer': 'benchmarks'
+    })
+    doc.save(path, no_new_id=True, garbage=1)
+
+def text_pdf(path, rng, pages=40):
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 545, 790), f"Page {number + 1}\n\n" + "\n\n".join(
+            _paragraph(rng) for _ in range(4)
+        ), fontsize=10)
+    doc.set_toc([[1, f"Chapter {i + 1}", i * 10 + 1] for i in range(pages // 10)])
+    _save_pdf(doc, path)
+
+def scanned_pdf(path, rng, pages=12):
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=_jpeg_bytes(_noise_image(rng, 1240, 1754)))
+    _save_pdf(doc, path)
+
+def mixed_pdf(path, rng, pages=20):
+    doc = fitz.open()
+    logo = _jpeg_bytes(_noise_image(rng, 400, 200))
+    for number in range(pages):
+        page = doc.new_page()
+        # The same logo on every page, as in real letterheads
+        page.insert_image(fitz.Rect(50, 30, 250, 130), stream=logo)
+        page.insert_textbox(fitz.Rect(50, 150, 545, 500), _paragraph(rng, 200), fontsize=10)
+        if number % 2 == 0:
+            page.insert_image(fitz.Rect(50, 520, 545, 790), stream=_jpeg_bytes(_noise_image(rng, 800, 440)))
+    _save_pdf(doc, path)
+
+def many_pages_pdf(path, rng, pages=600):
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_text((50, 60), f"Record {number + 1}: " + _paragraph(rng, 12), fontsize=9)
+    _save_pdf(doc, path)
+
+def encrypted_pdf(path, rng):
+    buffer = io.BytesIO()
+    text_pdf(buffer, rng, pages=20)
+    buffer.seek(0)
+    with pikepdf.open(buffer) as pdf:
+        # AES salts are random, so only this file's bytes differ between builds
+        pdf.save(path, static_id=True, encryption=pikepdf.Encryption(owner=PASSWORD, user=PASSWORD, R=6))
+
+def docx_file(path, rng, paragraphs=60):
+    document = docx.Document()
+    document.add_heading('Synthetic report', 0)
+    for number in range(paragraphs):
+        if number % 15 == 0:
+            document.add_heading(f"Section {number // 15 + 1}", 1)
+        document.add_paragraph(_paragraph(rng))
+    table = document.add_table(rows=10, cols=4)
+    for row in table.rows:
+        for cell in row.cells:
+            cell.text = rng.choice(WORDS)
+    document.core_properties.created = FIXED_DATE
+    document.core_properties.modified = FIXED_DATE
+    buffer = io.BytesIO()
+    document.save(buffer)
+
+    # python-docx stamps zip entries with the current time; repack with a fixed one
+    with zipfile.ZipFile(buffer) as source, zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            entry = zipfile.ZipInfo(item.filename, FIXED_DATE.timetuple()[:6])
+            entry.compress_type = zipfile.ZIP_DEFLATED
+            target.writestr(entry, source.read(item.filename))
+
+def jpeg_file(path, rng):
+    _noise_image(rng, 2480, 3508).convert('RGB').save(path, 'JPEG', quality=90)
+
+def png_file(path, rng):
+    image = _noise_image(rng, 1240, 1754).convert('RGBA')
+    image.save(path, 'PNG')
+
+# name -> (filename, generator)
+CORPUS = {
+    'text': ('text.pdf', text_pdf),
+    'scanned': ('scanned.pdf', scanned_pdf),
+    'mixed': ('mixed.pdf', mixed_pdf),
+    'many_pages': ('many_pages.pdf', many_pages_pdf),
+    'encrypted': ('encrypted.pdf', encrypted_pdf),
+    'docx': ('report.docx', docx_file),
+    'jpeg': ('photo.jpg', jpeg_file),
+    'png': ('scan.png', png_file)
+}
+
+def build_corpus(directory):
+    """Generate any missing corpus files and return name -> path"""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name, (filename, generator) in CORPUS.items():
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            # Seeded per file, so one file does not change when another is added
+            generator(path, random.Random(f"{SEED}:{name}"))
+        paths[name] = path
+    return paths
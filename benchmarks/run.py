@@ -0,0 +1,190 @@
+"""Run the service benchmarks and save comparable JSON results
+
+Usage:
+    python -m benchmarks.run                          # run every case
+    python -m benchmarks.run -k compress -r 5         # cases matching 'compress', 5 runs each
+    python -m benchmarks.run --compare old.json       # also show the change against a previous run
+
+Each run of a case happens in a fresh process, so peak RSS belongs to that
+case alone (child processes such as Ghostscript are included). It is
+reported above a baseline taken once the case module is imported, so the
+interpreter and benchmark harness do not count.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import config
+
+DEFAULT_CORPUS_DIR = os.path.join(config.TEMP_DIR, 'benchmark_corpus')
+DEFAULT_OUTPUT = os.path.join('benchmarks', 'results.json')
+
+def _peak_rss_kb():
+    """Peak RSS of this process in KB
+
+    VmHWM starts fresh at exec; ru_maxrss would also count the parent's
+    RSS when this process was forked, which is where the corpus was built.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _run_case(name, corpus):
+    """Executed in a fresh process: run one case and measure it"""
+    from benchmarks.cases import CASES
+
+    _, func, _ = CASES[name]
+    baseline_kb = _peak_rss_kb()
+    out_dir = tempfile.mkdtemp(prefix='bench_')
+    try:
+        start = time.perf_counter()
+        output_bytes = func(corpus, out_dir)
+        wall = time.perf_counter() - start
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    peak_kb = max(
+        _peak_rss_kb() - baseline_kb,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+    return {
+        'wall_seconds': wall,
+        'peak_rss_mb': peak_kb / 1024,
+        'baseline_rss_mb': baseline_kb / 1024,
+        'output_bytes': output_bytes
+    }
+
+def run_case(name, corpus, repeat):
+    """Run a case `repeat` times; report the median time and the worst memory"""
+    from benchmarks.cases import CASES
+
+    inputs, _, binary = CASES[name]
+    result = {
+        'case': name,
+        'inputs': {n: os.path.getsize(corpus[n]) for n in inputs},
+        'status': 'ok'
+    }
+    if binary and shutil.which(binary) is None:
+        result['status'] = 'skipped'
+        result['reason'] = f"{binary} not installed"
+        return result
+
+    runs = []
+    context = multiprocessing.get_context('spawn')
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                runs.append(executor.submit(_run_case, name, corpus).result())
+            except Exception as e:
+                result['status'] = 'error'
+                result['error'] = str(e)
+                return result
+
+    result['wall_seconds'] = round(statistics.median(r['wall_seconds'] for r in runs), 4)
+    result['wall_seconds_all'] = [round(r['wall_seconds'], 4) for r in runs]
+    result['peak_rss_mb'] = round(max(r['peak_rss_mb'] for r in runs), 1)
+    result['baseline_rss_mb'] = round(max(r['baseline_rss_mb'] for r in runs), 1)
+    result['output_bytes'] = runs[-1]['output_bytes']
+    return result
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+def compare(previous, current, threshold):
+    """Print per-case changes and return the names of cases that got slower or bigger"""
+    before = {r['case']: r for r in previous['results'] if r['status'] == 'ok'}
+    regressions = []
+
+    print(f"\n{'case':34} {'time':>22} {'peak RSS':>22} {'output':>10}")
+    for result in current['results']:
+        old = before.get(result['case'])
+        if result['status'] != 'ok' or old is None:
+            continue
+
+        changes = []
+        for key in ('wall_seconds', 'peak_rss_mb', 'output_bytes'):
+            change = (result[key] - old[key]) / old[key] * 100 if old[key] else 0
+            changes.append(change)
+        if changes[0] > threshold or changes[1] > threshold or changes[2] > threshold:
+            regressions.append(result['case'])
+
+        print(
+            f"{result['case']:34} "
+            f"{old['wall_seconds']:8.3f}s → {result['wall_seconds']:7.3f}s {changes[0]:+6.1f}% "
+            f"{old['peak_rss_mb']:6.0f} → {result['peak_rss_mb']:6.0f}MB {changes[1]:+6.1f}% "
+            f"{changes[2]:+9.1f}%"
+            + ("  ⚠" if result['case'] in regressions else "")
+        )
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', '--filter', default='', help="only run cases whose name contains this")
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="runs per case (median time is reported)")
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT, help="where to write the JSON results")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS_DIR, help="directory for the generated inputs")
+    parser.add_argument('--compare', help="previous results file to compare against")
+    parser.add_argument('--threshold', type=float, default=10, help="percent change reported as a regression")
+    parser.add_argument('--fail-on-regression', action='store_true', help="exit with status 1 on regressions")
+    args = parser.parse_args(argv)
+
+    from benchmarks.cases import CASES
+    from benchmarks.corpus import build_corpus
+
+    corpus = build_corpus(args.corpus)
+    names = [name for name in CASES if args.filter in name]
+
+    results = []
+    for name in names:
+        result = run_case(name, corpus, args.repeat)
+        results.append(result)
+        if result['status'] == 'ok':
+            print(
+                f"{name:34} {result['wall_seconds']:8.3f}s "
+                f"{result['peak_rss_mb']:7.1f} MB peak  {result['output_bytes'] / 1024:9.1f} KB out"
+            )
+        else:
+            print(f"{name:34} {result['status']}: {result.get('reason') or result.get('error')}")
+
+    report = {'environment': environment(), 'repeat': args.repeat, 'results': results}
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+import hashlib
 import os
 from dotenv import load_dotenv
 
@@ -7,6 +8,17 @@ load_dotenv()
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 ADMIN_USER_ID = int(os.getenv('ADMIN_USER_ID', 0))
 
+# Update delivery: 'polling' for local development, 'webhook' in production
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEB_PORT = int(os.getenv('PORT', 8080))  # health check, metrics and webhook
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', os.getenv('RENDER_EXTERNAL_URL', ''))  # public base URL
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+# Telegram sends this back in every request. Unless set, it is the SHA-256 of
+# BOT_TOKEN, so replicas sharing a token agree on it without configuration;
+# set WEBHOOK_SECRET to keep it independent of the token
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or hashlib.sha256((BOT_TOKEN or '').encode()).hexdigest()
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))
+
 # File Configuration
 MAX_FILE_SIZE_MB = int(os.getenv('MAX_FILE_SIZE', 50))
 TEMP_DIR = 'temp'
@@ -18,12 +30,117 @@ CONNECT_TIMEOUT = 30.0
 READ_TIMEOUT = 30.0
 WRITE_TIMEOUT = 30.0
 
+# Worker pool for CPU-bound PDF work
+WORKER_PROCESSES = int(os.getenv('WORKER_PROCESSES', os.cpu_count() or 1))
+WORKER_MAX_TASKS = int(os.getenv('WORKER_MAX_TASKS', 50))  # recycle workers to release memory
+WORKER_START_METHOD = os.getenv('WORKER_START_METHOD', 'spawn')
+WORKER_CANCEL_DIR = os.path.join(TEMP_DIR, 'cancel')  # markers for interrupting pool calls
+
+# Heavy libraries each worker imports as it starts (empty: only on first use), and
+# whether to start the worker pool in the background right after the bot starts
+PREWARM_MODULES = [name for name in os.getenv('PREWARM_MODULES', 'fitz,pikepdf').split(',') if name]
+PREWARM_WORKERS = os.getenv('PREWARM_WORKERS', '1') == '1'
+
+# Concurrent jobs per resource class
+JOB_LIMIT_CPU = int(os.getenv('JOB_LIMIT_CPU', WORKER_PROCESSES))
+JOB_LIMIT_NETWORK = int(os.getenv('JOB_LIMIT_NETWORK', 8))
+JOB_LIMIT_LIGHT = int(os.getenv('JOB_LIMIT_LIGHT', 4))
+
 # Compression Levels
 COMPRESSION_LEVELS = {
     'low': '/prepress',
     'medium': '/ebook',
     'high': '/screen'
 }
+GHOSTSCRIPT_BINARY = os.getenv('GHOSTSCRIPT_BINARY', 'gs')
+# Backends run side by side; the smallest output wins
+COMPRESSION_BACKENDS = os.getenv('COMPRESSION_BACKENDS', 'ghostscript,pikepdf').split(',')
+
+# LibreOffice pool for Word to PDF
+LIBREOFFICE_BINARY = os.getenv('LIBREOFFICE_BINARY', 'soffice')
+LIBREOFFICE_INSTANCES = int(os.getenv('LIBREOFFICE_INSTANCES', 2))
+LIBREOFFICE_TIMEOUT = float(os.getenv('LIBREOFFICE_TIMEOUT', 120))  # seconds per conversion
+LIBREOFFICE_START_TIMEOUT = float(os.getenv('LIBREOFFICE_START_TIMEOUT', 60))
+OFFICE_PROFILE_DIR = os.path.join(TEMP_DIR, 'office')
+LIBREOFFICE_PYTHON_PATH = os.getenv('LIBREOFFICE_PYTHON_PATH', '/usr/lib/python3/dist-packages')
+JOB_LIMIT_OFFICE = int(os.getenv('JOB_LIMIT_OFFICE', LIBREOFFICE_INSTANCES))
+
+# Result cache
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', '1') == '1'
+RESULT_CACHE_DIR = os.path.join(TEMP_DIR, 'cache')
+RESULT_CACHE_MAX_MB = int(os.getenv('RESULT_CACHE_MAX_MB', 500))
+RESULT_CACHE_TTL_HOURS = float(os.getenv('RESULT_CACHE_TTL_HOURS', 24))
+
+# Merge engine: 'pikepdf' (deduplicating, low memory) or 'pypdf2'
+MERGE_ENGINE = os.getenv('MERGE_ENGINE', 'pikepdf')
+
+# Split limits
+SPLIT_MAX_PARTS = int(os.getenv('SPLIT_MAX_PARTS', 500))
+SPLIT_SIZE_SAFETY = 0.9  # fill size-based parts to 90% of the requested size
+SPLIT_ZIP_MAX_MB = int(os.getenv('SPLIT_ZIP_MAX_MB', 48))  # parts are sent in ZIP files of at most this size
+
+# White border around images placed on A4 or Letter pages, in points
+IMAGES_PDF_MARGIN = float(os.getenv('IMAGES_PDF_MARGIN', 18))
+
+# PDF to images: default resolution and limits, and the image size Telegram
+# albums are capped at; ZIP downloads are split into parts below the upload limit
+PDF_IMAGES_DPI = int(os.getenv('PDF_IMAGES_DPI', 200))
+PDF_IMAGES_MAX_DPI = int(os.getenv('PDF_IMAGES_MAX_DPI', 600))
+PDF_IMAGES_MAX_PIXELS = int(os.getenv('PDF_IMAGES_MAX_PIXELS', 10000))
+PDF_IMAGES_ALBUM_PIXELS = int(os.getenv('PDF_IMAGES_ALBUM_PIXELS', 2560))
+PDF_IMAGES_QUALITY = int(os.getenv('PDF_IMAGES_QUALITY', 90))
+PDF_IMAGES_ZIP_MAX_MB = int(os.getenv('PDF_IMAGES_ZIP_MAX_MB', 48))
+
+# PDF to Word: pages per killable process, a wall-clock budget for the whole
+# conversion and one per page; pages past either are left out of a partial result
+PDF_TO_WORD_CHUNK_PAGES = int(os.getenv('PDF_TO_WORD_CHUNK_PAGES', 10))
+PDF_TO_WORD_TIMEOUT = float(os.getenv('PDF_TO_WORD_TIMEOUT', 600))  # seconds
+PDF_TO_WORD_PAGE_TIMEOUT = float(os.getenv('PDF_TO_WORD_PAGE_TIMEOUT', 60))  # seconds
+PDF_TO_WORD_ASSEMBLE_TIMEOUT = float(os.getenv('PDF_TO_WORD_ASSEMBLE_TIMEOUT', 180))  # seconds
+
+# Pages per worker task for layout-preserving text extraction
+TEXT_LAYOUT_CHUNK_PAGES = int(os.getenv('TEXT_LAYOUT_CHUNK_PAGES', 25))
+
+# Progress messages: per-chat edit interval and bot-wide edit budget
+PROGRESS_MIN_INTERVAL = float(os.getenv('PROGRESS_MIN_INTERVAL', 3))  # seconds
+PROGRESS_GLOBAL_RATE = float(os.getenv('PROGRESS_GLOBAL_RATE', 10))  # edits per second
+PROGRESS_GLOBAL_BURST = 20
+PROGRESS_POLL_INTERVAL = 1.0  # seconds between reads of worker progress files
+
+# Tracing and profiling
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', '1') == '1'
+TRACE_FILE = os.getenv('TRACE_FILE', os.path.join('logs', 'traces.jsonl'))
+TRACE_MAX_MB = int(os.getenv('TRACE_MAX_MB', 50))  # rotated to .1 beyond this
+PROFILE_DIR = os.path.join(TEMP_DIR, 'profiles')
+PROFILE_TOP_FUNCTIONS = 40
+
+# User sessions: 'memory' (lost on restart), 'sqlite' (one host) or 'redis' (shared by replicas).
+# Only 'memory' shares identical uploads between users and keeps small ones in
+# memory; persisted sessions store every upload as its own file in BLOB_DIR.
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'memory')
+SESSION_DB = os.getenv('SESSION_DB', os.path.join('data', 'sessions.db'))
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_PREFIX = os.getenv('REDIS_PREFIX', 'pdfbot:')
+SESSION_FLUSH_INTERVAL = float(os.getenv('SESSION_FLUSH_INTERVAL', 2))  # seconds between batched writes
+SESSION_TTL_HOURS = float(os.getenv('SESSION_TTL_HOURS', 24 * 7))
+# Uploads of persisted sessions live here so any replica can open them; share it between replicas
+BLOB_DIR = os.getenv('BLOB_DIR', os.path.join(TEMP_DIR, 'blobs'))
+
+# Uploads up to this size are processed in memory instead of on disk
+IN_MEMORY_MAX_MB = float(os.getenv('IN_MEMORY_MAX_MB', 5))
+IN_MEMORY_TOTAL_MB = float(os.getenv('IN_MEMORY_TOTAL_MB', 200))
+
+# Temp storage lifecycle
+WORKSPACE_DIR = os.path.join(TEMP_DIR, 'jobs')
+STORAGE_QUOTA_MB = int(os.getenv('STORAGE_QUOTA_MB', 2048))
+USER_QUOTA_MB = int(os.getenv('USER_QUOTA_MB', 200))
+UPLOAD_TTL_MINUTES = float(os.getenv('UPLOAD_TTL_MINUTES', 30))
+WORKSPACE_MAX_AGE_MINUTES = float(os.getenv('WORKSPACE_MAX_AGE_MINUTES', 120))
+SWEEP_INTERVAL_SECONDS = float(os.getenv('SWEEP_INTERVAL_SECONDS', 300))
+TEMP_USAGE_INTERVAL_SECONDS = float(os.getenv('TEMP_USAGE_INTERVAL_SECONDS', 30))  # how often TEMP_DIR is measured
 
-# Create temp directory if not exists
-os.makedirs(TEMP_DIR, exist_ok=True)
\ No newline at end of file
+# Create temp directories if not exists
+os.makedirs(TEMP_DIR, exist_ok=True)
+os.makedirs(WORKSPACE_DIR, exist_ok=True)
+os.makedirs(BLOB_DIR, exist_ok=True)
+os.makedirs(WORKER_CANCEL_DIR, exist_ok=True)
\ No newline at end of file
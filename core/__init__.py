@@ -0,0 +1,26 @@
+"""Transport-independent PDF operations
+
+Every *_file function takes paths (or bytes) plus options and returns a dict
+with the files it wrote ('outputs'), their total size ('output_bytes') and
+operation-specific stats. Nothing here knows about Telegram: the bot
+handlers in services/ and the batch command line (python -m core.batch)
+are thin layers over the same functions.
+"""
+from core.compress import compress_file
+from core.security import encrypt_file, decrypt_file
+from core.split import split_file
+from core.merge import merge_files
+from core.convert import pdf_to_word_file, pdf_to_images_file, images_to_pdf_file, word_to_pdf_file
+from core.text import extract_text_file
+
+# Operations on a single input file, by name, with the input extensions they accept
+FILE_OPERATIONS = {
+    'compress': (compress_file, ('.pdf',)),
+    'encrypt': (encrypt_file, ('.pdf',)),
+    'decrypt': (decrypt_file, ('.pdf',)),
+    'split': (split_file, ('.pdf',)),
+    'extract-text': (extract_text_file, ('.pdf',)),
+    'pdf-to-word': (pdf_to_word_file, ('.pdf',)),
+    'pdf-to-images': (pdf_to_images_file, ('.pdf',)),
+    'word-to-pdf': (word_to_pdf_file, ('.docx',))
+}
@@ -0,0 +1,206 @@
+"""Process whole directories of files with the core operations
+
+Usage:
+    python -m core.batch compress archive/ out/ --level high --jobs 8
+    python -m core.batch extract-text scans/ text/ --layout
+    python -m core.batch split reports/ parts/ --mode every --spec 20
+
+Files are processed in parallel across worker processes. Every finished file
+is appended to a manifest in the output directory, so an interrupted run
+picks up where it stopped: files already done (and unchanged since) are
+skipped, failed ones are retried.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from core import FILE_OPERATIONS
+import config
+
+def find_inputs(input_dir, extensions):
+    """Input files under input_dir, as sorted paths relative to it"""
+    found = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for filename in files:
+            if os.path.splitext(filename)[1].lower() in extensions:
+                found.append(os.path.relpath(os.path.join(root, filename), input_dir))
+    return sorted(found)
+
+def load_manifest(path):
+    """Latest manifest entry per input file"""
+    entries = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short by an interrupted run
+                    continue
+                entries[entry['input']] = entry
+    return entries
+
+def is_done(entry, input_path, output_dir):
+    """Whether a manifest entry still describes this input and its outputs"""
+    if entry is None or entry['status'] != 'ok':
+        return False
+    stat = os.stat(input_path)
+    if entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+        return False
+    return all(os.path.exists(os.path.join(output_dir, path)) for path in entry['outputs'])
+
+def process_file(operation, input_path, output_dir, name, options):
+    """Run one operation in a worker process, returning stats or the error"""
+    func, _ = FILE_OPERATIONS[operation]
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    try:
+        stats = func(input_path, output_dir, name, **options)
+        stats['status'] = 'ok'
+    except Exception as e:
+        stats = {'status': 'error', 'error': f"{type(e).__name__}: {e}", 'outputs': [], 'output_bytes': 0}
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+def operation_options(args):
+    """Keyword arguments for the chosen operation from the command line"""
+    if args.operation == 'compress':
+        options = {'level': args.level}
+        if args.backends:
+            options['backends'] = args.backends.split(',')
+        return options
+    if args.operation in ('encrypt', 'decrypt'):
+        if not args.password:
+            sys.exit(f"--password is required for {args.operation}")
+        return {'password': args.password}
+    if args.operation == 'split':
+        return {'mode': args.mode, 'spec': args.spec}
+    if args.operation == 'extract-text':
+        return {'layout': args.layout}
+    if args.operation == 'pdf-to-images':
+        return {'dpi': args.dpi, 'fmt': args.format}
+    return {}
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size} B"
+        size /= 1024
+
+def run_batch(args):
+    _, extensions = FILE_OPERATIONS[args.operation]
+    options = operation_options(args)
+    manifest_path = os.path.join(args.output_dir, f".batch_{args.operation}.jsonl")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    manifest = load_manifest(manifest_path)
+    inputs = find_inputs(args.input_dir, extensions)
+    pending = [
+        rel for rel in inputs
+        if not is_done(manifest.get(rel), os.path.join(args.input_dir, rel), args.output_dir)
+    ]
+    skipped = len(inputs) - len(pending)
+    print(f"{len(inputs)} files found, {skipped} already done, {len(pending)} to process with {args.jobs} workers")
+    if not pending:
+        return 0
+
+    done = failed = bytes_in = bytes_out = 0
+    started = time.monotonic()
+    context = multiprocessing.get_context(config.WORKER_START_METHOD)
+    queue = iter(pending)
+    running = {}
+
+    with ProcessPoolExecutor(max_workers=args.jobs, mp_context=context) as executor, \
+            open(manifest_path, 'a', encoding='utf-8') as manifest_file:
+
+        def submit_next():
+            rel = next(queue, None)
+            if rel is None:
+                return
+            input_path = os.path.join(args.input_dir, rel)
+            output_dir = os.path.join(args.output_dir, os.path.dirname(rel))
+            name = os.path.splitext(os.path.basename(rel))[0]
+            future = executor.submit(process_file, args.operation, input_path, output_dir, name, options)
+            running[future] = rel
+
+        # Keep a bounded number of files in flight, so huge directories do not queue up in memory
+        for _ in range(args.jobs * 2):
+            submit_next()
+
+        try:
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    rel = running.pop(future)
+                    stats = future.result()
+                    stat = os.stat(os.path.join(args.input_dir, rel))
+
+                    entry = {
+                        'input': rel,
+                        'size': stat.st_size,
+                        'mtime': stat.st_mtime,
+                        **{k: v for k, v in stats.items() if k != 'backends'},
+                        'outputs': [os.path.relpath(path, args.output_dir) for path in stats['outputs']]
+                    }
+                    manifest_file.write(json.dumps(entry) + "\n")
+                    manifest_file.flush()
+
+                    done += 1
+                    if stats['status'] == 'ok':
+                        bytes_in += stat.st_size
+                        bytes_out += stats['output_bytes']
+                        detail = (
+                            f"{format_bytes(stat.st_size)} → {format_bytes(stats['output_bytes'])} "
+                            f"in {stats['seconds']:.2f}s"
+                        )
+                    else:
+                        failed += 1
+                        detail = stats['error']
+
+                    elapsed = time.monotonic() - started
+                    eta = elapsed / done * (len(pending) - done)
+                    print(f"[{done}/{len(pending)}] {stats['status']:5} {rel}: {detail} · ETA {eta:.0f}s", flush=True)
+                    submit_next()
+        except KeyboardInterrupt:
+            for future in running:
+                future.cancel()
+            print("\nInterrupted; run the same command again to resume.")
+            return 130
+
+    elapsed = time.monotonic() - started
+    ratio = f" ({bytes_out / bytes_in * 100:.1f}% of input)" if bytes_in else ""
+    print(
+        f"\nDone in {elapsed:.1f}s: {done - failed} ok, {failed} failed, {skipped} skipped. "
+        f"{format_bytes(bytes_in)} in, {format_bytes(bytes_out)} out{ratio}."
+    )
+    return 1 if failed else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m core.batch', description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('operation', choices=sorted(FILE_OPERATIONS))
+    parser.add_argument('input_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('-j', '--jobs', type=int, default=config.WORKER_PROCESSES, help="parallel worker processes")
+    parser.add_argument('--level', choices=sorted(config.COMPRESSION_LEVELS), default='medium')
+    parser.add_argument('--backends', help="comma-separated compression backends (default: COMPRESSION_BACKENDS)")
+    parser.add_argument('--password', help="password for encrypt/decrypt")
+    parser.add_argument('--mode', choices=['extract', 'every', 'ranges', 'bookmarks', 'size'], default='every')
+    parser.add_argument('--spec', default='10', help="pages, part length or size in MB, depending on --mode")
+    parser.add_argument('--layout', action='store_true', help="keep layout and tables when extracting text")
+    parser.add_argument('--dpi', type=int, default=200)
+    parser.add_argument('--format', choices=['jpeg', 'png', 'webp'], default='jpeg', help="image format for pdf-to-images")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"{args.input_dir} is not a directory")
+    sys.exit(run_batch(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Compression backends: Ghostscript (lossy presets) and pikepdf (lossless)"""
+import logging
+import os
+import shutil
+import subprocess
+import time
+from core.io import as_stream
+from core.lazy import lazy_import
+import config
+
+logger = logging.getLogger(__name__)
+
+pikepdf = lazy_import('pikepdf')
+
+def ghostscript_command(input_path, output_path, level):
+    """Ghostscript arguments for recompressing a PDF with the preset for the level"""
+    return [
+        config.GHOSTSCRIPT_BINARY,
+        '-sDEVICE=pdfwrite',
+        '-dCompatibilityLevel=1.5',
+        f'-dPDFSETTINGS={config.COMPRESSION_LEVELS[level]}',
+        '-dNOPAUSE',
+        '-dQUIET',
+        '-dBATCH',
+        '-dSAFER',
+        f'-sOutputFile={output_path}',
+        input_path
+    ]
+
+def compress_pdf_ghostscript(input_path, output_path, level):
+    """Recompress a PDF on disk with Ghostscript, blocking until it finishes"""
+    process = subprocess.run(
+        ghostscript_command(input_path, output_path, level),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.decode(errors='replace').strip() or f"exit code {process.returncode}")
+
+def pikepdf_save_options(level='medium'):
+    """pikepdf save settings for lossless compression at the level"""
+    return {
+        'compress_streams': True,
+        'recompress_flate': level != 'low',
+        'object_stream_mode': pikepdf.ObjectStreamMode.generate
+    }
+
+def compress_pdf_pikepdf(source, output_path, level='medium'):
+    """Losslessly compress a PDF with object streams and recompressed streams"""
+    with pikepdf.open(as_stream(source)) as pdf:
+        pdf.remove_unreferenced_resources()
+        pdf.save(output_path, **pikepdf_save_options(level))
+
+# Blocking backends, each called as backend(source, output_path, level)
+BACKENDS = {
+    'ghostscript': compress_pdf_ghostscript,
+    'pikepdf': compress_pdf_pikepdf
+}
+
+def usable_backends(source, backends=None):
+    """The configured backends that exist and can read source; Ghostscript needs a path"""
+    names = [b for b in (backends or config.COMPRESSION_BACKENDS) if b in BACKENDS]
+    if isinstance(source, (bytes, bytearray)):
+        names = [b for b in names if b != 'ghostscript']
+    return names
+
+def backend_result(backend, output_path, started, error=None):
+    """Report one backend run: its output, size, time and error; a failed run's output is removed"""
+    if error is not None and os.path.exists(output_path):
+        os.remove(output_path)
+    return {
+        'backend': backend,
+        'path': output_path if error is None else None,
+        'size': os.path.getsize(output_path) if error is None else None,
+        'seconds': time.monotonic() - started,
+        'error': None if error is None else str(error)
+    }
+
+def run_backend(backend, source, output_path, level='medium'):
+    """Run one blocking backend and report it with backend_result"""
+    started = time.monotonic()
+    try:
+        BACKENDS[backend](source, output_path, level)
+    except Exception as e:
+        logger.warning(f"Compression backend {backend} failed: {e}")
+        return backend_result(backend, output_path, started, e)
+    return backend_result(backend, output_path, started)
+
+def pick_output(results, input_bytes):
+    """Keep the smallest backend output, if it is smaller than the input
+
+    Every other output is deleted. Returns the winning result, or None when
+    no backend made the file smaller and the original should be kept.
+    Raises RuntimeError when every backend failed.
+    """
+    succeeded = [r for r in results if r['error'] is None]
+    if not succeeded:
+        raise RuntimeError("; ".join(f"{r['backend']}: {r['error']}" for r in results) or "no backend available")
+
+    best = min(succeeded, key=lambda r: r['size'])
+    if best['size'] >= input_bytes:
+        best = None
+    for result in succeeded:
+        if result is not best:
+            os.remove(result['path'])
+    return best
+
+def compress_file(source, output_dir, name, level='medium', backends=None):
+    """Compress one PDF with each backend in turn and keep the smallest output
+
+    Ghostscript needs a path, so it is skipped for in-memory sources. When no
+    backend makes the file smaller the original is written unchanged, with
+    backend 'original'. Returns the output, the winning backend and every
+    backend's size and time.
+    """
+    results = [
+        run_backend(backend, source, os.path.join(output_dir, f"{name}.{backend}.pdf"), level)
+        for backend in usable_backends(source, backends)
+    ]
+
+    output_path = os.path.join(output_dir, f"{name}.pdf")
+    input_bytes = len(source) if isinstance(source, (bytes, bytearray)) else os.path.getsize(source)
+    best = pick_output(results, input_bytes)
+    if best is None:
+        best = {'backend': 'original', 'size': input_bytes}
+        if isinstance(source, (bytes, bytearray)):
+            with open(output_path, 'wb') as f:
+                f.write(source)
+        else:
+            shutil.copyfile(source, output_path)
+    else:
+        os.replace(best['path'], output_path)
+    return {
+        'outputs': [output_path],
+        'output_bytes': best['size'],
+        'backend': best['backend'],
+        'backends': [{k: v for k, v in r.items() if k != 'path'} for r in results]
+    }
@@ -0,0 +1,256 @@
+"""Conversions between PDF, Word and images"""
+import io
+import json
+import logging
+import os
+import re
+import signal
+import subprocess
+import tempfile
+import time
+from core.image_pdf import images_to_pdf
+from core.io import fitz, open_fitz, get_page_count, output_size
+from core.split import parse_page_ranges
+from core.lazy import lazy_import
+from core.progress import progress_sink
+import config
+
+logger = logging.getLogger(__name__)
+
+pdf2docx = lazy_import('pdf2docx')
+Image = lazy_import('PIL.Image')
+
+# Image formats pages can be rendered to, with their file extensions
+IMAGE_FORMATS = {'jpeg': 'jpg', 'png': 'png', 'webp': 'webp'}
+
+def pdf_to_docx(input_path, output_path, progress_path=None):
+    """Convert a PDF to DOCX with pdf2docx
+    
+    Runs pdf2docx's parse steps one page at a time so progress can be reported.
+    """
+    report = progress_sink(progress_path)
+    cv = pdf2docx.Converter(input_path)
+    try:
+        settings = cv.default_settings
+        
+        report(0, 0, "Analyzing document")
+        cv.load_pages().parse_document(**settings)
+        
+        pages = [page for page in cv.pages if not page.skip_parsing]
+        for i, page in enumerate(pages, 1):
+            try:
+                page.parse(**settings)
+            except Exception as e:
+                if settings['debug'] or not settings['ignore_page_error']:
+                    raise
+                logger.error(f"Skipping page {page.id + 1}: {e}")
+            report(i, len(pages), "Pages converted")
+        
+        report(0, 0, "Writing document")
+        cv.make_docx(output_path, **settings)
+    finally:
+        cv.close()
+
+class PageTimeout(BaseException):
+    """A page took longer than its time budget
+
+    A BaseException so pdf2docx's own ``except Exception`` blocks cannot
+    swallow it; a bare ``except`` still can, which the caller checks for.
+    """
+
+def _page_timeout(signum, frame):
+    raise PageTimeout()
+
+def pdf_to_docx_pages(input_path, start, end, pages_path, progress_path=None, page_seconds=None):
+    """Parse pages [start, end) with pdf2docx, appending each to pages_path as a JSON line
+
+    Pages are written as soon as they are parsed, so the finished ones
+    survive if the process is killed. A page running longer than
+    page_seconds is skipped (where SIGALRM exists). Returns the number of
+    pages parsed.
+    """
+    report = progress_sink(progress_path)
+    timed = bool(page_seconds) and hasattr(signal, 'setitimer')
+    if timed:
+        signal.signal(signal.SIGALRM, _page_timeout)
+    cv = pdf2docx.Converter(input_path)
+    try:
+        settings = cv.default_settings
+        cv.load_pages(start, end).parse_document(**settings)
+        
+        pages = [page for page in cv.pages if not page.skip_parsing]
+        parsed = 0
+        with open(pages_path, 'a', encoding='utf-8') as f:
+            for i, page in enumerate(pages, 1):
+                try:
+                    if timed:
+                        deadline = time.monotonic() + page_seconds
+                        signal.setitimer(signal.ITIMER_REAL, page_seconds)
+                    try:
+                        page.parse(**settings)
+                    finally:
+                        if timed:
+                            signal.setitimer(signal.ITIMER_REAL, 0)
+                    # The alarm may have been caught inside pdf2docx
+                    if timed and time.monotonic() >= deadline:
+                        raise PageTimeout()
+                except PageTimeout:
+                    logger.error(f"Skipping page {page.id + 1}: over {page_seconds}s")
+                except Exception as e:
+                    if settings['debug'] or not settings['ignore_page_error']:
+                        raise
+                    logger.error(f"Skipping page {page.id + 1}: {e}")
+                else:
+                    f.write(json.dumps(page.store()) + '\n')
+                    f.flush()
+                    parsed += 1
+                report(i, len(pages), "Pages converted")
+        return parsed
+    finally:
+        cv.close()
+
+def assemble_docx(input_path, pages_paths, output_path):
+    """Write the DOCX from pages parsed by pdf_to_docx_pages
+
+    Returns the sorted 0-based ids of the pages it contains; a line cut off
+    by a killed process is ignored.
+    """
+    cv = pdf2docx.Converter(input_path)
+    try:
+        cv.load_pages()
+        parsed = []
+        for path in pages_paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        parsed.append(json.loads(line))
+                    except ValueError:
+                        break
+        if not parsed:
+            return []
+        cv.restore({'pages': parsed})
+        cv.make_docx(output_path, **cv.default_settings)
+        return sorted(page['id'] for page in parsed)
+    finally:
+        cv.close()
+
+def render_page(source, page_index, fmt='jpeg', dpi=200, max_pixels=None, quality=90):
+    """Render a single page to image bytes, encoded in memory
+
+    With dpi=None the longest side is scaled to max_pixels; otherwise
+    max_pixels, if given, only caps it.
+    """
+    with open_fitz(source) as doc:
+        page = doc[page_index]
+        longest = max(page.rect.width, page.rect.height)
+        if dpi is None:
+            zoom = max_pixels / longest
+        else:
+            zoom = dpi / 72
+            if max_pixels:
+                zoom = min(zoom, max_pixels / longest)
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+
+    if fmt == 'jpeg':
+        return pixmap.tobytes('jpeg', jpg_quality=quality)
+    if fmt == 'png':
+        return pixmap.tobytes('png')
+    if fmt == 'webp':
+        # PyMuPDF cannot write WebP; Pillow encodes the pixmap samples directly
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples).save(
+            buffer, 'WEBP', quality=quality, method=4
+        )
+        return buffer.getvalue()
+    raise ValueError(f"Unknown image format: {fmt}")
+
+def pdf_to_word_file(input_path, output_dir, name, progress_path=None):
+    """Convert a PDF on disk to output_dir/name.docx"""
+    output_path = os.path.join(output_dir, f"{name}.docx")
+    pdf_to_docx(input_path, output_path, progress_path)
+    return {'outputs': [output_path], 'output_bytes': os.path.getsize(output_path)}
+
+def parse_image_options(text, page_count):
+    """Parse a request like 'all', '1-5, 8 300dpi' or '2-4 1600px'
+
+    Returns (ranges, dpi, max_pixels); a size in px replaces the DPI and
+    scales the longest side of each page to it. Raises ValueError when the
+    input makes no sense.
+    """
+    dpi, max_pixels = config.PDF_IMAGES_DPI, None
+    resolution = re.search(r'(\d+)\s*(dpi|px)\b', text, re.IGNORECASE)
+    if resolution:
+        value = int(resolution.group(1))
+        if resolution.group(2).lower() == 'dpi':
+            if not 36 <= value <= config.PDF_IMAGES_MAX_DPI:
+                raise ValueError(f"DPI must be between 36 and {config.PDF_IMAGES_MAX_DPI}")
+            dpi = value
+        else:
+            if not 100 <= value <= config.PDF_IMAGES_MAX_PIXELS:
+                raise ValueError(f"Size must be between 100 and {config.PDF_IMAGES_MAX_PIXELS} px")
+            dpi, max_pixels = None, value
+        text = text[:resolution.start()] + text[resolution.end():]
+
+    text = text.strip()
+    if not text or text.lower() == 'all':
+        ranges = [(1, page_count)] if page_count else []
+    else:
+        ranges = parse_page_ranges(text, page_count)
+    if not ranges:
+        raise ValueError("No valid pages selected")
+    return ranges, dpi, max_pixels
+
+def pdf_to_images_file(source, output_dir, name, dpi=200, fmt='jpeg'):
+    """Render every page to output_dir/name_<page>.<ext>"""
+    page_count = get_page_count(source)
+    width = len(str(page_count))
+    outputs = []
+    for index in range(page_count):
+        output_path = os.path.join(output_dir, f"{name}_{index + 1:0{width}d}.{IMAGE_FORMATS[fmt]}")
+        with open(output_path, 'wb') as f:
+            f.write(render_page(source, index, fmt, dpi))
+        outputs.append(output_path)
+    return {
+        'outputs': outputs,
+        'output_bytes': output_size(outputs),
+        'pages': page_count
+    }
+
+def images_to_pdf_file(sources, output_path, page_size='image', fit='contain', margin=0):
+    """Combine images into output_path, one per page"""
+    images_to_pdf(sources, output_path, page_size, fit, margin)
+    return {'outputs': [output_path], 'output_bytes': os.path.getsize(output_path), 'pages': len(sources)}
+
+def word_to_pdf_file(input_path, output_dir, name):
+    """Convert a Word document to output_dir/name.pdf with headless LibreOffice
+
+    Each process gets its own LibreOffice profile, so several conversions
+    can run at once. The bot uses the long-lived pool in utils.office instead.
+    """
+    output_path = os.path.join(output_dir, f"{name}.pdf")
+    profile_dir = os.path.abspath(os.path.join(config.OFFICE_PROFILE_DIR, f"batch_{os.getpid()}"))
+
+    with tempfile.TemporaryDirectory(dir=output_dir) as work_dir:
+        process = subprocess.run(
+            [
+                config.LIBREOFFICE_BINARY,
+                '--headless',
+                f'-env:UserInstallation=file://{profile_dir}',
+                '--convert-to',
+                'pdf',
+                '--outdir',
+                work_dir,
+                input_path
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=config.LIBREOFFICE_TIMEOUT
+        )
+        converted_path = os.path.join(work_dir, os.path.splitext(os.path.basename(input_path))[0] + '.pdf')
+        if process.returncode != 0 or not os.path.exists(converted_path):
+            raise RuntimeError(process.stderr.decode(errors='replace').strip() or "LibreOffice produced no output")
+        os.replace(converted_path, output_path)
+
+    return {'outputs': [output_path], 'output_bytes': os.path.getsize(output_path)}
@@ -0,0 +1,284 @@
+"""Building PDFs from images without re-encoding them
+
+JPEGs are copied into the PDF as they are (DCTDecode) and non-interlaced
+PNGs without transparency keep their compressed pixel data (FlateDecode
+with PNG predictors), so neither is decoded and no quality is lost. Other
+images are decoded one at a time. The PDF is written straight to disk, one
+image after another, so memory follows the largest image, not the total.
+"""
+import io
+import os
+import struct
+import zlib
+from core.lazy import lazy_import
+from core.progress import progress_sink
+import config
+
+Image = lazy_import('PIL.Image')
+
+# Page sizes in points, portrait
+PAGE_SIZES = {
+    'a4': (595.28, 841.89),
+    'letter': (612.0, 792.0)
+}
+
+# EXIF orientation -> transform of the unit square that shows the image upright
+ORIENTATIONS = {
+    1: (1, 0, 0, 1, 0, 0),
+    2: (-1, 0, 0, 1, 1, 0),
+    3: (-1, 0, 0, -1, 1, 1),
+    4: (1, 0, 0, -1, 0, 1),
+    5: (0, -1, -1, 0, 1, 1),
+    6: (0, -1, 1, 0, 0, 1),
+    7: (0, 1, 1, 0, 0, 0),
+    8: (0, 1, -1, 0, 1, 0)
+}
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+def _num(value):
+    """Format a number for a PDF content stream or dictionary"""
+    return f"{value:.4f}".rstrip('0').rstrip('.') or '0'
+
+def _open(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return open(source, 'rb')
+
+class PdfStreamWriter:
+    """Writes PDF objects to a file as they are produced, then the cross-reference table"""
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}
+        self.next_id = 1
+        f.write(b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n')
+
+    def reserve(self):
+        """Allocate an object number to be written later"""
+        object_id = self.next_id
+        self.next_id += 1
+        return object_id
+
+    def write_object(self, object_id, body):
+        self.offsets[object_id] = self.f.tell()
+        self.f.write(f"{object_id} 0 obj\n{body}\nendobj\n".encode('latin-1'))
+
+    def write_stream(self, object_id, dictionary, data=None, copy=None, length=None):
+        """Write a stream object from bytes, or from a callback that copies `length` bytes"""
+        if data is not None:
+            length = len(data)
+        self.offsets[object_id] = self.f.tell()
+        self.f.write(f"{object_id} 0 obj\n<< {dictionary} /Length {length} >>\nstream\n".encode('latin-1'))
+        if data is not None:
+            self.f.write(data)
+        else:
+            copy(self.f)
+        self.f.write(b"\nendstream\nendobj\n")
+
+    def close(self, root_id):
+        xref_offset = self.f.tell()
+        count = self.next_id
+        self.f.write(f"xref\n0 {count}\n0000000000 65535 f \n".encode('latin-1'))
+        for object_id in range(1, count):
+            self.f.write(f"{self.offsets[object_id]:010d} 00000 n \n".encode('latin-1'))
+        self.f.write(
+            f"trailer\n<< /Size {count} /Root {root_id} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode('latin-1')
+        )
+
+def read_png_header(f):
+    """Return the IHDR fields, palette, whether there is transparency, and the IDAT chunks
+
+    IDAT chunks are (offset, length) pairs; their data is not read.
+    """
+    f.seek(0)
+    if f.read(8) != PNG_SIGNATURE:
+        return None
+    header = {'palette': None, 'transparency': False, 'idat': []}
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        length, kind = struct.unpack('>I4s', chunk)
+        if kind == b'IHDR':
+            width, height, depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', f.read(13))
+            header.update(width=width, height=height, depth=depth, color_type=color_type, interlace=interlace)
+            f.seek(4, os.SEEK_CUR)
+        elif kind == b'PLTE':
+            header['palette'] = f.read(length)
+            f.seek(4, os.SEEK_CUR)
+        elif kind == b'IDAT':
+            header['idat'].append((f.tell(), length))
+            f.seek(length + 4, os.SEEK_CUR)
+        elif kind == b'IEND':
+            return header
+        else:
+            if kind == b'tRNS':
+                header['transparency'] = True
+            f.seek(length + 4, os.SEEK_CUR)
+
+def _copy_ranges(src, ranges):
+    """A stream copy callback writing the given (offset, length) ranges of src in order"""
+    def copy(dst):
+        for offset, length in ranges:
+            src.seek(offset)
+            remaining = length
+            while remaining:
+                block = src.read(min(config.CHUNK_SIZE, remaining))
+                if not block:
+                    raise ValueError("Image file is truncated")
+                dst.write(block)
+                remaining -= len(block)
+    return copy
+
+def write_image(writer, f, img):
+    """Write one image as an XObject (plus a soft mask if needed) and return its object id
+
+    img is the lazily opened PIL image; only images that cannot be passed
+    through have their pixels decoded.
+    """
+    image_id = writer.reserve()
+    width, height = img.size
+
+    if img.format == 'JPEG' and img.mode in ('L', 'RGB', 'CMYK') and getattr(img, 'bits', 8) == 8:
+        color_space = {'L': '/DeviceGray', 'RGB': '/DeviceRGB', 'CMYK': '/DeviceCMYK'}[img.mode]
+        # Adobe applications store CMYK JPEGs inverted
+        decode = ' /Decode [1 0 1 0 1 0 1 0]' if img.mode == 'CMYK' and 'adobe' in img.info else ''
+        size = f.seek(0, os.SEEK_END)
+        writer.write_stream(
+            image_id,
+            f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /DCTDecode{decode}",
+            copy=_copy_ranges(f, [(0, size)]), length=size
+        )
+        return image_id
+
+    png = read_png_header(f) if img.format == 'PNG' else None
+    if png and not png['interlace'] and not png['transparency'] and png['color_type'] in (0, 2, 3):
+        colors = 3 if png['color_type'] == 2 else 1
+        if png['color_type'] == 3:
+            entries = len(png['palette']) // 3
+            color_space = f"[/Indexed /DeviceRGB {entries - 1} <{png['palette'][:entries * 3].hex()}>]"
+        else:
+            color_space = '/DeviceRGB' if colors == 3 else '/DeviceGray'
+        writer.write_stream(
+            image_id,
+            f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace {color_space} /BitsPerComponent {png['depth']} /Filter /FlateDecode "
+            f"/DecodeParms << /Predictor 15 /Colors {colors} /BitsPerComponent {png['depth']} /Columns {width} >>",
+            copy=_copy_ranges(f, png['idat']), length=sum(length for _, length in png['idat'])
+        )
+        return image_id
+
+    # Anything else is decoded; transparency becomes a soft mask
+    has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+    if img.mode in ('L', 'LA', '1', 'I', 'I;16', 'F') or (img.mode == 'P' and img.palette.mode == 'L'):
+        base = 'L'
+    elif img.mode == 'CMYK' and not has_alpha:
+        base = 'CMYK'
+    else:
+        base = 'RGB'
+
+    smask = ''
+    if has_alpha:
+        rgba = img.convert('LA' if base == 'L' else 'RGBA')
+        alpha = rgba.getchannel('A')
+        mask_id = writer.reserve()
+        writer.write_stream(
+            mask_id,
+            f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode",
+            data=zlib.compress(alpha.tobytes(), 6)
+        )
+        smask = f" /SMask {mask_id} 0 R"
+        pixels = rgba.convert(base)
+    else:
+        pixels = img.convert(base) if img.mode != base else img
+
+    color_space = {'L': '/DeviceGray', 'RGB': '/DeviceRGB', 'CMYK': '/DeviceCMYK'}[base]
+    writer.write_stream(
+        image_id,
+        f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+        f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /FlateDecode{smask}",
+        data=zlib.compress(pixels.tobytes(), 6)
+    )
+    return image_id
+
+def image_dpi(img):
+    """Resolution stored in the image, or 72 if there is none (or it is implausible)"""
+    dpi = img.info.get('dpi', (72, 72))[0]
+    return dpi if 10 <= dpi <= 2400 else 72
+
+def page_layout(width, height, dpi, page_size, fit, margin):
+    """Return the page size and the (x, y, w, h) box the upright image is drawn in"""
+    image_w, image_h = width * 72 / dpi, height * 72 / dpi
+    if page_size == 'image':
+        return (image_w + 2 * margin, image_h + 2 * margin), (margin, margin, image_w, image_h)
+
+    page_w, page_h = PAGE_SIZES[page_size]
+    # Landscape images get landscape pages
+    if image_w > image_h:
+        page_w, page_h = page_h, page_w
+    box_w, box_h = page_w - 2 * margin, page_h - 2 * margin
+    if fit == 'stretch':
+        return (page_w, page_h), (margin, margin, box_w, box_h)
+
+    choose = max if fit == 'cover' else min
+    scale = choose(box_w / image_w, box_h / image_h)
+    w, h = image_w * scale, image_h * scale
+    return (page_w, page_h), ((page_w - w) / 2, (page_h - h) / 2, w, h)
+
+def images_to_pdf(sources, output_path, page_size='image', fit='contain', margin=0, progress_path=None):
+    """Combine images into one PDF, one image per page
+
+    page_size is 'image' (each page the size of its image at the image's
+    resolution), 'a4' or 'letter'. On fixed page sizes fit is 'contain'
+    (whole image, centred), 'cover' (fills the page, edges cropped) or
+    'stretch'. margin is in points. EXIF orientation is applied when the
+    image is placed, without touching its pixels.
+    """
+    if page_size != 'image' and page_size not in PAGE_SIZES:
+        raise ValueError(f"Unknown page size: {page_size}")
+    if fit not in ('contain', 'cover', 'stretch'):
+        raise ValueError(f"Unknown fit: {fit}")
+
+    report = progress_sink(progress_path)
+    with open(output_path, 'wb') as out:
+        writer = PdfStreamWriter(out)
+        catalog_id = writer.reserve()
+        pages_id = writer.reserve()
+        page_ids = []
+
+        for index, source in enumerate(sources, 1):
+            with _open(source) as f, Image.open(f) as img:
+                orientation = img.getexif().get(0x0112, 1)
+                a, b, c, d, e, f_ = ORIENTATIONS.get(orientation, ORIENTATIONS[1])
+                width, height = img.size
+                if orientation in (5, 6, 7, 8):
+                    width, height = height, width
+                (page_w, page_h), (x, y, w, h) = page_layout(
+                    width, height, image_dpi(img), page_size, fit, margin
+                )
+                image_id = write_image(writer, f, img)
+
+            # Unit square -> upright orientation -> placement box
+            matrix = ' '.join(_num(v) for v in (a * w, b * h, c * w, d * h, e * w + x, f_ * h + y))
+            clip = ''
+            if fit == 'cover' and page_size != 'image':
+                clip = f"{_num(margin)} {_num(margin)} {_num(page_w - 2 * margin)} {_num(page_h - 2 * margin)} re W n "
+            content_id = writer.reserve()
+            writer.write_stream(content_id, '', data=f"q {clip}{matrix} cm /Im0 Do Q".encode('latin-1'))
+
+            page_id = writer.reserve()
+            writer.write_object(
+                page_id,
+                f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 {_num(page_w)} {_num(page_h)}] "
+                f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+            )
+            page_ids.append(page_id)
+            report(index, len(sources), "Images added")
+
+        kids = ' '.join(f"{page_id} 0 R" for page_id in page_ids)
+        writer.write_object(pages_id, f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>")
+        writer.write_object(catalog_id, f"<< /Type /Catalog /Pages {pages_id} 0 R >>")
+        writer.close(catalog_id)
@@ -0,0 +1,37 @@
+"""Opening inputs and small file helpers shared by the core operations"""
+import io
+import os
+import shutil
+from core.lazy import lazy_import
+import config
+
+fitz = lazy_import('fitz')  # PyMuPDF
+
+def as_stream(source):
+    """Turn a source (a path or bytes) into something PDF libraries can open"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return source
+
+def open_fitz(source):
+    """Open a PDF with PyMuPDF from a path or from bytes"""
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype='pdf')
+    return fitz.open(source)
+
+def get_page_count(source):
+    """Return the number of pages in a PDF"""
+    with open_fitz(source) as doc:
+        return doc.page_count
+
+def join_files(paths, output_path):
+    """Concatenate files in order into output_path, removing the parts"""
+    with open(output_path, 'wb') as out:
+        for path in paths:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, out, config.CHUNK_SIZE)
+            os.remove(path)
+
+def output_size(paths):
+    """Total size in bytes of the files an operation wrote"""
+    return sum(os.path.getsize(path) for path in paths)
@@ -0,0 +1,43 @@
+"""Deferred imports for the heavy PDF libraries
+
+PyMuPDF, pikepdf, pdfplumber, pdf2docx, PyPDF2 and Pillow together take
+most of a cold start. Modules bind them with lazy_import() and the real
+import happens the first time an attribute is used, which for most of them
+is inside a worker process.
+"""
+import importlib
+import sys
+import time
+import types
+
+# Seconds spent on the first import of each module in this process
+import_seconds = {}
+
+def load(name):
+    """Import a module now, recording how long the first import took"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    import_seconds[name] = time.perf_counter() - start
+    return module
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module until one of its attributes is used"""
+
+    def __getattr__(self, attr):
+        module = load(self.__name__)
+        # Later lookups find the attributes directly and skip this method
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+def lazy_import(name):
+    """Return a module that is only imported when first used"""
+    return sys.modules.get(name) or LazyModule(name)
+
+def preload(names):
+    """Import modules ahead of use; return the seconds each first import took"""
+    for name in names:
+        load(name)
+    return {name: import_seconds.get(name, 0.0) for name in names}
@@ -0,0 +1,165 @@
+"""Merging PDFs, storing images and fonts that repeat across inputs once"""
+import hashlib
+import logging
+import os
+from core.io import as_stream
+from core.lazy import lazy_import
+from core.progress import progress_sink
+import config
+
+pikepdf = lazy_import('pikepdf')
+PyPDF2 = lazy_import('PyPDF2')
+
+logger = logging.getLogger(__name__)
+
+def merge_pdfs(sources, output_path, progress_path=None):
+    """Combine PDFs into a single file, in order
+    
+    Uses the pikepdf engine, falling back to PyPDF2 if it fails.
+    Returns the number of duplicate streams that were shared.
+    """
+    if config.MERGE_ENGINE == 'pikepdf':
+        try:
+            return merge_pdfs_pikepdf(sources, output_path, progress_path)
+        except Exception as e:
+            logger.warning(f"pikepdf merge failed, falling back to PyPDF2: {e}")
+    
+    merge_pdfs_pypdf2(sources, output_path, progress_path)
+    return 0
+
+def merge_pdfs_pikepdf(sources, output_path, progress_path=None):
+    """Append pages by object reference and store repeated streams once
+    
+    Inputs stay open while saving, so qpdf copies stream data straight
+    from them instead of holding every page in memory.
+    """
+    report = progress_sink(progress_path)
+    inputs = []
+    try:
+        with pikepdf.new() as merged:
+            for i, source in enumerate(sources, 1):
+                pdf = pikepdf.open(as_stream(source))
+                inputs.append(pdf)
+                merged.pages.extend(pdf.pages)
+                report(i, len(sources), "Files added")
+            
+            report(0, 0, "Removing duplicate images and fonts")
+            shared = deduplicate_streams(merged)
+            report(0, 0, "Saving")
+            merged.save(
+                output_path,
+                compress_streams=True,
+                object_stream_mode=pikepdf.ObjectStreamMode.generate
+            )
+            return shared
+    finally:
+        for pdf in inputs:
+            pdf.close()
+
+def deduplicate_streams(pdf):
+    """Point identical images, forms and embedded fonts at a single copy
+    
+    Streams are compared by a hash of their raw (still compressed) data and
+    their dictionary. Returns how many references were redirected.
+    """
+    seen = {}
+    visited = set()
+    key_cache = {}
+    shared = 0
+    
+    for page in pdf.pages:
+        resources = page.obj.get('/Resources')
+        if resources is not None:
+            shared += _deduplicate_resources(resources, seen, visited, key_cache)
+    
+    return shared
+
+def _stream_key(stream, cache):
+    """Hash a stream's raw data and dictionary, including streams it refers to"""
+    objgen = stream.objgen
+    if objgen in cache:
+        return cache[objgen]
+    
+    digest = hashlib.sha256(stream.read_raw_bytes())
+    for name in sorted(stream.keys()):
+        if name == '/Length':
+            continue
+        value = stream[name]
+        digest.update(name.encode())
+        if isinstance(value, pikepdf.Stream):
+            digest.update(_stream_key(value, cache).encode())
+        else:
+            try:
+                digest.update(value.unparse(resolved=True))
+            except Exception:
+                digest.update(repr(value).encode())
+    
+    key = digest.hexdigest()
+    cache[objgen] = key
+    return key
+
+def _share(container, name, seen, key_cache):
+    """Replace container[name] with an identical stream seen earlier"""
+    stream = container[name]
+    if not isinstance(stream, pikepdf.Stream):
+        return 0
+    
+    key = _stream_key(stream, key_cache)
+    original = seen.setdefault(key, stream)
+    if original.objgen == stream.objgen:
+        return 0
+    container[name] = original
+    return 1
+
+def _deduplicate_resources(resources, seen, visited, key_cache):
+    if resources.is_indirect:
+        if resources.objgen in visited:
+            return 0
+        visited.add(resources.objgen)
+    
+    shared = 0
+    
+    xobjects = resources.get('/XObject')
+    if xobjects is not None:
+        for name in list(xobjects.keys()):
+            shared += _share(xobjects, name, seen, key_cache)
+            xobject = xobjects[name]
+            # Forms carry their own resources
+            nested = xobject.get('/Resources') if isinstance(xobject, pikepdf.Stream) else None
+            if nested is not None:
+                shared += _deduplicate_resources(nested, seen, visited, key_cache)
+    
+    fonts = resources.get('/Font')
+    if fonts is not None:
+        for name in list(fonts.keys()):
+            font = fonts[name]
+            descendants = font.get('/DescendantFonts')
+            for font_dict in [font] + (list(descendants) if descendants is not None else []):
+                descriptor = font_dict.get('/FontDescriptor')
+                if descriptor is None:
+                    continue
+                for file_key in ('/FontFile', '/FontFile2', '/FontFile3'):
+                    if file_key in descriptor:
+                        shared += _share(descriptor, file_key, seen, key_cache)
+    
+    return shared
+
+def merge_pdfs_pypdf2(sources, output_path, progress_path=None):
+    """Combine PDFs with PyPDF2, copying every page into one writer"""
+    report = progress_sink(progress_path)
+    writer = PyPDF2.PdfWriter()
+    
+    for i, source in enumerate(sources, 1):
+        reader = PyPDF2.PdfReader(as_stream(source))
+        for page in reader.pages:
+            writer.add_page(page)
+        report(i, len(sources), "Files added")
+    
+    report(0, 0, "Saving")
+    with open(output_path, 'wb') as output_file:
+        writer.write(output_file)
+
+def merge_files(sources, output_path, progress_path=None):
+    """Merge PDFs in order into output_path"""
+    shared = merge_pdfs(sources, output_path, progress_path)
+    return {'outputs': [output_path], 'output_bytes': os.path.getsize(output_path), 'shared_streams': shared}
@@ -0,0 +1,67 @@
+"""Several operations on one PDF in a single pass
+
+The document is opened once (with its password, if the pipeline removes
+it), every step edits the same pikepdf document in memory, and it is
+saved once at the end with the settings the steps asked for. Steps always
+run in STEPS order, whatever order they were chosen in.
+"""
+from core.compress import pikepdf_save_options
+from core.io import as_stream
+from core.lazy import lazy_import
+from core.progress import progress_sink
+from core.security import encryption, WrongPassword
+from core.split import keep_pages, parse_page_ranges
+
+pikepdf = lazy_import('pikepdf')
+
+STEPS = ('decrypt', 'pages', 'compress', 'encrypt')
+
+STEP_LABELS = {
+    'decrypt': "Removing password",
+    'pages': "Selecting pages",
+    'compress': "Compressing",
+    'encrypt': "Adding password"
+}
+
+def run_pipeline(source, output_path, steps, progress_path=None):
+    """Apply steps ({name: options}) to a PDF and save the result once
+
+    Options: decrypt {'password'}, pages {'spec': '1-5, 8'}, compress
+    {'level'}, encrypt {'password'}. Raises WrongPassword if the
+    PDF is encrypted and no right decrypt password was given, and
+    ValueError if the page selection matches no page. Returns the page
+    count of the output.
+    """
+    unknown = set(steps) - set(STEPS)
+    if unknown:
+        raise ValueError(f"Unknown pipeline steps: {', '.join(sorted(unknown))}")
+
+    report = progress_sink(progress_path)
+    chosen = [name for name in STEPS if name in steps]
+    password = steps.get('decrypt', {}).get('password', '')
+    save_options = {}
+
+    try:
+        pdf = pikepdf.open(as_stream(source), password=password)
+    except pikepdf.PasswordError:
+        raise WrongPassword() from None
+
+    with pdf:
+        for index, name in enumerate(chosen):
+            report(index, len(chosen) + 1, STEP_LABELS[name])
+            options = steps[name]
+            if name == 'pages':
+                ranges = parse_page_ranges(options['spec'], len(pdf.pages))
+                if not ranges:
+                    raise ValueError("No valid pages selected")
+                keep_pages(pdf, ranges)
+            elif name == 'compress':
+                pdf.remove_unreferenced_resources()
+                save_options.update(pikepdf_save_options(options.get('level', 'medium')))
+            elif name == 'encrypt':
+                save_options['encryption'] = encryption(options['password'])
+
+        report(len(chosen), len(chosen) + 1, "Saving")
+        # Without an encrypt step the output is saved unencrypted
+        pdf.save(output_path, **save_options)
+        return len(pdf.pages)
@@ -0,0 +1,38 @@
+"""Progress reporting from inside long operations
+
+Operations run in worker processes, so they report through a small file
+that the caller polls (see utils.progress.Progress.track).
+"""
+import json
+import os
+import time
+
+class ProgressFile:
+    """Worker-side progress sink that the event loop polls
+
+    Writes are throttled and atomic, so the reader never sees a partial file.
+    """
+
+    def __init__(self, path, min_interval=0.5):
+        self.path = path
+        self.min_interval = min_interval
+        self.last_write = 0
+        self.last_phase = None
+
+    def report(self, done, total, phase=None):
+        now = time.monotonic()
+        if now - self.last_write < self.min_interval and done < total and phase == self.last_phase:
+            return
+        self.last_write = now
+        self.last_phase = phase
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump([done, total, phase], f)
+        os.replace(temp_path, self.path)
+
+def progress_sink(path):
+    """A ProgressFile for path, or a no-op reporter when progress is not wanted"""
+    if path is None:
+        return lambda done, total, phase=None: None
+    return ProgressFile(path).report
@@ -0,0 +1,57 @@
+"""Password protection: AES-256 encryption and decryption"""
+import os
+from core.io import as_stream
+from core.lazy import lazy_import
+
+pikepdf = lazy_import('pikepdf')
+
+class WrongPassword(Exception):
+    """The PDF is encrypted and the password is missing or wrong
+
+    Raised in place of pikepdf.PasswordError, so callers can catch it
+    without importing pikepdf.
+    """
+
+def encryption(password):
+    """pikepdf save settings for AES-256 encryption with the given password"""
+    return pikepdf.Encryption(
+        owner=password,
+        user=password,
+        R=6,  # AES-256 encryption
+        allow=pikepdf.Permissions(
+            accessibility=True,
+            extract=False,
+            modify_annotation=False,
+            modify_assembly=False,
+            modify_form=False,
+            modify_other=False,
+            print_lowres=False,
+            print_highres=False
+        )
+    )
+
+def encrypt_pdf(source, output_path, password):
+    """Save an AES-256 encrypted copy of a PDF"""
+    with pikepdf.open(as_stream(source)) as pdf:
+        pdf.save(output_path, encryption=encryption(password))
+
+def decrypt_pdf(source, output_path, password):
+    """Save an unencrypted copy of a password-protected PDF; raises WrongPassword"""
+    try:
+        pdf = pikepdf.open(as_stream(source), password=password)
+    except pikepdf.PasswordError:
+        raise WrongPassword() from None
+    with pdf:
+        pdf.save(output_path)
+
+def encrypt_file(source, output_dir, name, password):
+    """Encrypt one PDF into output_dir/name.pdf"""
+    output_path = os.path.join(output_dir, f"{name}.pdf")
+    encrypt_pdf(source, output_path, password)
+    return {'outputs': [output_path], 'output_bytes': os.path.getsize(output_path)}
+
+def decrypt_file(source, output_dir, name, password):
+    """Decrypt one PDF into output_dir/name.pdf; raises WrongPassword on a wrong password"""
+    output_path = os.path.join(output_dir, f"{name}.pdf")
+    decrypt_pdf(source, output_path, password)
+    return {'outputs': [output_path], 'output_bytes': os.path.getsize(output_path)}
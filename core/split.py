@@ -0,0 +1,233 @@
+"""Splitting PDFs into parts by pages, fixed-size chunks, bookmarks or file size
+
+Page ranges are 1-based (start, end) tuples and are never expanded page by
+page, so very large documents and ranges stay cheap to plan.
+"""
+import math
+import os
+import re
+from core.io import as_stream, open_fitz, output_size
+from core.lazy import lazy_import
+import config
+
+pikepdf = lazy_import('pikepdf')
+
+def plan_parts(mode, user_input, split_info):
+    """Turn the user's input into a list of (label, ranges) parts"""
+    total_pages = split_info['pages']
+
+    if mode == 'extract':
+        ranges = parse_page_ranges(user_input, total_pages)
+        return [('pages', ranges)] if ranges else []
+
+    if mode == 'every':
+        size = int(user_input)
+        if size < 1:
+            return []
+        return [
+            (range_label(start, min(start + size - 1, total_pages)), [(start, min(start + size - 1, total_pages))])
+            for start in range(1, total_pages + 1, size)
+        ]
+
+    if mode == 'ranges':
+        parts = []
+        for part in user_input.split(','):
+            ranges = parse_page_ranges(part, total_pages)
+            if ranges:
+                parts.append((range_label(ranges[0][0], ranges[-1][1]), ranges))
+        return parts
+
+    if mode == 'bookmarks':
+        bookmarks = split_info['bookmarks']
+        parts = []
+        for i, (title, start) in enumerate(bookmarks):
+            start = 1 if i == 0 else start
+            end = bookmarks[i + 1][1] - 1 if i + 1 < len(bookmarks) else total_pages
+            if start <= end:
+                parts.append((safe_label(title), [(start, end)]))
+        return parts
+
+    return []
+
+def safe_label(title):
+    """Make a bookmark title usable in a filename"""
+    label = re.sub(r'[^\w\- ]+', '', title).strip().replace(' ', '_')
+    return label[:40] or 'section'
+
+def range_label(start, end):
+    return f"p{start}" if start == end else f"p{start}-{end}"
+
+def format_pages(numbers):
+    """Describe sorted 1-based page numbers compactly, e.g. '3-5, 9'"""
+    ranges = []
+    for number in numbers:
+        if ranges and ranges[-1][1] == number - 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ', '.join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+def count_range_pages(ranges):
+    return sum(end - start + 1 for start, end in ranges)
+
+def inspect_pdf(source):
+    """Read the page count and top-level bookmarks in one pass"""
+    with open_fitz(source) as doc:
+        bookmarks = []
+        for level, title, page in doc.get_toc(simple=True):
+            # Keep top-level entries in page order, one per start page
+            if level == 1 and page >= 1 and (not bookmarks or page > bookmarks[-1][1]):
+                bookmarks.append((title, page))
+        return {'pages': doc.page_count, 'bookmarks': bookmarks}
+
+def extract_pages(source, output_path, ranges):
+    """Write the given 1-based (start, end) page ranges of a PDF to a new file"""
+    with pikepdf.open(as_stream(source)) as pdf, pikepdf.new() as output:
+        for start, end in ranges:
+            output.pages.extend(pdf.pages[start - 1:end])
+        output.save(output_path, object_stream_mode=pikepdf.ObjectStreamMode.generate)
+
+def keep_pages(pdf, ranges):
+    """Remove every page of an open pikepdf document outside the 1-based ranges"""
+    keep = set()
+    for start, end in ranges:
+        keep.update(range(start - 1, end))
+    for index in reversed(range(len(pdf.pages))):
+        if index not in keep:
+            del pdf.pages[index]
+
+def plan_size_parts(source, max_bytes):
+    """Group consecutive pages into parts that stay under max_bytes
+
+    Page sizes are estimated from the raw length of the streams each page
+    uses; streams shared by several pages count once per part.
+    """
+    budget = max_bytes * config.SPLIT_SIZE_SAFETY
+    parts = []
+
+    with pikepdf.open(as_stream(source)) as pdf:
+        start = 1
+        part_streams = {}
+        for number, page in enumerate(pdf.pages, 1):
+            page_streams = {}
+            _collect_streams(page.obj, page_streams, set())
+
+            combined = dict(part_streams)
+            combined.update(page_streams)
+            if part_streams and sum(combined.values()) > budget:
+                parts.append((range_label(start, number - 1), [(start, number - 1)]))
+                start = number
+                combined = page_streams
+            part_streams = combined
+
+        parts.append((range_label(start, len(pdf.pages)), [(start, len(pdf.pages))]))
+
+    return parts
+
+def _collect_streams(obj, streams, visited, root=True):
+    """Record the raw length of every stream reachable from a page"""
+    if not isinstance(obj, pikepdf.Object):
+        return
+
+    if obj.is_indirect:
+        if obj.objgen in visited:
+            return
+        visited.add(obj.objgen)
+
+    if isinstance(obj, (pikepdf.Dictionary, pikepdf.Stream)):
+        # Links and annotations can point at other pages; their content belongs to them
+        if not root and obj.get('/Type') == pikepdf.Name.Page:
+            return
+        if isinstance(obj, pikepdf.Stream):
+            streams[obj.objgen] = int(obj.get('/Length', 0))
+        for key in obj.keys():
+            # Parent leads back to the page tree and every other page
+            if key != '/Parent':
+                _collect_streams(obj[key], streams, visited, False)
+    elif isinstance(obj, pikepdf.Array):
+        for item in obj:
+            _collect_streams(item, streams, visited, False)
+
+def parse_page_ranges(page_string, max_pages):
+    """Parse page ranges like '1-5, 8, 10-15' into sorted, merged (start, end) tuples
+
+    Ranges are clipped to the document and never expanded page by page, so
+    inputs like '1-1000000' stay cheap.
+    """
+    ranges = []
+
+    try:
+        # Split by comma
+        parts = page_string.split(',')
+
+        for part in parts:
+            part = part.strip()
+
+            # Check if it's a range
+            if '-' in part:
+                start, end = part.split('-')
+                start = int(start.strip())
+                end = int(end.strip())
+
+                if start > end:
+                    start, end = end, start
+            else:
+                # Single page
+                start = end = int(part)
+
+            # Filter valid pages
+            start, end = max(start, 1), min(end, max_pages)
+            if start <= end:
+                ranges.append((start, end))
+
+        # Merge overlapping and adjacent ranges
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        return merged
+
+    except:
+        return []
+
+def parse_size_mb(text):
+    """Maximum part size in MB from the user's reply, or None if it is not a positive number"""
+    try:
+        max_mb = float(text)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(max_mb) or max_mb <= 0:
+        return None
+    return max_mb
+
+def plan_split(source, mode, spec):
+    """Plan (label, ranges) parts for a split mode; size mode takes megabytes"""
+    if mode == 'size':
+        max_mb = parse_size_mb(spec)
+        if max_mb is None:
+            raise ValueError(f"Size must be a number of megabytes greater than 0, not {spec!r}")
+        return plan_size_parts(source, int(max_mb * 1024 * 1024))
+    return plan_parts(mode, spec, inspect_pdf(source))
+
+def split_file(source, output_dir, name, mode='every', spec='10'):
+    """Split one PDF into output_dir/name_<label>.pdf files"""
+    parts = plan_split(source, mode, spec)
+    if not parts:
+        raise ValueError(f"Nothing to split for {mode} {spec!r}")
+    if len(parts) > config.SPLIT_MAX_PARTS:
+        raise ValueError(f"{len(parts)} parts exceed the limit of {config.SPLIT_MAX_PARTS}")
+
+    outputs = []
+    for index, (label, ranges) in enumerate(parts, 1):
+        output_path = os.path.join(output_dir, f"{name}_{index:0{len(str(len(parts)))}d}_{label}.pdf")
+        extract_pages(source, output_path, ranges)
+        outputs.append(output_path)
+
+    return {
+        'outputs': outputs,
+        'output_bytes': output_size(outputs),
+        'parts': len(parts),
+        'pages': sum(count_range_pages(ranges) for _, ranges in parts)
+    }
@@ -0,0 +1,63 @@
+"""Text extraction: PyMuPDF for speed, pdfplumber when layout and tables matter
+
+Text is written to the output file page by page, so memory does not grow
+with the size of the document.
+"""
+import os
+from core.io import as_stream, open_fitz, get_page_count
+from core.lazy import lazy_import
+from core.progress import progress_sink
+
+pdfplumber = lazy_import('pdfplumber')
+
+def extract_text(source, output_path, progress_path=None):
+    """Extract text with PyMuPDF, writing each page as soon as it is read
+    
+    Returns the number of characters of page text written.
+    """
+    report = progress_sink(progress_path)
+    characters = 0
+    
+    with open_fitz(source) as doc, open(output_path, 'w', encoding='utf-8') as out:
+        for i, page in enumerate(doc, 1):
+            text = page.get_text(sort=True).strip()
+            if text:
+                out.write(f"--- Page {i} ---\n{text}\n\n")
+                characters += len(text)
+            report(i, doc.page_count, "Pages")
+    
+    return characters
+
+def extract_text_layout(source, output_path, start, end):
+    """Extract pages [start, end) with pdfplumber, keeping layout and tables"""
+    characters = 0
+    
+    with pdfplumber.open(as_stream(source), pages=list(range(start + 1, end + 1))) as pdf, \
+            open(output_path, 'w', encoding='utf-8') as out:
+        for page in pdf.pages:
+            text = (page.extract_text(layout=True) or '').rstrip()
+            tables = page.extract_tables()
+            if not text.strip() and not tables:
+                page.flush_cache()
+                continue
+            
+            out.write(f"--- Page {page.page_number} ---\n{text}\n")
+            for n, table in enumerate(tables, 1):
+                out.write(f"\n[Table {n}]\n")
+                for row in table:
+                    out.write("\t".join(cell or '' for cell in row) + "\n")
+            out.write("\n")
+            characters += len(text.strip()) + len(tables)
+            # Release the page's parsed objects before moving on
+            page.flush_cache()
+    
+    return characters
+
+def extract_text_file(source, output_dir, name, layout=False):
+    """Extract a PDF's text to output_dir/name.txt"""
+    output_path = os.path.join(output_dir, f"{name}.txt")
+    if layout:
+        characters = extract_text_layout(source, output_path, 0, get_page_count(source))
+    else:
+        characters = extract_text(source, output_path)
+    return {'outputs': [output_path], 'output_bytes': os.path.getsize(output_path), 'characters': characters}
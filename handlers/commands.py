@@ -1,5 +1,8 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from utils import profiling
+from utils.scheduler import cancel_jobs
+import config
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
@@ -19,6 +22,7 @@ I can help you with various PDF operations:
 • PDF to Images
 • Extract text from PDF
 • Images to PDF
+• Pipelines of several operations in one go
 
 **How to use:**
 Simply send me a PDF file and select the operation you want to perform!
@@ -85,9 +89,15 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
    • Choose "Images to PDF"
    • Images combined into single PDF
 
+**11. Pipeline**
+   • Send a PDF file
+   • Choose "Pipeline" and tick the steps: remove password, keep pages, compress, add password
+   • Press Run to get one file with all steps applied
+
 ⚠️ **Limits:**
 • Maximum file size: 50 MB
 • Files are automatically deleted after processing
+• Use /cancel to stop a running job or a pending prompt
 
 Need help? Contact support or report issues!
     """
@@ -95,4 +105,64 @@ Need help? Contact support or report issues!
     await update.message.reply_text(
         help_message,
         parse_mode='Markdown'
-    )
\ No newline at end of file
+    )
+
+# Per-user state of operations waiting for input
+PENDING_STATE = ('split_info', 'split_mode', 'total_pages', 'image_options')
+
+def reset_pending_state(context, user_id):
+    """Drop any pending prompt and its options; returns what was being waited for"""
+    from services.pipeline import forget_pipeline
+    
+    waiting = context.user_data.get('waiting_for')
+    context.user_data['waiting_for'] = None
+    for key in PENDING_STATE:
+        context.user_data.pop(key, None)
+    forget_pipeline(context, user_id)
+    return waiting
+
+async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /cancel: stop the user's queued and running jobs and any pending prompt"""
+    cancelled = cancel_jobs(update.effective_user.id)
+    waiting = reset_pending_state(context, update.effective_user.id)
+    
+    if cancelled:
+        await update.message.reply_text(
+            f"⏹ Cancelled {cancelled} job(s).\n"
+            "Your files are still here; choose another operation or send a new file."
+        )
+    elif waiting:
+        await update.message.reply_text("Operation cancelled.")
+    else:
+        await update.message.reply_text("Nothing to cancel.")
+
+async def cancel_job_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle a status message's Cancel button: stop the job it belongs to"""
+    query = update.callback_query
+    if cancel_jobs(update.effective_user.id, query.message.message_id):
+        reset_pending_state(context, update.effective_user.id)
+    else:
+        await query.edit_message_reply_markup(reply_markup=None)
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /profile N (admin only): profile the worker code of the next N jobs"""
+    if not config.ADMIN_USER_ID or update.effective_user.id != config.ADMIN_USER_ID:
+        await update.message.reply_text("❌ This command is only available to the bot admin.")
+        return
+    
+    try:
+        count = int(context.args[0]) if context.args else 1
+    except ValueError:
+        await update.message.reply_text("Usage: /profile <number of jobs>, or /profile 0 to stop")
+        return
+    
+    profiling.enable(count)
+    
+    if count <= 0:
+        await update.message.reply_text("🔬 Profiling switched off.")
+    else:
+        await update.message.reply_text(
+            f"🔬 Profiling the next {count} job(s).\n"
+            "A report will be sent here as each one finishes.\n"
+            "Work in processes killed by a time limit or a stop is not included."
+        )
@@ -1,6 +1,9 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils.file_utils import generate_unique_filename, get_temp_path, validate_file_size, validate_pdf
+import time
+from utils.file_utils import acquire_shared_input, check_quota
+from utils.scheduler import scheduler
+from utils.metrics import observe_phase, record_operation
 import config
 
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -10,12 +13,14 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         document = update.message.document
         file_name = document.file_name
         file_id = document.file_id
+        file_unique_id = document.file_unique_id
         file_size = document.file_size
         file_extension = file_name.split('.')[-1].lower()
     elif update.message.photo:
         # get the large photo size
         photo = update.message.photo[-1]
         file_id = photo.file_id
+        file_unique_id = photo.file_unique_id
         file_size = photo.file_size if photo.file_size else 0
         file_name = f"photo_{file_id[:10]}.jpg"
         file_extension = 'jpg'
@@ -46,6 +51,12 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
     
+    # Check disk quotas
+    quota_error = check_quota(context.user_data.get('files', []), file_size or 0)
+    if quota_error:
+        await update.message.reply_text(f"❌ {quota_error}")
+        return
+    
     # Download file
     status_msg = await update.message.reply_text(
         f"⏳ Downloading {file_name}...\n"
@@ -54,11 +65,16 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     try:
-        file = await context.bot.get_file(file_id)
-        temp_filename = generate_unique_filename(f'.{file_extension}')
-        temp_path = get_temp_path(temp_filename)
-        
-        await file.download_to_drive(temp_path)
+        # Identical uploads share one local copy; small ones stay in memory
+        async with scheduler.slot(update.effective_user.id, 'network'):
+            with observe_phase('download', 'download', input_bytes=file_size, file_type=file_extension):
+                temp_path, reused = await acquire_shared_input(
+                    file_unique_id,
+                    f'.{file_extension}',
+                    lambda: context.bot.get_file(file_id),
+                    file_size or 0
+                )
+        record_operation('download', 'reused' if reused else 'success', 0 if reused else file_size or 0)
         
         # Store file info in context
         if 'files' not in context.user_data:
@@ -67,7 +83,9 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data['files'].append({
             'path': temp_path,
             'name': file_name,
-            'type': file_extension
+            'type': file_extension,
+            'unique_id': file_unique_id,
+            'uploaded_at': time.time()
         })
         
         await status_msg.edit_text("✅ File downloaded successfully!")
@@ -76,6 +94,7 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await show_operations_menu(update, context, file_extension)
         
     except Exception as e:
+        record_operation('download', 'error')
         await status_msg.edit_text(f"❌ Error downloading file: {str(e)}")
 
 async def show_operations_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, file_type: str):
@@ -102,7 +121,8 @@ async def show_operations_menu(update: Update, context: ContextTypes.DEFAULT_TYP
                 InlineKeyboardButton("🖼 To Images", callback_data="pdf_to_images")
             ],
             [
-                InlineKeyboardButton("📋 Extract Text", callback_data="extract_text")
+                InlineKeyboardButton("📋 Extract Text", callback_data="extract_text"),
+                InlineKeyboardButton("⛓ Pipeline", callback_data="pipeline")
             ]
         ]
     elif file_type == 'docx':
@@ -124,7 +144,6 @@ async def show_operations_menu(update: Update, context: ContextTypes.DEFAULT_TYP
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle button callbacks"""
     query = update.callback_query
-    await query.answer()
     
     operation = query.data
     
@@ -149,23 +168,58 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         from services.merge import start_merge
         await start_merge(update, context)
     
+    elif operation == "pipeline":
+        from services.pipeline import start_pipeline
+        await start_pipeline(update, context)
+    
+    elif operation.startswith("pipeline_toggle_"):
+        from services.pipeline import toggle_pipeline_step
+        await toggle_pipeline_step(update, context)
+    
+    elif operation == "pipeline_run":
+        from services.pipeline import run_pipeline_job
+        await run_pipeline_job(update, context)
+    
+    elif operation == "pipeline_cancel":
+        from services.pipeline import cancel_pipeline
+        await cancel_pipeline(update, context)
+    
+    elif operation == "cancel_merge":
+        await query.edit_message_text("Merge cancelled. Send more PDFs or choose another operation.")
+    
     elif operation == "pdf_to_word":
         from services.convert import convert_pdf_to_word
         await convert_pdf_to_word(update, context)
     
+    elif operation == "stop_pdf_to_word":
+        from services.convert import stop_pdf_to_word
+        await stop_pdf_to_word(update, context)
+    
     elif operation == "word_to_pdf":
         from services.convert import convert_word_to_pdf
         await convert_word_to_pdf(update, context)
     
     elif operation == "pdf_to_images":
-        from services.convert import convert_pdf_to_images
-        await convert_pdf_to_images(update, context)
+        from services.convert import start_pdf_to_images
+        await start_pdf_to_images(update, context)
+    
+    elif operation == "images_album" or operation.startswith("images_zip_"):
+        from services.convert import handle_image_delivery
+        await handle_image_delivery(update, context)
     
     elif operation == "images_to_pdf":
+        from services.convert import start_images_to_pdf
+        await start_images_to_pdf(update, context)
+    
+    elif operation.startswith("images_pdf_"):
         from services.convert import convert_images_to_pdf
         await convert_images_to_pdf(update, context)
     
     elif operation == "extract_text":
+        from services.convert import start_text_extraction
+        await start_text_extraction(update, context)
+    
+    elif operation in ("extract_text_fast", "extract_text_layout"):
         from services.convert import extract_text_from_pdf
         await extract_text_from_pdf(update, context)
     
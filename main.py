@@ -1,16 +1,34 @@
+import time
+_started = time.perf_counter()
+
+import hmac
 import logging
+import signal
+from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ConversationHandler
 import config
 from aiohttp import web
 import asyncio
 
-from handlers.commands import start_command, help_command
+from handlers.commands import start_command, help_command, profile_command, cancel_command, cancel_job_callback
 from handlers.file_handler import handle_document, handle_callback
-from services.encrypt import handle_encryption_password, cancel_operation, WAITING_FOR_PASSWORD
+from services.encrypt import handle_encryption_password
 from services.decrypt import handle_decryption_password
-from services.split import handle_split_pages
+from services.split import handle_split_pages, handle_split_mode
 from services.compress import handle_compression_level
 from services.merge import confirm_merge
+from services.convert import handle_image_pages
+from services.pipeline import handle_pipeline_input
+from utils.workers import shutdown_executor
+from utils.office import office_pool
+from utils.scheduler import run_job
+from utils.file_utils import cleanup_orphans, run_storage_janitor, run_temp_usage_monitor
+from utils.metrics import metrics_handler, monitor_event_loop
+from utils.persistence import build_persistence
+from utils.startup import record_startup, prewarm_workers
+
+# Heavy PDF libraries are imported lazily, in the workers that use them
+IMPORT_SECONDS = time.perf_counter() - _started
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -18,6 +36,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+# The bot application, shared with the webhook route
+APPLICATION_KEY = web.AppKey('application', Application)
+
+# Scheduler resource class for callbacks that start heavy work
+CALLBACK_RESOURCES = {
+    'pdf_to_word': 'cpu',
+    'pipeline_run': 'cpu',
+    'images_pdf_image': 'cpu',
+    'images_pdf_a4': 'cpu',
+    'images_pdf_letter': 'cpu',
+    'extract_text_fast': 'cpu',
+    'extract_text_layout': 'cpu',
+    'word_to_pdf': 'office'
+}
+
 async def handle_text_messages(update, context):
     """Route text messages based on context"""
     
@@ -31,27 +66,44 @@ async def handle_text_messages(update, context):
     waiting_for = context.user_data.get('waiting_for')
     
     if waiting_for == 'encrypt_password':
-        await handle_encryption_password(update, context)
+        await run_job(update, context, 'light', handle_encryption_password)
     elif waiting_for == 'decrypt_password':
-        await handle_decryption_password(update, context)
+        await run_job(update, context, 'light', handle_decryption_password)
     elif waiting_for == 'split_pages':
-        await handle_split_pages(update, context)
+        await run_job(update, context, 'cpu', handle_split_pages)
+    elif waiting_for == 'image_pages':
+        await run_job(update, context, 'cpu', handle_image_pages)
+    elif waiting_for == 'pipeline_input':
+        await run_job(update, context, 'light', handle_pipeline_input)
     elif waiting_for == 'rename_input':  
         from services.rename import handle_rename_input
-        await handle_rename_input(update, context)
+        await run_job(update, context, 'light', handle_rename_input)
     else:
         await update.message.reply_text("Please upload a file first.")
 
 async def handle_all_callbacks(update, context):
     """Handle all callback queries"""
     query = update.callback_query
+    # Answer right away so the button stops spinning even if the job is queued
+    await query.answer()
     
+    # Cancel buttons act at once, never queued behind the jobs they cancel
+    if query.data == 'cancel_job':
+        await cancel_job_callback(update, context)
      # Handle compression level callbacks
-    if query.data.startswith('compress_'):
-        await handle_compression_level(update, context)
+    elif query.data.startswith('compress_'):
+        await run_job(update, context, 'cpu', handle_compression_level)
+    # Handle split mode selection; bookmark splits start right away
+    elif query.data == 'split_mode_bookmarks':
+        await run_job(update, context, 'cpu', handle_split_mode)
+    elif query.data.startswith('split_mode_'):
+        await handle_split_mode(update, context)
     # Handle merge confirmation
     elif query.data == 'confirm_merge':
-        await confirm_merge(update, context)
+        await run_job(update, context, 'cpu', confirm_merge)
+    # Heavy operations wait for a slot in their resource class
+    elif query.data in CALLBACK_RESOURCES:
+        await run_job(update, context, CALLBACK_RESOURCES[query.data], handle_callback)
     # Handle general callbacks
     else:
         await handle_callback(update, context)
@@ -61,18 +113,94 @@ async def health_check(request):
     """Health check endpoint to keep service alive"""
     return web.Response(text="Bot is running!")
 
-async def start_web_server():
-    """Start web server for health checks"""
+async def telegram_webhook(request):
+    """Receive an update from Telegram and queue it for the bot"""
+    secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not hmac.compare_digest(secret.encode(), config.WEBHOOK_SECRET.encode()):
+        return web.Response(status=403)
+    try:
+        data = await request.json()
+    except ValueError:
+        return web.Response(status=400)
+
+    application = request.app[APPLICATION_KEY]
+    await application.update_queue.put(Update.de_json(data, application.bot))
+    return web.Response()
+
+async def start_web_server(application):
+    """Start web server for health checks, metrics and the webhook"""
     app = web.Application()
+    app[APPLICATION_KEY] = application
     app.router.add_get('/', health_check)
+    app.router.add_get('/metrics', metrics_handler)
+    if config.BOT_MODE == 'webhook':
+        app.router.add_post(config.WEBHOOK_PATH, telegram_webhook)
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', 8080)
+    site = web.TCPSite(runner, '0.0.0.0', config.WEB_PORT)
     await site.start()
-    logger.info("Web server started on port 8080")
+    logger.info(f"Web server started on port {config.WEB_PORT}")
+    return runner
+
+# Long-running maintenance tasks, cancelled on shutdown
+background_tasks = []
+
+async def on_startup(application):
+    """Start background maintenance once the bot is initialised"""
+    background_tasks.append(asyncio.create_task(run_storage_janitor(application)))
+    background_tasks.append(asyncio.create_task(run_temp_usage_monitor()))
+    background_tasks.append(asyncio.create_task(monitor_event_loop()))
+
+async def on_shutdown(application):
+    """Release background resources when the bot stops"""
+    for task in background_tasks:
+        task.cancel()
+    await office_pool.stop()
+    shutdown_executor()
+
+async def run(application):
+    """Run the bot and the web server on one event loop until a stop signal"""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await application.initialize()
+    await on_startup(application)
+    await application.start()
+    runner = await start_web_server(application)
+    try:
+        if config.BOT_MODE == 'webhook':
+            # Not removed on shutdown: other replicas keep serving the same URL
+            await application.bot.set_webhook(
+                url=config.WEBHOOK_URL.rstrip('/') + config.WEBHOOK_PATH,
+                secret_token=config.WEBHOOK_SECRET,
+                allowed_updates=ALLOWED_UPDATES,
+                max_connections=config.WEBHOOK_MAX_CONNECTIONS
+            )
+            logger.info(f"Receiving updates by webhook at {config.WEBHOOK_PATH}")
+        else:
+            await application.updater.start_polling(allowed_updates=ALLOWED_UPDATES)
+            logger.info("Receiving updates by polling")
+        record_startup(IMPORT_SECONDS, time.perf_counter() - _started)
+        background_tasks.append(asyncio.create_task(prewarm_workers()))
+        await stop.wait()
+    finally:
+        logger.info("Bot is stopping...")
+        await runner.cleanup()
+        if application.updater.running:
+            await application.updater.stop()
+        await application.stop()
+        await on_shutdown(application)
+        await application.shutdown()
 
 def main():
     """Start the bot"""
+    if config.BOT_MODE not in ('polling', 'webhook'):
+        raise SystemExit(f"BOT_MODE must be 'polling' or 'webhook', not {config.BOT_MODE!r}")
+    if config.BOT_MODE == 'webhook' and not config.WEBHOOK_URL:
+        raise SystemExit("BOT_MODE=webhook needs WEBHOOK_URL, the bot's public base URL")
+
     application = (
         Application.builder()
         .token(config.BOT_TOKEN)
@@ -81,12 +209,15 @@ def main():
         .write_timeout(30.0)
         .pool_timeout(30.0)
         .concurrent_updates(True)
+        .persistence(build_persistence())
         .build()
     )
     
     
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    application.add_handler(CommandHandler("cancel", cancel_command))
     
     
     application.add_handler(MessageHandler(
@@ -106,11 +237,11 @@ def main():
     
     logger.info("Bot is starting...")
     
-    # Run both web server and bot
-    loop = asyncio.get_event_loop()
-    loop.create_task(start_web_server())
+    removed = cleanup_orphans()
+    if removed:
+        logger.info(f"Removed {removed} orphaned temp entries")
     
-    application.run_polling(allowed_updates=["message", "callback_query"])
+    asyncio.run(run(application))
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
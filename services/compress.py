@@ -1,8 +1,22 @@
-from PyPDF2 import PdfReader, PdfWriter
+import asyncio
+import logging
+import os
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils.file_utils import generate_unique_filename, get_temp_path, cleanup_files, get_file_size_mb
-import config
+from utils.file_utils import (
+    release_session_files, get_file_size_mb, create_workspace, remove_workspace,
+    get_input_size, get_input_source, spill_input
+)
+from utils.workers import run_in_process
+from core.compress import (
+    ghostscript_command, compress_pdf_pikepdf, usable_backends, backend_result, pick_output
+)
+from utils.result_cache import result_key, send_cached_result, store_result
+from utils.metrics import observe_phase, record_operation, record_compression
+from utils.scheduler import send_status
+
+logger = logging.getLogger(__name__)
 
 async def start_compression(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ask user to select compression level"""
@@ -22,37 +36,71 @@ async def start_compression(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=reply_markup
     )
 
-async def compress_pdf_pypdf2(input_path, output_path, quality='medium'):
-    """Compress PDF using PyPDF2"""
+async def compress_with_ghostscript(input_path, output_path, level):
+    """Recompress a PDF with Ghostscript using the preset for the level"""
+    input_path = spill_input(input_path, os.path.dirname(output_path))
+    process = await asyncio.create_subprocess_exec(
+        *ghostscript_command(input_path, output_path, level),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
     try:
-        reader = PdfReader(input_path)
-        writer = PdfWriter()
-        
-        for page in reader.pages:
-            writer.add_page(page)
-        
-        # Compression settings based on quality
-        if quality == 'high':
-            for page in writer.pages:
-                page.compress_content_streams()
-            writer.add_metadata(reader.metadata)
-        elif quality == 'medium':
-            for page in writer.pages:
-                page.compress_content_streams()
-        
+        _, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+    
+    if process.returncode != 0:
+        raise RuntimeError(stderr.decode(errors='replace').strip() or f"exit code {process.returncode}")
 
-        with open(output_path, 'wb') as output_file:
-            writer.write(output_file)
-        
-        return True
+async def compress_with_pikepdf(input_path, output_path, level):
+    """Run the pikepdf backend in the worker pool"""
+    await run_in_process(compress_pdf_pikepdf, get_input_source(input_path), output_path, level)
+
+# Available backends, each called as backend(input_path, output_path, level)
+COMPRESSION_BACKENDS = {
+    'ghostscript': compress_with_ghostscript,
+    'pikepdf': compress_with_pikepdf
+}
+
+async def run_compression_backend(name, input_path, level, output_dir):
+    """Run one backend and report its output, size and timing"""
+    output_path = os.path.join(output_dir, f"{name}.pdf")
+    started = time.monotonic()
+    
+    try:
+        await COMPRESSION_BACKENDS[name](input_path, output_path, level)
     except Exception as e:
-        print(f"PyPDF2 compression error: {e}")
-        return False
+        logger.warning(f"Compression backend {name} failed: {e}")
+        return backend_result(name, output_path, started, e)
+    return backend_result(name, output_path, started)
+
+async def compress_pdf(input_path, output_dir, level='medium'):
+    """Run the configured backends side by side, each writing into output_dir, and return their results"""
+    return await asyncio.gather(*[
+        run_compression_backend(name, input_path, level, output_dir)
+        for name in usable_backends(input_path)
+    ])
+
+def format_backend_report(results, original_bytes):
+    """Describe time and bytes saved for each backend"""
+    lines = []
+    for result in results:
+        if result['error'] is not None:
+            lines.append(f"• {result['backend']}: failed ({result['seconds']:.1f}s)")
+            continue
+        saved = original_bytes - result['size']
+        percent = saved / original_bytes * 100 if original_bytes else 0
+        lines.append(
+            f"• {result['backend']}: saved {saved / 1024:.0f} KB "
+            f"({percent:.1f}%) in {result['seconds']:.1f}s"
+        )
+    return "\n".join(lines)
 
 async def handle_compression_level(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle compression level selection"""
     query = update.callback_query
-    await query.answer()
     
     level = query.data.replace('compress_', '')
     
@@ -63,50 +111,71 @@ async def handle_compression_level(update: Update, context: ContextTypes.DEFAULT
     file_info = context.user_data['files'][-1]
     input_path = file_info['path']
     
-    status_msg = await query.message.reply_text("⏳ Compressing PDF...")
+    status_msg = await send_status(query.message, "⏳ Compressing PDF...")
+    workspace = create_workspace(update.effective_user.id)
     
     try:
-        output_filename = generate_unique_filename('.pdf')
-        output_path = get_temp_path(output_filename)
+        filename = f"compressed_{file_info['name']}"
+        cache_key = result_key(file_info, 'compress', level=level)
+        
+        if await send_cached_result(query.message, cache_key, filename, caption="✅ Compression complete"):
+            await status_msg.edit_text("✅ Compression complete! (cached result)")
+            record_operation('compress', 'cached')
+            release_session_files(context.user_data)
+            return
+        
+        # Compress with every backend and keep the smallest result
+        with observe_phase('compress', 'process'):
+            results = await compress_pdf(input_path, workspace, level)
         
-        # Compress
-        success = await compress_pdf_pypdf2(input_path, output_path, level)
+        original_bytes = get_input_size(input_path)
+        for result in results:
+            if result['error'] is None:
+                record_compression(level, result['backend'], original_bytes, result['size'])
         
-        if success:
+        # Raises when every backend failed
+        best = pick_output(results, original_bytes)
+        if best is None:
+            # Nothing got smaller; keep the upload so another operation can use it
+            await status_msg.edit_text(
+                "✅ This PDF is already optimized, compressing it would not make it smaller.\n\n"
+                f"{format_backend_report(results, original_bytes)}\n\n"
+                "You can still choose another operation for it."
+            )
+            record_operation('compress', 'unchanged', original_bytes, original_bytes)
+            
+        else:
+            output_path = best['path']
+            
             # Get file sizes
             original_size = get_file_size_mb(input_path)
             compressed_size = get_file_size_mb(output_path)
-            
-            if compressed_size < original_size:
-                reduction = ((original_size - compressed_size) / original_size) * 100
-                reduction_text = f"Reduced by: {reduction:.1f}%"
-            else:
-                reduction = 0
-                reduction_text = "File size similar (PDF was already optimized)"
+            reduction = ((original_size - compressed_size) / original_size) * 100 if original_size else 0
             
             await status_msg.edit_text(
                 f"✅ Compression complete!\n\n"
                 f"Original: {original_size:.2f} MB\n"
                 f"Compressed: {compressed_size:.2f} MB\n"
-                f"{reduction_text}\n\n"
+                f"Reduced by: {reduction:.1f}%\n\n"
+                f"{format_backend_report(results, original_bytes)}\n\n"
                 f"⏳ Uploading file..."
             )
             
-            with open(output_path, 'rb') as f:
-                await query.message.reply_document(
+            with observe_phase('compress', 'upload'), open(output_path, 'rb') as f:
+                sent = await query.message.reply_document(
                     document=f,
-                    filename=f"compressed_{file_info['name']}",
+                    filename=filename,
                     caption=f"✅ Compression complete"
                 )
+            await store_result(cache_key, output_path, sent)
+            record_operation('compress', 'success', original_bytes, best['size'])
             
             # Cleanup
-            cleanup_files(input_path, output_path)
-            context.user_data['files'] = []
-            
-        else:
-            await status_msg.edit_text("❌ Compression failed. Please try again.")
-            cleanup_files(input_path, output_path)
+            release_session_files(context.user_data)
     
     except Exception as e:
         await status_msg.edit_text(f"❌ Error: {str(e)}")
-        cleanup_files(input_path, output_path)
\ No newline at end of file
+        record_operation('compress', 'error')
+        release_session_files(context.user_data)
+    finally:
+        remove_workspace(workspace)
@@ -1,13 +1,42 @@
-from pdf2docx import Converter
-from pdf2image import convert_from_path
-import pdfplumber
-import fitz  # PyMuPDF
-from PIL import Image
-from telegram import Update
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto
+from telegram.error import RetryAfter
 from telegram.ext import ContextTypes
-from utils.file_utils import generate_unique_filename, get_temp_path, cleanup_files
-import subprocess
+from utils.file_utils import (
+    release_session_files, create_workspace, remove_workspace,
+    get_input_source, get_input_size, spill_input
+)
+from utils.workers import run_in_process, run_killable
+from core.io import get_page_count, join_files
+from core.convert import (
+    IMAGE_FORMATS, pdf_to_docx_pages, assemble_docx, render_page, parse_image_options
+)
+from core.split import format_pages
+from core.image_pdf import images_to_pdf
+from core.text import extract_text, extract_text_layout
+from utils.office import office_pool
+from utils.result_cache import result_key, send_cached_result, store_result
+from utils.progress import Progress
+from utils.metrics import observe_phase, observe_duration, record_operation
+from utils.tracing import annotate
+from utils.scheduler import send_status
+import config
+import asyncio
+import logging
 import os
+import time
+import zipfile
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Photos per album, Telegram's maximum
+ALBUM_SIZE = 10
+# Pages rendered ahead of the one being sent
+RENDER_AHEAD = max(2, min(config.WORKER_PROCESSES, ALBUM_SIZE))
+
+# (chat_id, status message_id) -> event that stops that running PDF to Word
+# conversion; the Stop button sits on the status message, so it names its job
+running_conversions = {}
 
 async def convert_pdf_to_word(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Convert PDF to Word document"""
@@ -17,33 +46,143 @@ async def convert_pdf_to_word(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     file_info = context.user_data['files'][-1]
     input_path = file_info['path']
+    user_id = update.effective_user.id
     
-    status_msg = await update.callback_query.message.reply_text("⏳ Converting PDF to Word...")
+    status_msg = await send_status(update.callback_query.message, "⏳ Converting PDF to Word...")
+    workspace = create_workspace(user_id)
+    conversion = (status_msg.chat_id, status_msg.message_id)
+    stop = running_conversions[conversion] = asyncio.Event()
     
     try:
-        output_filename = generate_unique_filename('.docx')
-        output_path = get_temp_path(output_filename)
+        filename = f"{os.path.splitext(file_info['name'])[0]}.docx"
+        cache_key = result_key(file_info, 'pdf_to_word')
         
-        # Convert using pdf2docx
-        cv = Converter(input_path)
-        cv.convert(output_path)
-        cv.close()
+        if await send_cached_result(update.callback_query.message, cache_key, filename):
+            await status_msg.edit_text("✅ Conversion complete! (cached result)")
+            record_operation('pdf_to_word', 'cached')
+            release_session_files(context.user_data)
+            return
         
-        await status_msg.edit_text("✅ Conversion complete!")
+        output_path = os.path.join(workspace, 'converted.docx')
+        buttons = InlineKeyboardMarkup([[
+            InlineKeyboardButton("⏹ Stop, keep pages done", callback_data="stop_pdf_to_word"),
+            InlineKeyboardButton("✖ Cancel", callback_data="cancel_job")
+        ]])
+        
+        # Page chunks run in killable processes; pdf2docx only reads from disk
+        async with Progress(status_msg, "Converting PDF to Word...", buttons) as progress:
+            with observe_phase('pdf_to_word', 'process'):
+                page_ids, page_count, reason = await pdf_to_docx_parallel(
+                    spill_input(input_path, workspace), output_path, workspace, progress, stop
+                )
+        
+        if not page_ids:
+            record_operation('pdf_to_word', 'error')
+            await status_msg.edit_text(
+                "⏹ Conversion stopped before any page was finished." if reason == 'stopped'
+                else "❌ Conversion failed: no page could be converted in time."
+            )
+            release_session_files(context.user_data)
+            return
+        
+        converted = set(page_ids)
+        missing = [number for number in range(1, page_count + 1) if number - 1 not in converted]
+        note = None
+        if missing:
+            cause = {'stopped': "you stopped the conversion", 'timeout': "the time limit was reached"}.get(
+                reason, "they took too long or could not be read"
+            )
+            note = (
+                f"⚠️ Partial result: {len(page_ids)} of {page_count} pages converted.\n"
+                f"Missing pages {format_pages(missing)}, because {cause}."
+            )
+            await status_msg.edit_text(note)
+        else:
+            await status_msg.edit_text("✅ Conversion complete!")
         
         # Send Word file
-        with open(output_path, 'rb') as f:
-            await update.callback_query.message.reply_document(
+        with observe_phase('pdf_to_word', 'upload'), open(output_path, 'rb') as f:
+            sent = await update.callback_query.message.reply_document(
                 document=f,
-                filename=f"{os.path.splitext(file_info['name'])[0]}.docx"
+                filename=filename,
+                caption=note
             )
+        if not missing:
+            await store_result(cache_key, output_path, sent)
+        record_operation(
+            'pdf_to_word', 'partial' if missing else 'success',
+            get_input_size(input_path), os.path.getsize(output_path)
+        )
         
-        cleanup_files(input_path, output_path)
-        context.user_data['files'] = []
+        release_session_files(context.user_data)
         
     except Exception as e:
+        record_operation('pdf_to_word', 'error')
         await status_msg.edit_text(f"❌ Conversion failed: {str(e)}")
-        cleanup_files(input_path)
+        release_session_files(context.user_data)
+    finally:
+        running_conversions.pop(conversion, None)
+        remove_workspace(workspace)
+
+async def stop_pdf_to_word(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stop the conversion whose status message was pressed; the pages already done are still sent"""
+    message = update.callback_query.message
+    stop = running_conversions.get((message.chat_id, message.message_id))
+    if stop is None:
+        await update.callback_query.message.reply_text("Nothing to stop.")
+        return
+    stop.set()
+
+async def pdf_to_docx_parallel(input_file, output_path, workspace, progress, stop):
+    """Convert page chunks in killable processes, then build one DOCX from what finished
+    
+    Chunks are killed when the stop event is set or PDF_TO_WORD_TIMEOUT
+    passes, and pages over PDF_TO_WORD_PAGE_TIMEOUT are skipped; the pages
+    parsed by then still make up the document. Returns (0-based ids of the
+    pages in the DOCX, page count, reason) where reason is 'complete',
+    'stopped' or 'timeout'.
+    """
+    page_count = await run_in_process(get_page_count, input_file)
+    annotate(pages=page_count)
+    chunk = config.PDF_TO_WORD_CHUNK_PAGES
+    starts = range(0, page_count, chunk)
+    pages_paths = [os.path.join(workspace, f'pages_{start}.jsonl') for start in starts]
+    progress_paths = [os.path.join(workspace, f'progress_{start}.json') for start in starts]
+    progress.track_sum(progress_paths, page_count, "Pages converted")
+    errors = []
+    
+    async def run_chunk(start, pages_path, progress_path):
+        try:
+            await run_killable(
+                pdf_to_docx_pages, input_file, start, min(start + chunk, page_count),
+                pages_path, progress_path, config.PDF_TO_WORD_PAGE_TIMEOUT
+            )
+        except Exception as e:
+            logger.error(f"Pages {start + 1}-{min(start + chunk, page_count)} failed: {e}")
+            errors.append(e)
+    
+    tasks = [
+        asyncio.ensure_future(run_chunk(start, pages_path, progress_path))
+        for start, pages_path, progress_path in zip(starts, pages_paths, progress_paths)
+    ]
+    chunks_done = asyncio.ensure_future(asyncio.wait(tasks))
+    stopped = asyncio.ensure_future(stop.wait())
+    try:
+        await asyncio.wait([chunks_done, stopped], timeout=config.PDF_TO_WORD_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+        reason = 'complete' if chunks_done.done() else ('stopped' if stop.is_set() else 'timeout')
+    finally:
+        # Kills the processes of unfinished chunks
+        for task in tasks + [chunks_done, stopped]:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    progress.update(0, 0, "Writing document")
+    page_ids = await run_killable(
+        assemble_docx, input_file, pages_paths, output_path, timeout=config.PDF_TO_WORD_ASSEMBLE_TIMEOUT
+    )
+    if not page_ids and errors and reason == 'complete':
+        raise errors[0]
+    return page_ids, page_count, reason
 
 async def convert_word_to_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Convert Word to PDF"""
@@ -54,88 +193,252 @@ async def convert_word_to_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE
     file_info = context.user_data['files'][-1]
     input_path = file_info['path']
     
-    status_msg = await update.callback_query.message.reply_text("⏳ Converting Word to PDF...")
+    status_msg = await send_status(update.callback_query.message, "⏳ Converting Word to PDF...")
+    workspace = create_workspace(update.effective_user.id)
     
     try:
-        output_filename = generate_unique_filename('.pdf')
-        output_path = get_temp_path(output_filename)
-        
-        # Use LibreOffice for conversion
-        cmd = [
-            'libreoffice',
-            '--headless',
-            '--convert-to',
-            'pdf',
-            '--outdir',
-            os.path.dirname(output_path),
-            input_path
-        ]
+        filename = f"{os.path.splitext(file_info['name'])[0]}.pdf"
+        cache_key = result_key(file_info, 'word_to_pdf')
         
-        subprocess.run(cmd, check=True, capture_output=True)
+        if await send_cached_result(update.callback_query.message, cache_key, filename):
+            await status_msg.edit_text("✅ Conversion complete! (cached result)")
+            record_operation('word_to_pdf', 'cached')
+            release_session_files(context.user_data)
+            return
         
-        # LibreOffice creates file with original name
-        expected_output = os.path.join(
-            os.path.dirname(output_path),
-            os.path.splitext(os.path.basename(input_path))[0] + '.pdf'
-        )
+        output_path = os.path.join(workspace, 'converted.pdf')
         
-        if os.path.exists(expected_output):
-            os.rename(expected_output, output_path)
+        # Use the LibreOffice pool for conversion
+        with observe_phase('word_to_pdf', 'process'):
+            await office_pool.convert_to_pdf(spill_input(input_path, workspace), output_path)
         
         await status_msg.edit_text("✅ Conversion complete!")
         
         # Send PDF
-        with open(output_path, 'rb') as f:
-            await update.callback_query.message.reply_document(
+        with observe_phase('word_to_pdf', 'upload'), open(output_path, 'rb') as f:
+            sent = await update.callback_query.message.reply_document(
                 document=f,
-                filename=f"{os.path.splitext(file_info['name'])[0]}.pdf"
+                filename=filename
             )
+        await store_result(cache_key, output_path, sent)
+        record_operation('word_to_pdf', 'success', get_input_size(input_path), os.path.getsize(output_path))
         
-        cleanup_files(input_path, output_path)
-        context.user_data['files'] = []
+        release_session_files(context.user_data)
         
     except Exception as e:
+        record_operation('word_to_pdf', 'error')
         await status_msg.edit_text(f"❌ Conversion failed: {str(e)}\n\nMake sure LibreOffice is installed.")
-        cleanup_files(input_path)
+        release_session_files(context.user_data)
+    finally:
+        remove_workspace(workspace)
 
-async def convert_pdf_to_images(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Convert PDF pages to images"""
+IMAGE_DELIVERIES = {
+    'images_album': ('album', 'jpeg'),
+    'images_zip_jpeg': ('zip', 'jpeg'),
+    'images_zip_png': ('zip', 'png'),
+    'images_zip_webp': ('zip', 'webp')
+}
+
+async def start_pdf_to_images(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Ask how the page images should be delivered"""
+    keyboard = [
+        [InlineKeyboardButton("🖼 Photo album (JPEG)", callback_data="images_album")],
+        [
+            InlineKeyboardButton("📦 ZIP · JPEG", callback_data="images_zip_jpeg"),
+            InlineKeyboardButton("📦 ZIP · PNG", callback_data="images_zip_png"),
+            InlineKeyboardButton("📦 ZIP · WebP", callback_data="images_zip_webp")
+        ]
+    ]
+    
+    await update.callback_query.message.reply_text(
+        "How should the pages be sent?\n\n"
+        "Albums are quick to view; ZIP files keep full resolution.",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+
+async def handle_image_delivery(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Remember the delivery and format, then ask for pages and resolution"""
+    delivery, fmt = IMAGE_DELIVERIES[update.callback_query.data]
+    context.user_data['image_options'] = {'delivery': delivery, 'format': fmt}
+    context.user_data['waiting_for'] = 'image_pages'
+    
+    await update.callback_query.message.reply_text(
+        "Which pages, and at what resolution?\n\n"
+        "Examples:\n"
+        "• All pages: all\n"
+        "• Some pages: 1-5, 8\n"
+        "• With a resolution: 1-10 300dpi\n"
+        "• With a size: all 1600px\n\n"
+        f"Default resolution: {config.PDF_IMAGES_DPI} DPI"
+    )
+
+async def handle_image_pages(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the page and resolution choice and convert"""
+    await convert_pdf_to_images(update, context, update.message, update.message.text.strip())
+
+async def convert_pdf_to_images(update, context, message, user_input):
+    """Render the chosen pages and send them as an album or as ZIP files"""
     if 'files' not in context.user_data or not context.user_data['files']:
-        await update.callback_query.message.reply_text("❌ No file found.")
+        await message.reply_text("❌ No file found.")
         return
     
     file_info = context.user_data['files'][-1]
     input_path = file_info['path']
+    options = context.user_data.get('image_options', {'delivery': 'album', 'format': 'jpeg'})
     
-    status_msg = await update.callback_query.message.reply_text("⏳ Converting PDF to images...")
+    status_msg = await send_status(message, "⏳ Converting PDF to images...")
+    workspace = create_workspace(update.effective_user.id)
     
     try:
-        # Convert PDF to images
-        images = convert_from_path(input_path, dpi=200)
-        
-        await status_msg.edit_text(f"✅ Converted {len(images)} pages!")
-        
-        # Send each page as image
-        for i, image in enumerate(images, 1):
-            output_filename = f"page_{i}.jpg"
-            output_path = get_temp_path(output_filename)
-            
-            image.save(output_path, 'JPEG', quality=95)
-            
-            with open(output_path, 'rb') as f:
-                await update.callback_query.message.reply_photo(
-                    photo=f,
-                    caption=f"Page {i}/{len(images)}"
+        # Every page is rendered by its own worker call; give them a path to
+        # open rather than pickling the whole document for each page
+        source = spill_input(input_path, workspace)
+        page_count = await run_in_process(get_page_count, source)
+        ranges, dpi, max_pixels = parse_image_options(user_input, page_count)
+        pages = [page for start, end in ranges for page in range(start, end + 1)]
+        if options['delivery'] == 'album':
+            # Telegram shrinks larger photos anyway
+            max_pixels = min(max_pixels or config.PDF_IMAGES_ALBUM_PIXELS, config.PDF_IMAGES_ALBUM_PIXELS)
+        annotate(pages=len(pages), delivery=options['delivery'], format=options['format'])
+        
+        render = {'fmt': options['format'], 'dpi': dpi, 'max_pixels': max_pixels, 'quality': config.PDF_IMAGES_QUALITY}
+        base_name = os.path.splitext(file_info['name'])[0]
+        
+        # Rendering overlaps uploads, so time each separately
+        started = time.perf_counter()
+        async with Progress(status_msg, "Converting PDF to images...") as progress:
+            if options['delivery'] == 'album':
+                bytes_out, upload_seconds = await send_page_album(message, source, pages, render, progress)
+            else:
+                bytes_out, upload_seconds = await send_page_zips(
+                    message, source, pages, render, base_name, workspace, progress
                 )
-            
-            cleanup_files(output_path)
         
-        cleanup_files(input_path)
-        context.user_data['files'] = []
+        observe_duration('pdf_to_images', 'process', time.perf_counter() - started - upload_seconds)
+        observe_duration('pdf_to_images', 'upload', upload_seconds)
+        record_operation('pdf_to_images', 'success', get_input_size(input_path), bytes_out)
+        
+        await status_msg.edit_text(f"✅ Converted {len(pages)} pages!")
+        finish_pdf_to_images(context)
         
+    except ValueError as e:
+        await status_msg.edit_text(f"❌ {str(e)}. Please try again.")
     except Exception as e:
+        record_operation('pdf_to_images', 'error')
         await status_msg.edit_text(f"❌ Conversion failed: {str(e)}")
-        cleanup_files(input_path)
+        finish_pdf_to_images(context)
+    finally:
+        remove_workspace(workspace)
+
+def finish_pdf_to_images(context):
+    """Release the input and reset the image options"""
+    release_session_files(context.user_data)
+    context.user_data.pop('image_options', None)
+
+async def send_with_retry(send):
+    """Call send(), waiting out Telegram's flood control once if asked to"""
+    try:
+        return await send()
+    except RetryAfter as e:
+        await asyncio.sleep(e.retry_after)
+        return await send()
+
+async def send_page_album(message, source, pages, render, progress):
+    """Send pages as photo albums of up to ten; return (bytes sent, upload seconds)"""
+    bytes_out = 0
+    upload_seconds = 0
+    batch = []
+    
+    async def flush():
+        nonlocal upload_seconds
+        upload_started = time.perf_counter()
+        if len(batch) == 1:
+            # Albums need at least two items
+            page_number, data = batch[0]
+            await send_with_retry(lambda: message.reply_photo(photo=data, caption=f"Page {page_number}"))
+        else:
+            media = [InputMediaPhoto(data, caption=f"Page {page_number}") for page_number, data in batch]
+            await send_with_retry(lambda: message.reply_media_group(media=media))
+        upload_seconds += time.perf_counter() - upload_started
+        batch.clear()
+    
+    done = 0
+    async for page_number, data in stream_page_images(source, pages, **render):
+        batch.append((page_number, data))
+        bytes_out += len(data)
+        done += 1
+        if len(batch) == ALBUM_SIZE:
+            await flush()
+        progress.update(done, len(pages), "Pages rendered")
+    if batch:
+        await flush()
+    return bytes_out, upload_seconds
+
+async def send_page_zips(message, source, pages, render, base_name, workspace, progress):
+    """Add pages to ZIP files as they are rendered and send each file once full
+    
+    A new ZIP is started before one would pass PDF_IMAGES_ZIP_MAX_MB, so every
+    part stays under Telegram's upload limit. Returns (bytes sent, upload seconds).
+    """
+    ext = IMAGE_FORMATS[render['fmt']]
+    width = len(str(pages[-1]))
+    limit = config.PDF_IMAGES_ZIP_MAX_MB * 1024 * 1024
+    bytes_out = 0
+    upload_seconds = 0
+    parts = []  # (zip_path, first_page, last_page)
+    archive = None
+    
+    async def send(zip_path, first, last, only=False):
+        nonlocal bytes_out, upload_seconds
+        if only:
+            filename = f"{base_name}_images.zip"
+        else:
+            filename = f"{base_name}_images_p{first}-{last}.zip"
+        upload_started = time.perf_counter()
+        with open(zip_path, 'rb') as f:
+            await message.reply_document(document=f, filename=filename)
+        upload_seconds += time.perf_counter() - upload_started
+        bytes_out += os.path.getsize(zip_path)
+        os.remove(zip_path)
+    
+    try:
+        done = 0
+        async for page_number, data in stream_page_images(source, pages, **render):
+            # Image data is already compressed, so entries are stored as-is
+            if archive is not None and archive.fp.tell() + len(data) + 1024 > limit:
+                archive.close()
+                archive = None
+                await send(*parts[-1])
+            if archive is None:
+                zip_path = os.path.join(workspace, f"images_{len(parts) + 1}.zip")
+                archive = zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED)
+                parts.append([zip_path, page_number, page_number])
+            archive.writestr(f"{base_name}_{page_number:0{width}d}.{ext}", data)
+            parts[-1][2] = page_number
+            done += 1
+            progress.update(done, len(pages), "Pages rendered")
+        archive.close()
+        archive = None
+        await send(*parts[-1], only=len(parts) == 1)
+    finally:
+        if archive is not None:
+            archive.close()
+    return bytes_out, upload_seconds
+
+async def start_images_to_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Ask for the page size of the PDF built from the images"""
+    keyboard = [
+        [InlineKeyboardButton("🖼 Same as each image", callback_data="images_pdf_image")],
+        [
+            InlineKeyboardButton("📄 A4", callback_data="images_pdf_a4"),
+            InlineKeyboardButton("📄 Letter", callback_data="images_pdf_letter")
+        ]
+    ]
+    
+    await update.callback_query.message.reply_text(
+        "Which page size should the PDF have?",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
 
 async def convert_images_to_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Convert images to PDF"""
@@ -149,42 +452,58 @@ async def convert_images_to_pdf(update: Update, context: ContextTypes.DEFAULT_TY
         await update.callback_query.message.reply_text("❌ No images found.")
         return
     
-    status_msg = await update.callback_query.message.reply_text("⏳ Creating PDF from images...")
+    status_msg = await send_status(update.callback_query.message, "⏳ Creating PDF from images...")
+    workspace = create_workspace(update.effective_user.id)
     
     try:
-        # Open all images
-        images = []
-        for file_info in image_files:
-            img = Image.open(file_info['path'])
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            images.append(img)
+        output_path = os.path.join(workspace, 'images.pdf')
+        progress_path = os.path.join(workspace, 'progress.json')
+        page_size = update.callback_query.data[len('images_pdf_'):]
+        margin = 0 if page_size == 'image' else config.IMAGES_PDF_MARGIN
+        # Hand the worker paths, so it holds one image at a time
+        sources = [spill_input(f['path'], workspace) for f in image_files]
         
-        # Generate output
-        output_filename = generate_unique_filename('.pdf')
-        output_path = get_temp_path(output_filename)
+        # Images are embedded as they are, one page each
+        async with Progress(status_msg, "Creating PDF from images...") as progress:
+            with observe_phase('images_to_pdf', 'process', page_size=page_size):
+                progress.track(progress_path)
+                await run_in_process(images_to_pdf, sources, output_path, page_size, 'contain', margin, progress_path)
         
-        # Save as PDF
-        if images:
-            images[0].save(output_path, save_all=True, append_images=images[1:])
-        
-        await status_msg.edit_text(f"✅ Created PDF from {len(images)} images!")
+        await status_msg.edit_text(f"✅ Created PDF from {len(image_files)} images!")
         
         # Send PDF
-        with open(output_path, 'rb') as f:
+        with observe_phase('images_to_pdf', 'upload'), open(output_path, 'rb') as f:
             await update.callback_query.message.reply_document(
                 document=f,
                 filename="images_to_pdf.pdf"
             )
         
+        record_operation(
+            'images_to_pdf', 'success',
+            sum(get_input_size(f['path']) for f in image_files), os.path.getsize(output_path)
+        )
+        
         # Cleanup
-        for file_info in image_files:
-            cleanup_files(file_info['path'])
-        cleanup_files(output_path)
-        context.user_data['files'] = []
+        release_session_files(context.user_data)
         
     except Exception as e:
+        record_operation('images_to_pdf', 'error')
         await status_msg.edit_text(f"❌ Conversion failed: {str(e)}")
+        release_session_files(context.user_data)
+    finally:
+        remove_workspace(workspace)
+
+async def start_text_extraction(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Ask whether plain text is enough or layout and tables should be kept"""
+    keyboard = [
+        [InlineKeyboardButton("⚡ Plain text (fast)", callback_data="extract_text_fast")],
+        [InlineKeyboardButton("📐 Keep layout & tables", callback_data="extract_text_layout")]
+    ]
+    
+    await update.callback_query.message.reply_text(
+        "How should the text be extracted?",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
 
 async def extract_text_from_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Extract text from PDF"""
@@ -194,44 +513,134 @@ async def extract_text_from_pdf(update: Update, context: ContextTypes.DEFAULT_TY
     
     file_info = context.user_data['files'][-1]
     input_path = file_info['path']
+    mode = 'layout' if update.callback_query.data == 'extract_text_layout' else 'fast'
     
-    status_msg = await update.callback_query.message.reply_text("⏳ Extracting text...")
+    status_msg = await send_status(update.callback_query.message, "⏳ Extracting text...")
+    workspace = create_workspace(update.effective_user.id)
     
     try:
-        text_content = []
-        
-        with pdfplumber.open(input_path) as pdf:
-            for i, page in enumerate(pdf.pages, 1):
-                text = page.extract_text()
-                if text:
-                    text_content.append(f"--- Page {i} ---\n{text}\n")
+        filename = f"{os.path.splitext(file_info['name'])[0]}.txt"
+        cache_key = result_key(file_info, 'extract_text', mode=mode)
         
-        full_text = "\n".join(text_content)
+        if await send_cached_result(update.callback_query.message, cache_key, filename):
+            await status_msg.edit_text("✅ Text extracted successfully! (cached result)")
+            record_operation('extract_text', 'cached')
+            release_session_files(context.user_data)
+            return
         
-        if not full_text.strip():
+        # Text is written to disk page by page as it is extracted
+        output_path = os.path.join(workspace, 'text.txt')
+        
+        async with Progress(status_msg, "Extracting text...") as progress:
+            with observe_phase('extract_text', 'process'):
+                if mode == 'layout':
+                    # Chunks are separate worker calls; give them a path to open
+                    # rather than pickling the whole document for each chunk
+                    characters = await extract_text_parallel(
+                        spill_input(input_path, workspace), output_path, workspace, progress
+                    )
+                else:
+                    progress_path = os.path.join(workspace, 'progress.json')
+                    progress.track(progress_path)
+                    characters = await run_in_process(
+                        extract_text, get_input_source(input_path), output_path, progress_path
+                    )
+        
+        if not characters:
             await status_msg.edit_text("❌ No text found in PDF. The PDF might contain only images.")
-            cleanup_files(input_path)
+            record_operation('extract_text', 'empty')
+            release_session_files(context.user_data)
             return
         
-        # Save as text file
-        output_filename = generate_unique_filename('.txt')
-        output_path = get_temp_path(output_filename)
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(full_text)
-        
         await status_msg.edit_text("✅ Text extracted successfully!")
         
         # Send text file
-        with open(output_path, 'rb') as f:
-            await update.callback_query.message.reply_document(
+        with observe_phase('extract_text', 'upload'), open(output_path, 'rb') as f:
+            sent = await update.callback_query.message.reply_document(
                 document=f,
-                filename=f"{os.path.splitext(file_info['name'])[0]}.txt"
+                filename=filename
             )
+        await store_result(cache_key, output_path, sent)
+        record_operation('extract_text', 'success', get_input_size(input_path), os.path.getsize(output_path))
         
-        cleanup_files(input_path, output_path)
-        context.user_data['files'] = []
+        release_session_files(context.user_data)
         
     except Exception as e:
+        record_operation('extract_text', 'error')
         await status_msg.edit_text(f"❌ Extraction failed: {str(e)}")
-        cleanup_files(input_path)
\ No newline at end of file
+        release_session_files(context.user_data)
+    finally:
+        remove_workspace(workspace)
+
+async def extract_text_parallel(source, output_path, workspace, progress):
+    """Run layout-preserving extraction on page chunks across the worker pool
+    
+    Each chunk is written to its own file and the files are joined in page
+    order, so no chunk's text has to pass through the event loop. At most
+    WORKER_PROCESSES chunks are in the pool at once, leaving room in its
+    queue for other jobs. source should be a path: it is sent to the worker
+    once per chunk.
+    """
+    page_count = await run_in_process(get_page_count, source)
+    annotate(pages=page_count)
+    chunk = config.TEXT_LAYOUT_CHUNK_PAGES
+    chunk_paths = [
+        os.path.join(workspace, f'text_{start}.txt')
+        for start in range(0, page_count, chunk)
+    ]
+    
+    slots = asyncio.Semaphore(config.WORKER_PROCESSES)
+    
+    async def run_chunk(start, path):
+        end = min(start + chunk, page_count)
+        async with slots:
+            characters = await run_in_process(extract_text_layout, source, path, start, end)
+        return end - start, characters
+    
+    tasks = [
+        asyncio.ensure_future(run_chunk(index * chunk, path))
+        for index, path in enumerate(chunk_paths)
+    ]
+    pages_done = 0
+    characters = 0
+    try:
+        for finished in asyncio.as_completed(tasks):
+            pages, chunk_characters = await finished
+            pages_done += pages
+            characters += chunk_characters
+            progress.update(pages_done, page_count, "Pages")
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    await asyncio.to_thread(join_files, chunk_paths, output_path)
+    return characters
+
+async def stream_page_images(source, pages, fmt='jpeg', dpi=200, max_pixels=None, quality=90):
+    """Yield (page_number, image_bytes) for the given 1-based pages, in order
+    
+    Up to RENDER_AHEAD pages are rendered in the worker pool while the caller
+    is still sending earlier ones, so memory stays bounded by a few pages.
+    source should be a path: it is sent to the worker once per page.
+    """
+    pending = deque()
+    pages = iter(pages)
+    
+    def submit():
+        page_number = next(pages, None)
+        if page_number is not None:
+            pending.append((page_number, asyncio.ensure_future(
+                run_in_process(render_page, source, page_number - 1, fmt, dpi, max_pixels, quality)
+            )))
+    
+    try:
+        for _ in range(RENDER_AHEAD):
+            submit()
+        while pending:
+            page_number, task = pending.popleft()
+            image_data = await task
+            submit()
+            yield page_number, image_data
+    finally:
+        for _, task in pending:
+            task.cancel()
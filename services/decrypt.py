@@ -1,7 +1,11 @@
-import pikepdf
+import os
 from telegram import Update
 from telegram.ext import ContextTypes
-from utils.file_utils import generate_unique_filename, get_temp_path, cleanup_files
+from utils.file_utils import release_session_files, create_workspace, remove_workspace, get_input_source, get_input_size
+from utils.workers import run_in_process
+from core.security import decrypt_pdf, WrongPassword
+from utils.metrics import observe_phase, record_operation
+from utils.scheduler import send_status
 
 async def start_decryption(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start decryption process"""
@@ -21,37 +25,40 @@ async def handle_decryption_password(update: Update, context: ContextTypes.DEFAU
     file_info = context.user_data['files'][-1]
     input_path = file_info['path']
     
-    status_msg = await update.message.reply_text("⏳ Decrypting PDF...")
+    status_msg = await send_status(update.message, "⏳ Decrypting PDF...")
+    workspace = create_workspace(update.effective_user.id)
     
     try:
         # Generate output path
-        output_filename = generate_unique_filename('.pdf')
-        output_path = get_temp_path(output_filename)
+        output_path = os.path.join(workspace, 'decrypted.pdf')
         
-        # Open encrypted PDF with password
-        with pikepdf.open(input_path, password=password) as pdf:
-            # Save without encryption
-            pdf.save(output_path)
+        # Decrypt in a worker process
+        with observe_phase('decrypt', 'process'):
+            await run_in_process(decrypt_pdf, get_input_source(input_path), output_path, password)
         
         await status_msg.edit_text("✅ PDF decrypted successfully!")
         
         # Send decrypted file
-        with open(output_path, 'rb') as f:
+        with observe_phase('decrypt', 'upload'), open(output_path, 'rb') as f:
             await update.message.reply_document(
                 document=f,
                 filename=f"decrypted_{file_info['name']}"
             )
         
+        record_operation('decrypt', 'success', get_input_size(input_path), os.path.getsize(output_path))
+        
         # Cleanup
-        cleanup_files(input_path, output_path)
-        context.user_data['files'] = []
-        context.user_data['waiting_for'] = None
+        release_session_files(context.user_data)
         
-    except pikepdf.PasswordError:
+    except WrongPassword:
+        record_operation('decrypt', 'rejected')
         await status_msg.edit_text(
             "❌ Incorrect password! Please try again.\n\n"
             "Send the correct password or upload a new file."
         )
     except Exception as e:
         await status_msg.edit_text(f"❌ Decryption failed: {str(e)}")
-        cleanup_files(input_path)
\ No newline at end of file
+        record_operation('decrypt', 'error')
+        release_session_files(context.user_data)
+    finally:
+        remove_workspace(workspace)
@@ -1,7 +1,11 @@
-import pikepdf
+import os
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
-from utils.file_utils import generate_unique_filename, get_temp_path, cleanup_files
+from utils.file_utils import release_session_files, create_workspace, remove_workspace, get_input_source, get_input_size
+from utils.workers import run_in_process
+from core.security import encrypt_pdf
+from utils.metrics import observe_phase, record_operation
+from utils.scheduler import send_status
 
 WAITING_FOR_PASSWORD = 1
 
@@ -25,34 +29,16 @@ async def handle_encryption_password(update: Update, context: ContextTypes.DEFAU
     file_info = context.user_data['files'][-1]
     input_path = file_info['path']
     
-    status_msg = await update.message.reply_text("⏳ Encrypting PDF...")
+    status_msg = await send_status(update.message, "⏳ Encrypting PDF...")
+    workspace = create_workspace(update.effective_user.id)
     
     try:
         # Generate output path
-        output_filename = generate_unique_filename('.pdf')
-        output_path = get_temp_path(output_filename)
+        output_path = os.path.join(workspace, 'encrypted.pdf')
         
-        # Open and encrypt PDF
-        with pikepdf.open(input_path) as pdf:
-            # Set encryption
-            pdf.save(
-                output_path,
-                encryption=pikepdf.Encryption(
-                    owner=password,
-                    user=password,
-                    R=6,  # AES-256 encryption
-                    allow=pikepdf.Permissions(
-                        accessibility=True,
-                        extract=False,
-                        modify_annotation=False,
-                        modify_assembly=False,
-                        modify_form=False,
-                        modify_other=False,
-                        print_lowres=False,
-                        print_highres=False
-                    )
-                )
-            )
+        # Encrypt in a worker process
+        with observe_phase('encrypt', 'process'):
+            await run_in_process(encrypt_pdf, get_input_source(input_path), output_path, password)
         
         await status_msg.edit_text(
             "✅ PDF encrypted successfully!\n\n"
@@ -60,26 +46,23 @@ async def handle_encryption_password(update: Update, context: ContextTypes.DEFAU
         )
         
         # Send encrypted file
-        with open(output_path, 'rb') as f:
+        with observe_phase('encrypt', 'upload'), open(output_path, 'rb') as f:
             await update.message.reply_document(
                 document=f,
                 filename=f"encrypted_{file_info['name']}"
             )
         
+        record_operation('encrypt', 'success', get_input_size(input_path), os.path.getsize(output_path))
+        
         # Cleanup
-        cleanup_files(input_path, output_path)
-        context.user_data['files'] = []
-        context.user_data['waiting_for'] = None
+        release_session_files(context.user_data)
         
         return ConversationHandler.END
         
     except Exception as e:
         await status_msg.edit_text(f"❌ Encryption failed: {str(e)}")
-        cleanup_files(input_path)
+        record_operation('encrypt', 'error')
+        release_session_files(context.user_data)
         return ConversationHandler.END
-
-async def cancel_operation(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Cancel current operation"""
-    await update.message.reply_text("Operation cancelled.")
-    context.user_data['waiting_for'] = None
-    return ConversationHandler.END
\ No newline at end of file
+    finally:
+        remove_workspace(workspace)
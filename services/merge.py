@@ -1,8 +1,14 @@
-from PyPDF2 import PdfReader, PdfWriter
+import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils.file_utils import generate_unique_filename, get_temp_path, cleanup_files
-
+from utils.file_utils import release_session_files, create_workspace, remove_workspace, get_input_source, get_input_size
+from utils.workers import run_in_process
+from core.merge import merge_pdfs
+from utils.result_cache import result_key, send_cached_result, store_result
+from utils.progress import Progress
+from utils.metrics import observe_phase, record_operation
+from utils.tracing import annotate
+from utils.scheduler import send_status
 async def start_merge(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start merge process"""
     if 'files' not in context.user_data:
@@ -40,7 +46,6 @@ async def start_merge(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def confirm_merge(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Merge uploaded PDFs"""
     query = update.callback_query
-    await query.answer()
     
     pdf_files = [f for f in context.user_data.get('files', []) if f['type'] == 'pdf']
     
@@ -48,44 +53,57 @@ async def confirm_merge(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.message.reply_text("❌ Not enough PDFs to merge.")
         return
     
-    status_msg = await query.message.reply_text("⏳ Merging PDFs...")
+    status_msg = await send_status(query.message, "⏳ Merging PDFs...")
+    workspace = create_workspace(update.effective_user.id)
     
     try:
-        # Create merger
-        writer = PdfWriter()
+        cache_key = result_key(pdf_files, 'merge')
         
-        # Add all PDFs
-        for file_info in pdf_files:
-            reader = PdfReader(file_info['path'])
-            for page in reader.pages:
-                writer.add_page(page)
+        if await send_cached_result(query.message, cache_key, "merged_document.pdf"):
+            await status_msg.edit_text(
+                f"✅ Successfully merged {len(pdf_files)} PDFs!"
+            )
+            record_operation('merge', 'cached')
+            release_session_files(context.user_data)
+            return
         
         # Generate output
-        output_filename = generate_unique_filename('.pdf')
-        output_path = get_temp_path(output_filename)
+        output_path = os.path.join(workspace, 'merged.pdf')
+        
+        progress_path = os.path.join(workspace, 'progress.json')
+        annotate(files=len(pdf_files))
         
-        with open(output_path, 'wb') as output_file:
-            writer.write(output_file)
+        # Merge in a worker process
+        async with Progress(status_msg, "Merging PDFs...") as progress:
+            with observe_phase('merge', 'process'):
+                progress.track(progress_path)
+                shared = await run_in_process(
+                    merge_pdfs, [get_input_source(f['path']) for f in pdf_files], output_path, progress_path
+                )
         
         await status_msg.edit_text(
             f"✅ Successfully merged {len(pdf_files)} PDFs!"
+            + (f"\n\n♻️ {shared} repeated images/fonts stored once." if shared else "")
         )
         
         # Send merged file
-        with open(output_path, 'rb') as f:
-            await query.message.reply_document(
+        with observe_phase('merge', 'upload'), open(output_path, 'rb') as f:
+            sent = await query.message.reply_document(
                 document=f,
                 filename="merged_document.pdf"
             )
+        await store_result(cache_key, output_path, sent)
+        record_operation(
+            'merge', 'success',
+            sum(get_input_size(f['path']) for f in pdf_files), os.path.getsize(output_path)
+        )
         
         # Cleanup all files
-        for file_info in pdf_files:
-            cleanup_files(file_info['path'])
-        cleanup_files(output_path)
-        
-        context.user_data['files'] = []
+        release_session_files(context.user_data)
         
     except Exception as e:
         await status_msg.edit_text(f"❌ Merge failed: {str(e)}")
-        for file_info in pdf_files:
-            cleanup_files(file_info['path'])
\ No newline at end of file
+        record_operation('merge', 'error')
+        release_session_files(context.user_data)
+    finally:
+        remove_workspace(workspace)
@@ -0,0 +1,211 @@
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+from utils.file_utils import release_session_files, create_workspace, remove_workspace, get_input_source, get_input_size
+from utils.workers import run_in_process
+from core.pipeline import STEPS, run_pipeline
+from core.security import WrongPassword
+from core.split import parse_page_ranges
+from utils.progress import Progress
+from utils.metrics import observe_phase, record_operation
+from utils.tracing import annotate
+from utils.scheduler import send_status
+import os
+
+STEP_BUTTONS = {
+    'decrypt': "🔓 Remove password",
+    'pages': "✂️ Keep pages",
+    'compress': "🗜 Compress",
+    'encrypt': "🔒 Add password"
+}
+
+STEP_PROMPTS = {
+    'decrypt': "🔓 Please enter the current password of the PDF:",
+    'pages': (
+        "Which pages should be kept?\n\n"
+        "Examples:\n"
+        "• Range: 1-20\n"
+        "• Multiple: 1-5, 8, 10-15"
+    ),
+    'encrypt': "🔒 Please enter the new password for the result:"
+}
+
+# user_id -> {step: password}. Passwords stay in this process's memory and
+# out of the persisted session; after a restart the user is asked again.
+pipeline_passwords = {}
+
+def pipeline_menu(pipeline):
+    """Text and keyboard showing the chosen steps"""
+    steps = pipeline['steps']
+    keyboard = [
+        [InlineKeyboardButton(
+            f"{'✅' if name in steps else '▫️'} {STEP_BUTTONS[name]}",
+            callback_data=f"pipeline_toggle_{name}"
+        )]
+        for name in STEPS
+    ]
+    keyboard.append([
+        InlineKeyboardButton("▶️ Run", callback_data="pipeline_run"),
+        InlineKeyboardButton("✖ Cancel", callback_data="pipeline_cancel")
+    ])
+
+    chosen = [STEP_BUTTONS[name] for name in STEPS if name in steps]
+    text = (
+        "⛓ Choose the steps to run on this PDF. They run in one pass, "
+        "in the order shown, and you get a single file back.\n\n"
+        + ("Steps: " + " → ".join(chosen) if chosen else "No steps chosen yet.")
+    )
+    if 'pages' in steps:
+        text += f"\nPages kept: {steps['pages']['spec']}"
+    return text, InlineKeyboardMarkup(keyboard)
+
+def forget_pipeline(context, user_id):
+    """Drop the user's pipeline and its passwords"""
+    context.user_data.pop('pipeline', None)
+    pipeline_passwords.pop(user_id, None)
+
+async def start_pipeline(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the pipeline builder for the uploaded PDF"""
+    if 'files' not in context.user_data or not context.user_data['files']:
+        await update.callback_query.message.reply_text("❌ No file found.")
+        return
+
+    forget_pipeline(context, update.effective_user.id)
+    context.user_data['pipeline'] = {'steps': {}}
+    text, reply_markup = pipeline_menu(context.user_data['pipeline'])
+    await update.callback_query.message.reply_text(text, reply_markup=reply_markup)
+
+async def toggle_pipeline_step(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Add or remove a step; steps that need input ask for it first"""
+    query = update.callback_query
+    pipeline = context.user_data.get('pipeline')
+    if pipeline is None:
+        await query.message.reply_text("❌ No pipeline in progress. Please upload a file first.")
+        return
+
+    name = query.data[len('pipeline_toggle_'):]
+    if name in pipeline['steps']:
+        del pipeline['steps'][name]
+        pipeline_passwords.get(update.effective_user.id, {}).pop(name, None)
+    elif name == 'compress':
+        pipeline['steps'][name] = {'level': 'medium'}
+    else:
+        pipeline['asking'] = name
+        context.user_data['waiting_for'] = 'pipeline_input'
+        await query.message.reply_text(STEP_PROMPTS[name])
+        return
+
+    text, reply_markup = pipeline_menu(pipeline)
+    await query.edit_message_text(text, reply_markup=reply_markup)
+
+async def handle_pipeline_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the page selection or password a pipeline step asked for"""
+    pipeline = context.user_data.get('pipeline')
+    if pipeline is None or 'asking' not in pipeline:
+        await update.message.reply_text("❌ No pipeline in progress. Please upload a file first.")
+        context.user_data['waiting_for'] = None
+        return
+
+    name = pipeline['asking']
+    text = update.message.text.strip()
+    if name == 'pages':
+        # Checked against the real page count when the pipeline runs
+        if not parse_page_ranges(text, 10 ** 9):
+            await update.message.reply_text("❌ Invalid page format. Please try again.")
+            return
+        pipeline['steps'][name] = {'spec': text}
+    else:
+        pipeline_passwords.setdefault(update.effective_user.id, {})[name] = update.message.text
+        pipeline['steps'][name] = {}
+
+    del pipeline['asking']
+    context.user_data['waiting_for'] = None
+    text, reply_markup = pipeline_menu(pipeline)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+
+async def cancel_pipeline(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Discard the pipeline being built"""
+    forget_pipeline(context, update.effective_user.id)
+    context.user_data['waiting_for'] = None
+    await update.callback_query.edit_message_text("Pipeline cancelled.")
+
+async def run_pipeline_job(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Run the chosen steps on the PDF in one pass and send the result"""
+    query = update.callback_query
+    user_id = update.effective_user.id
+    pipeline = context.user_data.get('pipeline')
+    if 'files' not in context.user_data or not context.user_data['files'] or pipeline is None:
+        await query.message.reply_text("❌ No file found.")
+        return
+    if not pipeline['steps']:
+        await query.message.reply_text("Please choose at least one step first.")
+        return
+
+    steps = {name: dict(options) for name, options in pipeline['steps'].items()}
+    passwords = pipeline_passwords.get(user_id, {})
+    for name in ('decrypt', 'encrypt'):
+        if name not in steps:
+            continue
+        if name not in passwords:
+            del pipeline['steps'][name]
+            text, reply_markup = pipeline_menu(pipeline)
+            await query.message.reply_text(
+                f"❌ The password for \"{STEP_BUTTONS[name]}\" is no longer known. Please choose that step again.\n\n"
+                + text,
+                reply_markup=reply_markup
+            )
+            return
+        steps[name]['password'] = passwords[name]
+
+    file_info = context.user_data['files'][-1]
+    input_path = file_info['path']
+    annotate(steps=','.join(name for name in STEPS if name in steps))
+
+    status_msg = await send_status(query.message, "⏳ Running pipeline...")
+    workspace = create_workspace(user_id)
+
+    try:
+        output_path = os.path.join(workspace, 'pipeline.pdf')
+        progress_path = os.path.join(workspace, 'progress.json')
+
+        # One open, every step in memory, one save
+        async with Progress(status_msg, "Running pipeline...") as progress:
+            progress.track(progress_path)
+            with observe_phase('pipeline', 'process'):
+                page_count = await run_in_process(
+                    run_pipeline, get_input_source(input_path), output_path, steps, progress_path
+                )
+
+        await status_msg.edit_text(f"✅ Pipeline finished! {page_count} pages.")
+
+        # Send the result
+        with observe_phase('pipeline', 'upload'), open(output_path, 'rb') as f:
+            await query.message.reply_document(
+                document=f,
+                filename=f"processed_{file_info['name']}"
+            )
+
+        record_operation('pipeline', 'success', get_input_size(input_path), os.path.getsize(output_path))
+
+        # Cleanup
+        release_session_files(context.user_data)
+        forget_pipeline(context, user_id)
+
+    except WrongPassword:
+        record_operation('pipeline', 'rejected')
+        pipeline['steps'].pop('decrypt', None)
+        passwords.pop('decrypt', None)
+        await status_msg.edit_text("❌ This PDF is password protected and the password is missing or wrong.")
+        text, reply_markup = pipeline_menu(pipeline)
+        await query.message.reply_text(
+            "Choose \"Remove password\" with the right password, then run it again.\n\n" + text,
+            reply_markup=reply_markup
+        )
+    except ValueError as e:
+        await status_msg.edit_text(f"❌ {str(e)}. Please change the steps and try again.")
+    except Exception as e:
+        record_operation('pipeline', 'error')
+        await status_msg.edit_text(f"❌ Pipeline failed: {str(e)}")
+        release_session_files(context.user_data)
+        forget_pipeline(context, user_id)
+    finally:
+        remove_workspace(workspace)
@@ -1,7 +1,7 @@
 from telegram import Update
 from telegram.ext import ContextTypes
-from utils.file_utils import get_temp_path, cleanup_files
-import os
+from utils.file_utils import release_session_files, open_input, get_input_size
+from utils.metrics import observe_phase, record_operation
 
 async def start_rename(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start rename process"""
@@ -45,18 +45,20 @@ async def handle_rename_input(update: Update, context: ContextTypes.DEFAULT_TYPE
         await status_msg.edit_text(f"✅ File renamed to: {new_filename}")
         
      
-        with open(input_path, 'rb') as f:
+        with observe_phase('rename', 'upload'), open_input(input_path) as f:
             await update.message.reply_document(
                 document=f,
                 filename=new_filename,
                 caption=f"✅ Renamed to: {new_filename}"
             )
         
+        size = get_input_size(input_path)
+        record_operation('rename', 'success', size, size)
+        
         # Cleanup
-        cleanup_files(input_path)
-        context.user_data['files'] = []
-        context.user_data['waiting_for'] = None
+        release_session_files(context.user_data)
         
     except Exception as e:
         await status_msg.edit_text(f"❌ Error: {str(e)}")
-        cleanup_files(input_path)
+        record_operation('rename', 'error')
+        release_session_files(context.user_data)
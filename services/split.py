@@ -1,128 +1,268 @@
-from PyPDF2 import PdfReader, PdfWriter
-from telegram import Update
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils.file_utils import generate_unique_filename, get_temp_path, cleanup_files
-import re
+from utils.file_utils import release_session_files, create_workspace, remove_workspace, get_input_source, get_input_size, spill_input
+from utils.workers import run_in_process
+from core.split import (
+    inspect_pdf, plan_parts, plan_size_parts, parse_size_mb, extract_pages, count_range_pages
+)
+from utils.result_cache import result_key, send_cached_result, store_result
+from utils.metrics import observe_phase, observe_duration, record_operation
+from utils.tracing import annotate
+from utils.scheduler import send_status
+import config
+import asyncio
+import os
+import time
+import zipfile
+
+SPLIT_PROMPTS = {
+    'extract': (
+        "Please specify which pages to extract:\n\n"
+        "Examples:\n"
+        "• Single page: 5\n"
+        "• Range: 1-10\n"
+        "• Multiple: 1-5, 8, 10-15"
+    ),
+    'every': "How many pages should each part have?\n\nExample: 10",
+    'ranges': (
+        "Send the ranges to save as separate files:\n\n"
+        "Example: 1-3, 4-10, 11-20"
+    ),
+    'size': "What is the maximum size of each part in MB?\n\nExample: 20"
+}
 
 async def start_split(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start split process"""
     if 'files' not in context.user_data or not context.user_data['files']:
         await update.callback_query.message.reply_text("❌ No file found.")
         return
-    
+
     file_info = context.user_data['files'][-1]
     input_path = file_info['path']
-    
+
     try:
-        # Get page count
-        reader = PdfReader(input_path)
-        page_count = len(reader.pages)
-        
+        # Parse once; page count and bookmarks are reused by every split mode
+        split_info = await run_in_process(inspect_pdf, get_input_source(input_path))
+        page_count = split_info['pages']
+
+        keyboard = [
+            [
+                InlineKeyboardButton("📄 Extract pages", callback_data="split_mode_extract"),
+                InlineKeyboardButton("🔢 Every N pages", callback_data="split_mode_every")
+            ],
+            [
+                InlineKeyboardButton("📑 File per range", callback_data="split_mode_ranges"),
+                InlineKeyboardButton("📦 By size", callback_data="split_mode_size")
+            ]
+        ]
+        if split_info['bookmarks']:
+            keyboard.append([InlineKeyboardButton("🔖 By bookmarks", callback_data="split_mode_bookmarks")])
+
         await update.callback_query.message.reply_text(
-            f"📄 This PDF has {page_count} pages.\n\n"
-            f"Please specify which pages to extract:\n\n"
-            f"Examples:\n"
-            f"• Single page: 5\n"
-            f"• Range: 1-10\n"
-            f"• Multiple: 1-5, 8, 10-15\n"
-            f"• All except: 1-{page_count} (for all pages)"
+            f"📄 This PDF has {page_count} pages"
+            + (f" and {len(split_info['bookmarks'])} bookmarks" if split_info['bookmarks'] else "")
+            + ".\n\nHow do you want to split it?",
+            reply_markup=InlineKeyboardMarkup(keyboard)
         )
-        
-        context.user_data['waiting_for'] = 'split_pages'
+
         context.user_data['total_pages'] = page_count
-        
+        context.user_data['split_info'] = split_info
+
     except Exception as e:
         await update.callback_query.message.reply_text(f"❌ Error reading PDF: {str(e)}")
 
+async def handle_split_mode(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the split mode selection"""
+    query = update.callback_query
+    mode = query.data.replace('split_mode_', '')
+
+    if 'split_info' not in context.user_data:
+        await query.message.reply_text("❌ No file found. Please upload a file first.")
+        return
+
+    context.user_data['split_mode'] = mode
+
+    if mode == 'bookmarks':
+        await split_pdf(update, context, query.message, None)
+        return
+
+    await query.message.reply_text(SPLIT_PROMPTS[mode])
+    context.user_data['waiting_for'] = 'split_pages'
+
 async def handle_split_pages(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle page selection and split PDF"""
-    pages_input = update.message.text.strip()
-    
+    await split_pdf(update, context, update.message, update.message.text.strip())
+
+async def split_pdf(update, context, message, user_input):
+    """Plan the parts for the chosen mode, write them in parallel and send them"""
     if 'files' not in context.user_data or not context.user_data['files']:
-        await update.message.reply_text("❌ No file found.")
+        await message.reply_text("❌ No file found.")
         return
-    
+
     file_info = context.user_data['files'][-1]
     input_path = file_info['path']
     total_pages = context.user_data.get('total_pages', 0)
-    
-    status_msg = await update.message.reply_text("⏳ Splitting PDF...")
-    
+    split_info = context.user_data.get('split_info', {'pages': total_pages, 'bookmarks': []})
+    mode = context.user_data.get('split_mode', 'extract')
+    base_name = os.path.splitext(file_info['name'])[0]
+
+    status_msg = await send_status(message, "⏳ Splitting PDF...")
+    workspace = create_workspace(update.effective_user.id)
+
     try:
-        # Parse page numbers
-        pages_to_extract = parse_page_ranges(pages_input, total_pages)
-        
-        if not pages_to_extract:
+        # Parts are written by separate worker calls; give them a path to
+        # open rather than pickling the whole document for each part
+        source = spill_input(input_path, workspace)
+        annotate(pages=total_pages, mode=mode)
+
+        if mode == 'size':
+            max_mb = parse_size_mb(user_input)
+            if max_mb is None:
+                await status_msg.edit_text("❌ Please send the size in MB as a number greater than 0, e.g. 20.")
+                return
+            parts = await run_in_process(plan_size_parts, source, int(max_mb * 1024 * 1024))
+        else:
+            parts = plan_parts(mode, user_input, split_info)
+
+        if not parts:
             await status_msg.edit_text("❌ Invalid page format. Please try again.")
             return
-        
-        # Read PDF
-        reader = PdfReader(input_path)
-        
-        # Create output PDF
-        output_filename = generate_unique_filename('.pdf')
-        output_path = get_temp_path(output_filename)
-        
-        writer = PdfWriter()
-        
-        # Add selected pages
-        for page_num in pages_to_extract:
-            if 1 <= page_num <= len(reader.pages):
-                writer.add_page(reader.pages[page_num - 1])
-        
-        # Save output
-        with open(output_path, 'wb') as output_file:
-            writer.write(output_file)
-        
-        await status_msg.edit_text(
+
+        if len(parts) > config.SPLIT_MAX_PARTS:
+            await status_msg.edit_text(
+                f"❌ That would create {len(parts)} files. "
+                f"The limit is {config.SPLIT_MAX_PARTS}, please choose larger parts."
+            )
+            return
+
+        cache_key = result_key(file_info, 'split', mode=mode, parts=parts)
+        if len(parts) == 1:
+            filename = f"split_{file_info['name']}"
+        else:
+            filename = f"{base_name}_split.zip"
+
+        page_total = sum(count_range_pages(ranges) for _, ranges in parts)
+        done_text = (
             f"✅ PDF split successfully!\n\n"
-            f"Extracted {len(pages_to_extract)} pages."
+            f"Extracted {page_total} pages"
+            + (f" into {len(parts)} files." if len(parts) > 1 else ".")
         )
-        
-        # Send split file
-        with open(output_path, 'rb') as f:
-            await update.message.reply_document(
-                document=f,
-                filename=f"split_{file_info['name']}"
+
+        if await send_cached_result(message, cache_key, filename):
+            await status_msg.edit_text(done_text)
+            record_operation('split', 'cached')
+            finish_split(context)
+            return
+
+        if len(parts) == 1:
+            output_path = os.path.join(workspace, 'split.pdf')
+            with observe_phase('split', 'process'):
+                await run_in_process(extract_pages, source, output_path, parts[0][1])
+
+            await status_msg.edit_text(done_text)
+
+            # Send split file
+            with observe_phase('split', 'upload'), open(output_path, 'rb') as f:
+                sent = await message.reply_document(
+                    document=f,
+                    filename=filename
+                )
+            await store_result(cache_key, output_path, sent)
+            bytes_out = os.path.getsize(output_path)
+        else:
+            # Parts are zipped and sent while later ones are still being written
+            started = time.perf_counter()
+            bytes_out, upload_seconds, archives = await send_parts_zips(
+                message, source, parts, base_name, workspace, cache_key
             )
-        
+            observe_duration('split', 'process', time.perf_counter() - started - upload_seconds)
+            observe_duration('split', 'upload', upload_seconds)
+            if archives > 1:
+                done_text += f"\nSent as {archives} ZIP files to stay under the upload limit."
+            await status_msg.edit_text(done_text)
+
+        record_operation('split', 'success', get_input_size(input_path), bytes_out)
+
         # Cleanup
-        cleanup_files(input_path, output_path)
-        context.user_data['files'] = []
-        context.user_data['waiting_for'] = None
-        
+        finish_split(context)
+
+    except ValueError:
+        await status_msg.edit_text("❌ Invalid input. Please try again.")
     except Exception as e:
         await status_msg.edit_text(f"❌ Split failed: {str(e)}")
-        cleanup_files(input_path)
+        record_operation('split', 'error')
+        finish_split(context)
+    finally:
+        remove_workspace(workspace)
+
+def finish_split(context):
+    """Release the input and reset split state"""
+    release_session_files(context.user_data)
+    context.user_data.pop('split_info', None)
+    context.user_data.pop('split_mode', None)
+
+async def send_parts_zips(message, source, parts, base_name, workspace, cache_key):
+    """Write every part in the worker pool and send them in ZIP files, in order
+
+    A new ZIP is started before one would pass SPLIT_ZIP_MAX_MB, so every
+    file stays under Telegram's upload limit; a part larger than that on its
+    own gets a ZIP of its own. A result that fits one ZIP is cached. At most
+    WORKER_PROCESSES parts are in the pool at once, so other jobs' calls are
+    not queued behind every part. Returns (bytes sent, upload seconds,
+    number of ZIP files).
+    """
+    width = len(str(len(parts)))
+    limit = config.SPLIT_ZIP_MAX_MB * 1024 * 1024
+    bytes_out = 0
+    upload_seconds = 0
+    archives = []  # [zip_path, first_part, last_part]
+    archive = None
+    slots = asyncio.Semaphore(config.WORKER_PROCESSES)
+
+    async def write_part(index, ranges):
+        part_path = os.path.join(workspace, f"part_{index}.pdf")
+        async with slots:
+            await run_in_process(extract_pages, source, part_path, ranges)
+        return part_path
+
+    async def send(zip_path, first, last, only=False):
+        nonlocal bytes_out, upload_seconds
+        filename = f"{base_name}_split.zip" if only else f"{base_name}_split_{first}-{last}.zip"
+        upload_started = time.perf_counter()
+        with open(zip_path, 'rb') as f:
+            sent = await message.reply_document(document=f, filename=filename)
+        upload_seconds += time.perf_counter() - upload_started
+        bytes_out += os.path.getsize(zip_path)
+        if only:
+            await store_result(cache_key, zip_path, sent)
+        os.remove(zip_path)
+
+    tasks = [
+        asyncio.ensure_future(write_part(index, ranges))
+        for index, (_, ranges) in enumerate(parts, 1)
+    ]
 
-def parse_page_ranges(page_string, max_pages):
-    """Parse page ranges like '1-5, 8, 10-15' into list of page numbers"""
-    pages = set()
-    
     try:
-        # Split by comma
-        parts = page_string.split(',')
-        
-        for part in parts:
-            part = part.strip()
-            
-            # Check if it's a range
-            if '-' in part:
-                start, end = part.split('-')
-                start = int(start.strip())
-                end = int(end.strip())
-                
-                if start > end:
-                    start, end = end, start
-                
-                pages.update(range(start, end + 1))
-            else:
-                # Single page
-                pages.add(int(part))
-        
-        # Filter valid pages
-        valid_pages = sorted([p for p in pages if 1 <= p <= max_pages])
-        return valid_pages
-        
-    except:
-        return []
\ No newline at end of file
+        for index, ((label, _), task) in enumerate(zip(parts, tasks), 1):
+            part_path = await task
+            # PDFs are already compressed, so entries are stored as-is
+            if archive is not None and archive.fp.tell() + os.path.getsize(part_path) + 1024 > limit:
+                archive.close()
+                archive = None
+                await send(*archives[-1])
+            if archive is None:
+                zip_path = os.path.join(workspace, f"split_{len(archives) + 1}.zip")
+                archive = zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED)
+                archives.append([zip_path, index, index])
+            archive.write(part_path, f"{base_name}_{index:0{width}d}_{label}.pdf")
+            archives[-1][2] = index
+            os.remove(part_path)
+        archive.close()
+        archive = None
+        await send(*archives[-1], only=len(archives) == 1)
+    finally:
+        if archive is not None:
+            archive.close()
+        for task in tasks:
+            task.cancel()
+    return bytes_out, upload_seconds, len(archives)
@@ -1,15 +1,17 @@
+import asyncio
+import io
+import logging
 import os
+import shutil
+import time
 import uuid
-from pathlib import Path
 import config
 
-def generate_unique_filename(extension='.pdf'):
-    """Generate unique filename with UUID"""
-    return f"{uuid.uuid4()}{extension}"
+logger = logging.getLogger(__name__)
 
 def get_file_size_mb(filepath):
     """Get file size in MB"""
-    return os.path.getsize(filepath) / (1024 * 1024)
+    return get_input_size(filepath) / (1024 * 1024)
 
 def validate_file_size(filepath, max_size_mb=None):
     """Check if file size is within limits"""
@@ -19,8 +21,138 @@ def validate_file_size(filepath, max_size_mb=None):
     size_mb = get_file_size_mb(filepath)
     return size_mb <= max_size_mb, size_mb
 
+# Small uploads stay in memory under a virtual path instead of touching disk
+MEMORY_PREFIX = 'memory://'
+_memory_inputs = {}  # virtual path -> bytes
+
+def is_memory_input(path):
+    return path.startswith(MEMORY_PREFIX)
+
+def input_exists(path):
+    if is_memory_input(path):
+        return path in _memory_inputs
+    return os.path.exists(path)
+
+def get_input_size(path):
+    """Size in bytes of an upload, wherever it is held"""
+    if is_memory_input(path):
+        return len(_memory_inputs[path])
+    return os.path.getsize(path)
+
+def get_input_source(path):
+    """What worker functions receive: the bytes of an in-memory upload, otherwise its path"""
+    if is_memory_input(path):
+        return _memory_inputs[path]
+    return path
+
+def open_input(path):
+    """Open an upload for reading as a binary file-like object"""
+    if is_memory_input(path):
+        return io.BytesIO(_memory_inputs[path])
+    return open(path, 'rb')
+
+def spill_input(path, directory):
+    """Give tools that need a real file (Ghostscript, LibreOffice) or repeated worker calls a path on disk"""
+    if not is_memory_input(path):
+        return path
+    disk_path = os.path.join(directory, path[len(MEMORY_PREFIX):])
+    with open(disk_path, 'wb') as f:
+        f.write(_memory_inputs[path])
+    return disk_path
+
+def _memory_in_use():
+    return sum(len(data) for data in _memory_inputs.values())
+
+# Inputs shared between sessions, keyed by Telegram file_unique_id
+_shared_inputs = {}  # (file_unique_id, extension) -> {'path': ..., 'refs': ...}
+_shared_paths = {}   # path -> (file_unique_id, extension)
+_download_locks = {}
+
+async def acquire_shared_input(file_unique_id, extension, get_file, file_size=0):
+    """Get a local copy of an uploaded file, downloading it only once
+    
+    Files under IN_MEMORY_MAX_MB are kept in memory while the total stays
+    within IN_MEMORY_TOTAL_MB; anything else is downloaded to disk.
+    Every call adds a reference; cleanup_file releases it and the file is
+    deleted when the last session using it is done.
+    With persisted sessions every upload gets its own file in the blob area
+    instead, since the session (and its next step) may outlive this process.
+    Returns (path, reused).
+    """
+    if config.SESSION_BACKEND != 'memory':
+        return await download_blob(file_unique_id, extension, get_file), False
+    
+    key = (file_unique_id, extension)
+    lock = _download_locks.setdefault(key, asyncio.Lock())
+    
+    async with lock:
+        entry = _shared_inputs.get(key)
+        if entry and input_exists(entry['path']):
+            entry['refs'] += 1
+            return entry['path'], True
+        
+        file = await get_file()
+        in_memory = (
+            0 < file_size <= config.IN_MEMORY_MAX_MB * 1024 * 1024
+            and _memory_in_use() + file_size <= config.IN_MEMORY_TOTAL_MB * 1024 * 1024
+        )
+        
+        if in_memory:
+            path = f"{MEMORY_PREFIX}input_{file_unique_id}{extension}"
+            buffer = io.BytesIO()
+            await file.download_to_memory(buffer)
+            _memory_inputs[path] = buffer.getvalue()
+        else:
+            path = get_temp_path(f"input_{file_unique_id}{extension}")
+            partial_path = path + '.part'
+            try:
+                await file.download_to_drive(partial_path)
+                os.replace(partial_path, path)
+            except Exception:
+                cleanup_file(partial_path)
+                raise
+        
+        _shared_inputs[key] = {'path': path, 'refs': 1}
+        _shared_paths[path] = key
+        return path, False
+
+async def download_blob(file_unique_id, extension, get_file):
+    """Download an upload into the shared blob area, visible to every replica"""
+    file = await get_file()
+    path = os.path.join(config.BLOB_DIR, f"{file_unique_id}_{uuid.uuid4().hex[:12]}{extension}")
+    partial_path = path + '.part'
+    try:
+        await file.download_to_drive(partial_path)
+        os.replace(partial_path, path)
+    except Exception:
+        _delete_file(partial_path)
+        raise
+    return path
+
+def release_shared_input(filepath):
+    """Drop one reference to a shared input; returns False if the path is not shared"""
+    key = _shared_paths.get(filepath)
+    if key is None:
+        return False
+    
+    entry = _shared_inputs[key]
+    entry['refs'] -= 1
+    if entry['refs'] <= 0:
+        del _shared_inputs[key]
+        del _shared_paths[filepath]
+        _download_locks.pop(key, None)
+        _delete_file(filepath)
+    return True
+
 def cleanup_file(filepath):
-    """Delete a file safely"""
+    """Delete a file safely, or release it if other sessions share it"""
+    if release_shared_input(filepath):
+        return True
+    return _delete_file(filepath)
+
+def _delete_file(filepath):
+    if is_memory_input(filepath):
+        return _memory_inputs.pop(filepath, None) is not None
     try:
         if os.path.exists(filepath):
             os.remove(filepath)
@@ -34,10 +166,186 @@ def cleanup_files(*filepaths):
     for filepath in filepaths:
         cleanup_file(filepath)
 
+def release_session_files(user_data):
+    """Release every upload a session holds; calling it twice releases nothing twice"""
+    files = user_data.get('files') or []
+    # Detach the entries first so no later path can release them again
+    user_data['files'] = []
+    user_data['waiting_for'] = None
+    for file_info in files:
+        cleanup_file(file_info['path'])
+
 def get_temp_path(filename):
     """Get full path for temp file"""
     return os.path.join(config.TEMP_DIR, filename)
 
+# Per-job workspaces
+
+def create_workspace(user_id):
+    """Create a private directory for one job's intermediate and output files"""
+    path = os.path.join(config.WORKSPACE_DIR, f"{user_id}_{uuid.uuid4().hex}")
+    os.makedirs(path)
+    return path
+
+def remove_workspace(path):
+    """Delete a job workspace and everything in it"""
+    shutil.rmtree(path, ignore_errors=True)
+
+# Disk quotas
+
+def get_dir_size(path):
+    """Total size in bytes of all files below a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+# Size of TEMP_DIR, measured in a thread every TEMP_USAGE_INTERVAL_SECONDS so
+# that quota checks and metrics never walk the tree on the event loop, plus
+# the uploads admitted since the last measurement
+_temp_usage = {'measured': 0, 'admitted': 0}
+
+def get_temp_usage():
+    """Bytes used by TEMP_DIR as of the last measurement, plus uploads admitted since"""
+    return _temp_usage['measured'] + _temp_usage['admitted']
+
+async def measure_temp_usage():
+    """Walk TEMP_DIR in a thread and remember its size"""
+    size = await asyncio.to_thread(get_dir_size, config.TEMP_DIR)
+    _temp_usage['measured'] = size
+    _temp_usage['admitted'] = 0
+    return size
+
+async def run_temp_usage_monitor():
+    """Keep the measured size of TEMP_DIR current"""
+    while True:
+        try:
+            await measure_temp_usage()
+        except Exception as e:
+            logger.error(f"Measuring temp storage failed: {e}")
+        await asyncio.sleep(config.TEMP_USAGE_INTERVAL_SECONDS)
+
+def get_user_usage(user_files):
+    """Bytes held on disk by a user's pending uploads"""
+    return sum(
+        get_input_size(f['path']) for f in user_files if input_exists(f['path'])
+    )
+
+def check_quota(user_files, incoming_bytes):
+    """Return an error message if an upload would exceed a disk quota, else None"""
+    user_limit = config.USER_QUOTA_MB * 1024 * 1024
+    if get_user_usage(user_files) + incoming_bytes > user_limit:
+        return (
+            f"You already have {len(user_files)} file(s) waiting, up to {config.USER_QUOTA_MB} MB per user.\n"
+            f"Process them first, or wait {config.UPLOAD_TTL_MINUTES:.0f} minutes for them to expire."
+        )
+    
+    global_limit = config.STORAGE_QUOTA_MB * 1024 * 1024
+    if get_temp_usage() + incoming_bytes > global_limit:
+        return "The bot is out of storage right now. Please try again in a few minutes."
+    
+    _temp_usage['admitted'] += incoming_bytes
+    return None
+
+# Expiry and orphan cleanup
+
+def expire_idle_uploads(user_data, now=None):
+    """Drop a user's uploads that have waited longer than the upload TTL"""
+    now = now or time.time()
+    files = user_data.get('files') or []
+    cutoff = now - config.UPLOAD_TTL_MINUTES * 60
+    
+    expired = [f for f in files if f.get('uploaded_at', now) < cutoff]
+    if not expired:
+        return 0
+    
+    user_data['files'] = [f for f in files if f not in expired]
+    if not user_data['files']:
+        user_data['waiting_for'] = None
+    for file_info in expired:
+        cleanup_file(file_info['path'])
+    return len(expired)
+
+def sweep_workspaces(max_age_seconds):
+    """Remove job workspaces left behind by crashed or killed jobs"""
+    if not os.path.isdir(config.WORKSPACE_DIR):
+        return 0
+    
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for name in os.listdir(config.WORKSPACE_DIR):
+        path = os.path.join(config.WORKSPACE_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                remove_workspace(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+def sweep_blobs(max_age_seconds):
+    """Remove uploads in the blob area that no session has used for a long time"""
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for name in os.listdir(config.BLOB_DIR):
+        path = os.path.join(config.BLOB_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+def cleanup_orphans():
+    """Delete temp files left over from a previous run
+    
+    Uploads and workspaces belong to sessions that no longer exist after a
+    restart. The result cache, LibreOffice profiles and the blob area (used
+    by persisted sessions) are kept.
+    """
+    keep = {
+        os.path.basename(config.RESULT_CACHE_DIR),
+        os.path.basename(config.OFFICE_PROFILE_DIR),
+        os.path.basename(config.BLOB_DIR)
+    }
+    removed = 0
+    for name in os.listdir(config.TEMP_DIR):
+        if name in keep:
+            continue
+        path = os.path.join(config.TEMP_DIR, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            _delete_file(path)
+        removed += 1
+    os.makedirs(config.WORKSPACE_DIR, exist_ok=True)
+    os.makedirs(config.WORKER_CANCEL_DIR, exist_ok=True)
+    return removed
+
+async def run_storage_janitor(application):
+    """Periodically expire idle uploads and stale workspaces"""
+    while True:
+        await asyncio.sleep(config.SWEEP_INTERVAL_SECONDS)
+        try:
+            expired = 0
+            for user_id, user_data in list(application.user_data.items()):
+                count = expire_idle_uploads(user_data)
+                if count:
+                    expired += count
+                    application.mark_data_for_update_persistence(user_ids=user_id)
+            stale = sweep_workspaces(config.WORKSPACE_MAX_AGE_MINUTES * 60)
+            # Blobs outlive their upload TTL only while a job is still using them
+            stale += sweep_blobs((config.UPLOAD_TTL_MINUTES + config.WORKSPACE_MAX_AGE_MINUTES) * 60)
+            if expired or stale:
+                logger.info(f"Storage janitor removed {expired} idle uploads and {stale} stale workspaces or blobs")
+        except Exception as e:
+            logger.error(f"Storage janitor failed: {e}")
+
 def validate_pdf(filepath):
     """Check if file is a valid PDF"""
     try:
@@ -45,4 +353,4 @@ def validate_pdf(filepath):
             header = f.read(5)
             return header == b'%PDF-'
     except:
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,92 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from aiohttp import web
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+import config
+from utils import workers
+from utils.scheduler import scheduler
+from utils.file_utils import get_temp_usage
+from utils.tracing import span, annotate
+
+OPERATIONS = Counter(
+    'pdfbot_operations', 'Finished operations by outcome',
+    ['operation', 'outcome']
+)
+PHASE_SECONDS = Histogram(
+    'pdfbot_phase_duration_seconds', 'Time spent per operation phase',
+    ['operation', 'phase'],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+BYTES_IN = Counter('pdfbot_input_bytes', 'Bytes received per operation', ['operation'])
+BYTES_OUT = Counter('pdfbot_output_bytes', 'Bytes sent back per operation', ['operation'])
+COMPRESSION_RATIO = Histogram(
+    'pdfbot_compression_ratio', 'Compressed size divided by original size',
+    ['level', 'backend'],
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.5)
+)
+QUEUE_DEPTH = Gauge('pdfbot_queue_depth', 'Jobs waiting for a slot', ['resource'])
+JOBS_RUNNING = Gauge('pdfbot_jobs_running', 'Jobs holding a slot', ['resource'])
+TEMP_DISK_BYTES = Gauge('pdfbot_temp_disk_bytes', 'Disk used by the temp directory')
+LOOP_LAG = Histogram(
+    'pdfbot_event_loop_lag_seconds', 'How late the event loop wakes up',
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+WORKER_PROCESSES = Gauge('pdfbot_worker_processes', 'Size of the worker pool')
+WORKER_BUSY = Gauge('pdfbot_worker_busy', 'Worker processes running a task')
+WORKER_BACKLOG = Gauge('pdfbot_worker_backlog', 'Tasks waiting for a free worker process')
+STARTUP_SECONDS = Gauge('pdfbot_startup_seconds', 'Time taken by each start-up phase', ['phase'])
+WORKER_IMPORT_SECONDS = Gauge(
+    'pdfbot_worker_import_seconds', 'Slowest first import of a pre-warmed library in a worker', ['module']
+)
+
+for resource in scheduler.limits:
+    QUEUE_DEPTH.labels(resource).set_function(lambda r=resource: scheduler.queue_depth(r))
+    JOBS_RUNNING.labels(resource).set_function(lambda r=resource: scheduler.running[r])
+
+TEMP_DISK_BYTES.set_function(get_temp_usage)  # measured in the background, never on a scrape
+WORKER_PROCESSES.set(config.WORKER_PROCESSES)
+WORKER_BUSY.set_function(lambda: min(workers.tasks_in_flight, config.WORKER_PROCESSES))
+WORKER_BACKLOG.set_function(lambda: max(workers.tasks_in_flight - config.WORKER_PROCESSES, 0))
+
+@contextmanager
+def observe_phase(operation, phase, **attributes):
+    """Time one phase (download, process, upload) of an operation
+    
+    The phase is also written as a trace span of the current job.
+    """
+    start = time.perf_counter()
+    try:
+        with span(phase, operation, **attributes):
+            yield
+    finally:
+        PHASE_SECONDS.labels(operation, phase).observe(time.perf_counter() - start)
+
+def observe_duration(operation, phase, seconds):
+    """Record a phase whose time was measured by the caller"""
+    PHASE_SECONDS.labels(operation, phase).observe(seconds)
+
+def record_operation(operation, outcome, bytes_in=0, bytes_out=0):
+    """Count a finished operation and the bytes it moved"""
+    OPERATIONS.labels(operation, outcome).inc()
+    annotate(outcome=outcome, bytes_in=bytes_in or None, bytes_out=bytes_out or None)
+    if bytes_in:
+        BYTES_IN.labels(operation).inc(bytes_in)
+    if bytes_out:
+        BYTES_OUT.labels(operation).inc(bytes_out)
+
+def record_compression(level, backend, original_size, compressed_size):
+    if original_size:
+        COMPRESSION_RATIO.labels(level, backend).observe(compressed_size / original_size)
+
+async def monitor_event_loop(interval=1.0):
+    """Measure how far past its deadline a sleep wakes up"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(loop.time() - start - interval, 0))
+
+async def metrics_handler(request):
+    """Prometheus scrape endpoint"""
+    return web.Response(body=generate_latest(), headers={'Content-Type': CONTENT_TYPE_LATEST})
@@ -0,0 +1,257 @@
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import config
+
+logger = logging.getLogger(__name__)
+
+# Debian installs the UNO bridge (python3-uno) outside our interpreter's site-packages
+if config.LIBREOFFICE_PYTHON_PATH and config.LIBREOFFICE_PYTHON_PATH not in sys.path:
+    sys.path.append(config.LIBREOFFICE_PYTHON_PATH)
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+except ImportError:
+    uno = None
+
+class OfficeConversionError(Exception):
+    """Raised when LibreOffice fails or times out on a document"""
+
+def _free_port():
+    """Ask the OS for an unused local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _property(name, value):
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+class OfficeInstance:
+    """One LibreOffice process with its own user profile
+
+    With the UNO bridge available the process stays running and receives
+    documents over a local socket. Without it, each conversion runs a
+    short-lived soffice against this instance's already initialised
+    profile, which still allows several conversions at once.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.profile_dir = os.path.join(config.OFFICE_PROFILE_DIR, f'profile_{index}')
+        self.port = None
+        self.process = None
+
+    @property
+    def profile_url(self):
+        return 'file://' + os.path.abspath(self.profile_dir)
+
+    def is_alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self):
+        """Launch the listening LibreOffice process and wait until it accepts connections"""
+        os.makedirs(self.profile_dir, exist_ok=True)
+
+        if uno is None:
+            return
+
+        self.port = _free_port()
+        self.process = await asyncio.create_subprocess_exec(
+            config.LIBREOFFICE_BINARY,
+            '--headless',
+            '--invisible',
+            '--nologo',
+            '--norestore',
+            '--nodefault',
+            f'-env:UserInstallation={self.profile_url}',
+            f'--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext',
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + config.LIBREOFFICE_START_TIMEOUT
+        while loop.time() < deadline:
+            if not self.is_alive():
+                break
+            try:
+                _, writer = await asyncio.open_connection('127.0.0.1', self.port)
+                writer.close()
+                logger.info(f"LibreOffice instance {self.index} listening on port {self.port}")
+                return
+            except OSError:
+                await asyncio.sleep(0.5)
+
+        await self.stop()
+        raise OfficeConversionError(f"LibreOffice instance {self.index} failed to start")
+
+    async def stop(self):
+        """Terminate the LibreOffice process if it is running"""
+        if self.is_alive():
+            self.process.kill()
+            await self.process.wait()
+        self.process = None
+
+    async def restart(self):
+        await self.stop()
+        await self.start()
+
+    async def convert(self, input_path, output_dir):
+        """Convert a document to PDF inside output_dir and return the output path"""
+        if uno is None:
+            return await self._convert_with_subprocess(input_path, output_dir)
+
+        if not self.is_alive():
+            logger.warning(f"LibreOffice instance {self.index} died, restarting")
+            await self.restart()
+
+        output_path = os.path.join(
+            output_dir,
+            os.path.splitext(os.path.basename(input_path))[0] + '.pdf'
+        )
+
+        try:
+            await asyncio.wait_for(
+                asyncio.to_thread(self._convert_over_uno, input_path, output_path),
+                timeout=config.LIBREOFFICE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            # Killing the process also unblocks the UNO call in the thread
+            await self.restart()
+            raise OfficeConversionError("Conversion timed out")
+        except asyncio.CancelledError:
+            # The job was cancelled; the instance is restarted on its next use
+            await self.stop()
+            raise
+        except Exception as e:
+            if not self.is_alive():
+                await self.restart()
+            raise OfficeConversionError(str(e))
+
+        return output_path
+
+    def _convert_over_uno(self, input_path, output_path):
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            'com.sun.star.bridge.UnoUrlResolver', local_context
+        )
+        context = resolver.resolve(
+            f'uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext'
+        )
+        desktop = context.ServiceManager.createInstanceWithContext(
+            'com.sun.star.frame.Desktop', context
+        )
+
+        document = desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(os.path.abspath(input_path)),
+            '_blank',
+            0,
+            (_property('Hidden', True),)
+        )
+        if document is None:
+            raise OfficeConversionError("LibreOffice could not open the document")
+
+        try:
+            document.storeToURL(
+                uno.systemPathToFileUrl(os.path.abspath(output_path)),
+                (_property('FilterName', 'writer_pdf_Export'),)
+            )
+        finally:
+            document.close(True)
+
+    async def _convert_with_subprocess(self, input_path, output_dir):
+        process = await asyncio.create_subprocess_exec(
+            config.LIBREOFFICE_BINARY,
+            '--headless',
+            f'-env:UserInstallation={self.profile_url}',
+            '--convert-to',
+            'pdf',
+            '--outdir',
+            output_dir,
+            input_path,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+
+        try:
+            _, stderr = await asyncio.wait_for(
+                process.communicate(),
+                timeout=config.LIBREOFFICE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise OfficeConversionError("Conversion timed out")
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+
+        output_path = os.path.join(
+            output_dir,
+            os.path.splitext(os.path.basename(input_path))[0] + '.pdf'
+        )
+        if process.returncode != 0 or not os.path.exists(output_path):
+            raise OfficeConversionError(
+                stderr.decode(errors='replace').strip() or "LibreOffice produced no output"
+            )
+
+        return output_path
+
+class OfficePool:
+    """A fixed set of LibreOffice instances handing out one per conversion"""
+
+    def __init__(self, size):
+        self.size = size
+        self.instances = []
+        self.idle = None
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        async with self._start_lock:
+            if self.idle is not None:
+                return
+
+            idle = asyncio.Queue()
+            for index in range(self.size):
+                instance = OfficeInstance(index)
+                try:
+                    await instance.start()
+                except OfficeConversionError as e:
+                    # Left to be restarted when it is first used
+                    logger.error(str(e))
+                self.instances.append(instance)
+                idle.put_nowait(instance)
+            self.idle = idle
+
+    async def stop(self):
+        for instance in self.instances:
+            await instance.stop()
+        self.instances = []
+        self.idle = None
+
+    async def convert_to_pdf(self, input_path, output_path):
+        """Convert a document to PDF at output_path using the next free instance"""
+        await self.start()
+
+        # A private output directory keeps same-named inputs from colliding
+        output_dir = tempfile.mkdtemp(prefix='office_', dir=os.path.dirname(output_path))
+        instance = await self.idle.get()
+        try:
+            converted_path = await instance.convert(input_path, output_dir)
+            shutil.move(converted_path, output_path)
+        finally:
+            self.idle.put_nowait(instance)
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+        return output_path
+
+office_pool = OfficePool(config.LIBREOFFICE_INSTANCES)
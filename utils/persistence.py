@@ -0,0 +1,230 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from telegram.ext import BasePersistence, PersistenceInput
+from utils.file_utils import expire_idle_uploads
+import config
+
+logger = logging.getLogger(__name__)
+
+class SQLiteStore:
+    """Sessions in a local SQLite file, for a single host"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, "
+            "version INTEGER NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _load(self, user_id):
+        with self._lock:
+            return self._db.execute(
+                "SELECT data, version FROM sessions WHERE user_id = ?", (user_id,)
+            ).fetchone()
+
+    def _save_many(self, entries):
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                versions = {}
+                for user_id, data in entries.items():
+                    versions[user_id] = self._db.execute(
+                        "INSERT INTO sessions (user_id, data, version, updated_at) VALUES (?, ?, 1, ?) "
+                        "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, "
+                        "version = sessions.version + 1, updated_at = excluded.updated_at "
+                        "RETURNING version",
+                        (user_id, data, now)
+                    ).fetchone()[0]
+                # Sessions nobody has touched for a long time
+                self._db.execute(
+                    "DELETE FROM sessions WHERE updated_at < ?", (now - config.SESSION_TTL_HOURS * 3600,)
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            return versions
+
+    def _delete(self, user_id):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    async def load(self, user_id):
+        """Return (data, version) for a user, or None"""
+        return await asyncio.to_thread(self._load, user_id)
+
+    async def save_many(self, entries):
+        """Write {user_id: data} in one transaction; return the new versions"""
+        return await asyncio.to_thread(self._save_many, entries)
+
+    async def delete(self, user_id):
+        await asyncio.to_thread(self._delete, user_id)
+
+    async def close(self):
+        with self._lock:
+            self._db.close()
+
+class RedisStore:
+    """Sessions in Redis (or a compatible server), shared by all replicas"""
+
+    def __init__(self, url):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+
+    def _key(self, user_id):
+        return f"{config.REDIS_PREFIX}session:{user_id}"
+
+    async def load(self, user_id):
+        data, version = await self._redis.hmget(self._key(user_id), 'data', 'version')
+        if data is None:
+            return None
+        return data.decode('utf-8'), int(version)
+
+    async def save_many(self, entries):
+        ttl = int(config.SESSION_TTL_HOURS * 3600)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for user_id, data in entries.items():
+                key = self._key(user_id)
+                pipe.hset(key, 'data', data)
+                pipe.hincrby(key, 'version', 1)
+                pipe.expire(key, ttl)
+            results = await pipe.execute()
+        # Every third result is the version from HINCRBY
+        return dict(zip(entries, results[1::3]))
+
+    async def delete(self, user_id):
+        await self._redis.delete(self._key(user_id))
+
+    async def close(self):
+        await self._redis.aclose()
+
+def create_store(backend):
+    if backend == 'sqlite':
+        return SQLiteStore(config.SESSION_DB)
+    if backend == 'redis':
+        return RedisStore(config.REDIS_URL)
+    raise ValueError(f"Unknown session backend: {backend}")
+
+class SessionPersistence(BasePersistence):
+    """Keep user_data (uploaded files, waiting_for, split state) in a shared store
+
+    Sessions are loaded on a user's first update and reloaded whenever another
+    replica has written a newer version, so any replica can take a user's next
+    step. Changes are written in batches every SESSION_FLUSH_INTERVAL seconds
+    instead of on every update.
+    """
+
+    def __init__(self, store):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=config.SESSION_FLUSH_INTERVAL
+        )
+        self.store = store
+        self._versions = {}  # user_id -> version this replica last read or wrote
+        self._pending = {}   # user_id -> serialized data waiting to be written
+        self._write_lock = asyncio.Lock()
+
+    async def get_user_data(self):
+        # Loaded lazily in refresh_user_data instead of all at start-up
+        return {}
+
+    async def refresh_user_data(self, user_id, user_data):
+        """Replace the local session with the stored one if another replica changed it"""
+        if user_id in self._pending:
+            return
+        try:
+            row = await self.store.load(user_id)
+        except Exception as e:
+            logger.warning(f"Could not load session of user {user_id}: {e}")
+            return
+        if row is None:
+            return
+
+        data, version = row
+        if version > self._versions.get(user_id, 0):
+            user_data.clear()
+            user_data.update(json.loads(data))
+            self._versions[user_id] = version
+            # The janitor only sees loaded sessions; uploads may have expired meanwhile
+            expire_idle_uploads(user_data)
+
+    async def update_user_data(self, user_id, data):
+        self._pending[user_id] = json.dumps(data)
+        # The application updates all changed users at once; let the others
+        # stage their data so a single write covers the whole batch
+        await asyncio.sleep(0)
+        await self._write_pending()
+
+    async def _write_pending(self):
+        async with self._write_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                self._versions.update(await self.store.save_many(batch))
+            except Exception as e:
+                logger.error(f"Could not save {len(batch)} sessions: {e}")
+                # Retry with the next batch unless newer data has been staged since
+                self._pending = {**batch, **self._pending}
+
+    async def drop_user_data(self, user_id):
+        self._pending.pop(user_id, None)
+        self._versions.pop(user_id, None)
+        await self.store.delete(user_id)
+
+    async def flush(self):
+        await self._write_pending()
+        await self.store.close()
+
+    # Only user_data is persisted
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+def build_persistence():
+    """Persistence for the configured SESSION_BACKEND, or None to keep sessions in memory"""
+    if config.SESSION_BACKEND == 'memory':
+        return None
+    return SessionPersistence(create_store(config.SESSION_BACKEND))
@@ -0,0 +1,73 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import config
+
+logger = logging.getLogger(__name__)
+
+# Jobs still to be profiled, set by the admin /profile command
+_remaining = 0
+
+def enable(count):
+    """Profile the worker code of the next count jobs"""
+    global _remaining
+    _remaining = max(count, 0)
+
+def remaining():
+    return _remaining
+
+def claim():
+    """Take one profiling slot for a starting job, if any are left"""
+    global _remaining
+    if _remaining <= 0:
+        return False
+    _remaining -= 1
+    return True
+
+def profile_path(job):
+    """Where the next worker call of a job dumps its profile"""
+    os.makedirs(config.PROFILE_DIR, exist_ok=True)
+    return os.path.join(config.PROFILE_DIR, f"{job.trace_id}_{len(job.profile)}.prof")
+
+def profiled_call(func, output_path, args, kwargs):
+    """Run func under cProfile inside a worker process and dump the stats"""
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(output_path)
+
+def build_report(job):
+    """Combine a job's worker profiles into a text report and delete the dumps"""
+    paths = [path for path in job.profile if os.path.exists(path)]
+    if not paths:
+        return None
+
+    out = io.StringIO()
+    out.write(f"Job {job.trace_id} ({job.operation})\n")
+    out.write(f"Attributes: {job.attributes}\n")
+    out.write(f"Worker calls profiled: {len(paths)}\n\n")
+    try:
+        stats = pstats.Stats(*paths, stream=out)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(config.PROFILE_TOP_FUNCTIONS)
+    finally:
+        for path in paths:
+            os.remove(path)
+    return out.getvalue()
+
+async def send_report(bot, job):
+    """Send a finished job's profile to the admin as a text document"""
+    try:
+        report = build_report(job)
+        if report is None:
+            return
+        await bot.send_document(
+            chat_id=config.ADMIN_USER_ID,
+            document=report.encode('utf-8'),
+            filename=f"profile_{job.operation}_{job.trace_id}.txt",
+            caption=f"🔬 Profile of {job.operation} ({_remaining} more to go)"
+        )
+    except Exception as e:
+        logger.warning(f"Could not send profile for job {job.trace_id}: {e}")
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import time
+from telegram.error import BadRequest, RetryAfter
+from utils.scheduler import CANCEL_MARKUP
+import config
+
+logger = logging.getLogger(__name__)
+
+# chat_id -> loop time before which that chat's status must not be edited again
+_chat_next_edit = {}
+
+class EditBudget:
+    """Token bucket shared by every progress message the bot edits"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+edit_budget = EditBudget(config.PROGRESS_GLOBAL_RATE, config.PROGRESS_GLOBAL_BURST)
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+class Progress:
+    """Live progress for a job, shown by editing its status message
+
+    Services call update(done, total, phase) as often as they like. Only the
+    latest state is kept, and the message is edited at most once per
+    PROGRESS_MIN_INTERVAL per chat and within the bot-wide edit budget.
+    Use as an async context manager so pending edits stop before the
+    caller writes its final status. reply_markup (by default the Cancel
+    button) is kept on the message through every edit.
+    """
+
+    def __init__(self, status_msg, title, reply_markup=CANCEL_MARKUP):
+        self.status_msg = status_msg
+        self.title = title
+        self.reply_markup = reply_markup
+        self.chat_id = status_msg.chat_id
+        self.started = time.monotonic()
+        self.state = None
+        self.phase_started = self.started
+        self.phase_done = 0
+        self.shown = None
+        self._flush_task = None
+        self._watch_tasks = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def update(self, done, total, phase=None):
+        """Record the latest progress; the message catches up asynchronously"""
+        if self.state is None or self.state[2] != phase:
+            self.phase_started = time.monotonic()
+            self.phase_done = done
+        self.state = (done, total, phase)
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush())
+
+    def track(self, path):
+        """Follow a progress file written by a worker process"""
+        self._watch_tasks.append(asyncio.ensure_future(self._watch(path)))
+
+    def track_sum(self, paths, total, phase):
+        """Follow progress files of workers sharing a job, showing their summed progress"""
+        self._watch_tasks.append(asyncio.ensure_future(self._watch_sum(paths, total, phase)))
+
+    async def close(self):
+        for task in self._watch_tasks + [self._flush_task]:
+            if task is not None:
+                task.cancel()
+        self._watch_tasks = []
+        self._flush_task = None
+
+    def render(self):
+        done, total, phase = self.state
+        now = time.monotonic()
+        lines = [f"⏳ {self.title}"]
+
+        if total:
+            fraction = min(done / total, 1)
+            filled = int(fraction * 10)
+            lines.append(f"{phase + ': ' if phase else ''}{done}/{total}")
+            lines.append(f"{'▓' * filled}{'░' * (10 - filled)} {int(fraction * 100)}%")
+        elif phase:
+            lines.append(f"{phase}...")
+
+        timing = f"Elapsed {format_duration(now - self.started)}"
+        # ETA from the pace of the current phase only, as phases run at different speeds
+        phase_done = done - self.phase_done
+        if total and 0 < phase_done and done < total:
+            rate = (now - self.phase_started) / phase_done
+            timing += f" · ETA {format_duration(rate * (total - done))}"
+        lines.append(timing)
+
+        return "\n".join(lines)
+
+    async def _flush(self):
+        loop = asyncio.get_running_loop()
+        # Keep going while updates arrive during an edit, so the last state is shown
+        while self.state != self.shown:
+            wait = _chat_next_edit.get(self.chat_id, 0) - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await edit_budget.acquire()
+
+            state = self.state
+            _chat_next_edit[self.chat_id] = loop.time() + config.PROGRESS_MIN_INTERVAL
+            try:
+                await self.status_msg.edit_text(self.render(), reply_markup=self.reply_markup)
+            except RetryAfter as e:
+                _chat_next_edit[self.chat_id] = loop.time() + e.retry_after
+                continue
+            except BadRequest as e:
+                logger.debug(f"Progress edit skipped: {e}")
+            self.shown = state
+
+    async def _watch(self, path):
+        while True:
+            await asyncio.sleep(config.PROGRESS_POLL_INTERVAL)
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if tuple(state) != self.state:
+                self.update(*state)
+
+    async def _watch_sum(self, paths, total, phase):
+        while True:
+            await asyncio.sleep(config.PROGRESS_POLL_INTERVAL)
+            done = 0
+            for path in paths:
+                try:
+                    with open(path) as f:
+                        done += json.load(f)[0]
+                except (OSError, ValueError):
+                    continue
+            if (done, total, phase) != self.state:
+                self.update(done, total, phase)
@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import config
+from utils.file_utils import open_input
+
+logger = logging.getLogger(__name__)
+
+_connection = None
+# The index is used from worker threads; one at a time
+_lock = threading.Lock()
+
+def _db():
+    """Open the cache index on first use"""
+    global _connection
+    if _connection is None:
+        os.makedirs(config.RESULT_CACHE_DIR, exist_ok=True)
+        _connection = sqlite3.connect(
+            os.path.join(config.RESULT_CACHE_DIR, 'index.db'),
+            check_same_thread=False
+        )
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " file_id TEXT,"
+            " filename TEXT,"
+            " path TEXT,"
+            " size INTEGER,"
+            " created REAL,"
+            " accessed REAL)"
+        )
+    return _connection
+
+def hash_file(filepath):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open_input(filepath) as f:
+        for chunk in iter(lambda: f.read(config.CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def source_id(file_info):
+    """Identify an input by Telegram's file_unique_id, or by content if unknown"""
+    if file_info.get('unique_id'):
+        return file_info['unique_id']
+    return hash_file(file_info['path'])
+
+def result_key(sources, operation, **params):
+    """Build the cache key for an operation on one or more inputs"""
+    if isinstance(sources, dict):
+        sources = [sources]
+    payload = json.dumps({
+        'sources': [source_id(f) for f in sources],
+        'operation': operation,
+        'params': params
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _remove_entry(key, path):
+    _db().execute("DELETE FROM results WHERE key = ?", (key,))
+    if path and os.path.exists(path):
+        os.remove(path)
+
+def evict_expired():
+    """Drop entries older than the TTL, then least recently used ones over the size limit"""
+    db = _db()
+    cutoff = time.time() - config.RESULT_CACHE_TTL_HOURS * 3600
+    for key, path in db.execute("SELECT key, path FROM results WHERE created < ?", (cutoff,)).fetchall():
+        _remove_entry(key, path)
+
+    max_bytes = config.RESULT_CACHE_MAX_MB * 1024 * 1024
+    total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+    if total > max_bytes:
+        for key, path, size in db.execute("SELECT key, path, size FROM results ORDER BY accessed").fetchall():
+            _remove_entry(key, path)
+            total -= size
+            if total <= max_bytes:
+                break
+    db.commit()
+
+def lookup(key):
+    """Return the cached entry for a key, or None; blocking, call it from a thread"""
+    if not config.RESULT_CACHE_ENABLED:
+        return None
+
+    with _lock:
+        return _lookup(key)
+
+def _lookup(key):
+    db = _db()
+    row = db.execute(
+        "SELECT file_id, filename, path, created FROM results WHERE key = ?", (key,)
+    ).fetchone()
+    if row is None:
+        return None
+
+    file_id, filename, path, created = row
+    if created < time.time() - config.RESULT_CACHE_TTL_HOURS * 3600 or not os.path.exists(path):
+        _remove_entry(key, path)
+        db.commit()
+        return None
+
+    db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+    db.commit()
+    return {'file_id': file_id, 'filename': filename, 'path': path}
+
+async def send_cached_result(message, key, filename, caption=None):
+    """Reply with a cached result instead of recomputing it
+
+    The stored Telegram file_id is reused when the filename matches, so the
+    bytes are not uploaded again. Otherwise the cached copy is sent under the
+    requested name, which keeps other users' filenames private.
+    Returns True on a cache hit.
+    """
+    entry = await asyncio.to_thread(lookup, key)
+    if entry is None:
+        return False
+
+    try:
+        if entry['filename'] == filename and entry['file_id']:
+            await message.reply_document(document=entry['file_id'], caption=caption)
+        else:
+            with open(entry['path'], 'rb') as f:
+                await message.reply_document(document=f, filename=filename, caption=caption)
+    except Exception as e:
+        logger.warning(f"Cached result {key} could not be sent: {e}")
+        await asyncio.to_thread(_forget, key, entry['path'])
+        return False
+
+    return True
+
+def _forget(key, path):
+    with _lock:
+        _remove_entry(key, path)
+        _db().commit()
+
+def _store(key, output_path, file_id, filename):
+    cached_path = os.path.join(
+        config.RESULT_CACHE_DIR,
+        key + os.path.splitext(output_path)[1]
+    )
+    shutil.copyfile(output_path, cached_path)
+
+    now = time.time()
+    with _lock:
+        _db().execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, file_id, filename, cached_path, os.path.getsize(cached_path), now, now)
+        )
+        evict_expired()
+
+async def store_result(key, output_path, sent_message):
+    """Keep a finished result and the file_id Telegram assigned to it
+
+    The copy and the index update run in a thread, off the event loop.
+    """
+    if not config.RESULT_CACHE_ENABLED or sent_message is None or sent_message.document is None:
+        return
+
+    try:
+        await asyncio.to_thread(
+            _store, key, output_path, sent_message.document.file_id, sent_message.document.file_name
+        )
+    except Exception as e:
+        logger.warning(f"Could not cache result {key}: {e}")
@@ -0,0 +1,271 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+import config
+from utils import profiling
+from utils.tracing import job_trace, annotate
+
+logger = logging.getLogger(__name__)
+
+class JobScheduler:
+    """Admit jobs per resource class, round-robin across waiting users
+
+    Each resource class ('cpu', 'office', 'network', 'light') has its own
+    concurrency limit, so cheap jobs in the 'light' lane never wait behind
+    heavy conversions.
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.running = {resource: 0 for resource in limits}
+        # resource -> user_id -> deque of waiting futures
+        self.waiting = {resource: OrderedDict() for resource in limits}
+        # resource -> users in the order they get their next turn
+        self.turns = {resource: deque() for resource in limits}
+        # resource -> future resolved the next time its queue moves
+        self.moved = {resource: None for resource in limits}
+
+    def queue_depth(self, resource=None):
+        """Number of waiting jobs for one resource class, or all of them"""
+        resources = [resource] if resource else self.limits
+        return sum(
+            len(queue)
+            for r in resources
+            for queue in self.waiting[r].values()
+        )
+
+    def position(self, resource, future):
+        """1-based place of a waiting job in the round-robin order"""
+        queues = {user: list(queue) for user, queue in self.waiting[resource].items()}
+        turns = deque(self.turns[resource])
+        position = 0
+
+        while turns:
+            user = turns.popleft()
+            waiter = queues[user].pop(0)
+            if queues[user]:
+                turns.append(user)
+            if waiter.done():
+                continue
+            position += 1
+            if waiter is future:
+                return position
+        return 0
+
+    async def acquire(self, user_id, resource, on_queued=None):
+        """Wait for a slot
+
+        If the job has to wait, on_queued(position) is awaited with its place
+        in the queue, and again when that place changes, at most once per
+        PROGRESS_MIN_INTERVAL.
+        """
+        if self.running[resource] < self.limits[resource] and not self.turns[resource]:
+            self.running[resource] += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self.waiting[resource].setdefault(user_id, deque())
+        queue.append(future)
+        if len(queue) == 1:
+            self.turns[resource].append(user_id)
+
+        try:
+            if on_queued is None:
+                await future
+            shown = None
+            while not future.done():
+                position = self.position(resource, future)
+                if position != shown:
+                    shown = position
+                    await on_queued(position)
+                    await asyncio.wait([future], timeout=config.PROGRESS_MIN_INTERVAL)
+                else:
+                    await asyncio.wait([future, self._next_move(resource)], return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            # Cancelled, or on_queued failed: never leave a waiter behind
+            if future.done() and not future.cancelled():
+                # The slot was granted in the meantime
+                self.release(resource)
+            else:
+                future.cancel()
+                self._drop_cancelled(resource, user_id)
+            raise
+
+    def release(self, resource):
+        """Free a slot and hand it to the next user in turn"""
+        self.running[resource] -= 1
+        self._wake(resource)
+
+    def _next_move(self, resource):
+        if self.moved[resource] is None:
+            self.moved[resource] = asyncio.get_running_loop().create_future()
+        return self.moved[resource]
+
+    def _signal_move(self, resource):
+        moved, self.moved[resource] = self.moved[resource], None
+        if moved is not None and not moved.done():
+            moved.set_result(None)
+
+    def _wake(self, resource):
+        turns = self.turns[resource]
+        while turns and self.running[resource] < self.limits[resource]:
+            user = turns.popleft()
+            queue = self.waiting[resource][user]
+            future = queue.popleft()
+            if queue:
+                turns.append(user)
+            else:
+                del self.waiting[resource][user]
+
+            if future.done():
+                continue
+            self.running[resource] += 1
+            future.set_result(None)
+            self._signal_move(resource)
+
+    def _drop_cancelled(self, resource, user_id):
+        queue = self.waiting[resource].get(user_id)
+        if queue is None:
+            return
+        queue = deque(f for f in queue if not f.done())
+        if queue:
+            self.waiting[resource][user_id] = queue
+        else:
+            del self.waiting[resource][user_id]
+            self.turns[resource].remove(user_id)
+        self._signal_move(resource)
+
+    @asynccontextmanager
+    async def slot(self, user_id, resource, on_queued=None):
+        await self.acquire(user_id, resource, on_queued)
+        try:
+            yield
+        finally:
+            self.release(resource)
+
+scheduler = JobScheduler({
+    'cpu': config.JOB_LIMIT_CPU,
+    'office': config.JOB_LIMIT_OFFICE,
+    'network': config.JOB_LIMIT_NETWORK,
+    'light': config.JOB_LIMIT_LIGHT
+})
+
+# Inline button that cancels the job a status message belongs to
+CANCEL_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("✖ Cancel", callback_data="cancel_job")]])
+
+async def send_status(message, text, reply_markup=CANCEL_MARKUP):
+    """Reply with a job's status message, with a button to cancel the job"""
+    status_msg = await message.reply_text(text, reply_markup=reply_markup)
+    register_status(status_msg)
+    return status_msg
+
+class ActiveJob:
+    """A user's queued or running job, which the user can cancel"""
+
+    def __init__(self, user_id, task):
+        self.user_id = user_id
+        self.task = task
+        self.status_messages = []
+
+# user_id -> that user's queued and running jobs
+active_jobs = {}
+current_active_job = contextvars.ContextVar('current_active_job', default=None)
+
+def register_status(message):
+    """Mark message as the current job's status, to be updated if it is cancelled"""
+    job = current_active_job.get()
+    if job is not None:
+        job.status_messages.append(message)
+
+def cancel_jobs(user_id, message_id=None):
+    """Cancel a user's jobs, or only the one whose status message is message_id
+    
+    Cancellation runs the jobs' cleanup: worker calls are interrupted,
+    subprocesses killed and workspaces deleted. Returns how many jobs
+    were cancelled.
+    """
+    cancelled = 0
+    for job in list(active_jobs.get(user_id, ())):
+        if message_id is not None and all(m.message_id != message_id for m in job.status_messages):
+            continue
+        if job.task.cancel():
+            cancelled += 1
+    return cancelled
+
+async def run_job(update, context, resource, handler):
+    """Run a handler as a job the user can cancel with /cancel
+
+    A cancelled job ends quietly; its status messages say it was cancelled.
+    """
+    user_id = update.effective_user.id if update.effective_user else 0
+    job = ActiveJob(user_id, None)
+    # The job's task starts with a copy of this context, so it can find its ActiveJob
+    token = current_active_job.set(job)
+    job.task = asyncio.ensure_future(_run_job(update, context, resource, handler, user_id))
+    current_active_job.reset(token)
+    jobs = active_jobs.setdefault(user_id, set())
+    jobs.add(job)
+    
+    try:
+        return await job.task
+    except asyncio.CancelledError:
+        # Cancelled ourselves (e.g. at shutdown), not just the job
+        if asyncio.current_task().cancelling():
+            raise
+        for message in job.status_messages:
+            try:
+                await message.edit_text("⏹ Cancelled.")
+            except Exception as e:
+                logger.debug(f"Could not update cancelled status: {e}")
+    finally:
+        jobs.discard(job)
+        if not jobs:
+            active_jobs.pop(user_id, None)
+
+async def _run_job(update, context, resource, handler, user_id):
+    """Run a handler once the scheduler grants it a slot
+
+    Users who have to wait are told their place in the queue, updated as it
+    moves; the notice is removed when their job starts. The job runs under its own trace, and
+    its worker calls are profiled while the admin has profiling switched on.
+    """
+    notice = None
+
+    async def on_queued(position):
+        nonlocal notice
+        text = (
+            f"⏳ The bot is busy right now.\n"
+            f"Your request is #{position} in the queue and will start automatically."
+        )
+        # The notice is a courtesy; failing to show it must not lose the job
+        try:
+            if notice is None:
+                notice = await update.effective_message.reply_text(text, reply_markup=CANCEL_MARKUP)
+                register_status(notice)
+            else:
+                await notice.edit_text(text, reply_markup=CANCEL_MARKUP)
+        except Exception as e:
+            logger.debug(f"Could not show queue position: {e}")
+
+    queued_at = time.perf_counter()
+    async with scheduler.slot(user_id, resource, on_queued):
+        if notice is not None:
+            current_active_job.get().status_messages.remove(notice)
+            try:
+                await notice.delete()
+            except Exception as e:
+                logger.debug(f"Could not delete queue notice: {e}")
+        
+        with job_trace(handler.__name__, user_id) as job:
+            annotate(resource=resource, queue_seconds=round(time.perf_counter() - queued_at, 3))
+            if profiling.claim():
+                job.profile = []
+            try:
+                return await handler(update, context)
+            finally:
+                if job.profile is not None:
+                    await profiling.send_report(context.bot, job)
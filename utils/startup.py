@@ -0,0 +1,111 @@
+"""Start-up timing and pre-warming of the worker pool
+
+python -m utils.startup reports how long each package takes to import when
+the bot starts, slowest first, so start-up regressions are easy to spot:
+
+    python -m utils.startup                   # import time of `import main`
+    python -m utils.startup --max-seconds 1   # exit with status 1 above a budget
+"""
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from core.lazy import preload
+import config
+from utils import workers
+from utils.metrics import STARTUP_SECONDS, WORKER_IMPORT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+def record_startup(imports, ready):
+    """Log and export how long the bot took to import its modules and to start"""
+    STARTUP_SECONDS.labels('imports').set(imports)
+    STARTUP_SECONDS.labels('ready').set(ready)
+    logger.info(f"Bot ready in {ready:.2f}s (imports {imports:.2f}s)")
+
+async def prewarm_workers():
+    """Start every worker process in the background so the first jobs find them ready
+
+    Each worker imports PREWARM_MODULES as it starts; the other heavy
+    libraries are still loaded on first use.
+    """
+    if not config.PREWARM_WORKERS:
+        return
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(workers.run_in_process(preload, config.PREWARM_MODULES) for _ in range(config.WORKER_PROCESSES)),
+        return_exceptions=True
+    )
+    slowest = {}
+    for result in results:
+        if isinstance(result, Exception):
+            logger.warning(f"Worker pre-warming failed: {result}")
+            return
+        for name, seconds in result.items():
+            slowest[name] = max(seconds, slowest.get(name, 0.0))
+
+    elapsed = time.perf_counter() - start
+    STARTUP_SECONDS.labels('workers').set(elapsed)
+    for name, seconds in slowest.items():
+        WORKER_IMPORT_SECONDS.labels(name).set(seconds)
+    imports = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in slowest.items())
+    logger.info(f"{config.WORKER_PROCESSES} workers warmed in {elapsed:.2f}s ({imports or 'no pre-warmed imports'})")
+
+def import_times(module):
+    """Run `import module` in a fresh interpreter and return its -X importtime rows
+
+    Each row is (name, depth, self_us, cumulative_us).
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='main', help="module whose import is measured")
+    parser.add_argument('--top', type=int, default=20, help="packages to list")
+    parser.add_argument('--max-seconds', type=float, help="exit with status 1 if the import takes longer")
+    args = parser.parse_args(argv)
+
+    rows = import_times(args.module)
+    total = next(cumulative for name, depth, _, cumulative in rows if name == args.module and depth == 0) / 1e6
+
+    # Self time summed per top-level package: what each dependency costs
+    packages = defaultdict(int)
+    counts = defaultdict(int)
+    for name, _, self_us, _ in rows:
+        packages[name.split('.')[0]] += self_us
+        counts[name.split('.')[0]] += 1
+
+    print(f"{'package':28} {'seconds':>8} {'share':>7} {'modules':>8}")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:28} {self_us / 1e6:8.3f} {self_us / 1e6 / total * 100:6.1f}% {counts[package]:8}")
+    print(f"\nimport {args.module}: {total:.3f}s, {len(rows)} modules")
+
+    heavy = [name for name in ('fitz', 'pikepdf', 'pdfplumber', 'pdf2docx', 'PyPDF2', 'PIL') if name in packages]
+    if heavy:
+        print(f"Loaded eagerly (should be lazy): {', '.join(heavy)}")
+
+    if args.max_seconds is not None and total > args.max_seconds:
+        print(f"Import time {total:.3f}s is over the budget of {args.max_seconds:.3f}s")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import contextvars
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+import config
+
+logger = logging.getLogger(__name__)
+
+# The job the current task is working on; copied into tasks it starts
+current_job = contextvars.ContextVar('current_job', default=None)
+
+class Job:
+    """Trace context for one job: its id and attributes shared by its spans"""
+
+    def __init__(self, operation, user_id):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.operation = operation
+        self.user_id = user_id
+        self.attributes = {}
+        self.profile = None
+
+def annotate(**attributes):
+    """Attach attributes such as input size or page count to the current job"""
+    job = current_job.get()
+    if job is not None:
+        job.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+def write_span(record):
+    """Append one span to the JSON-lines trace file, rotating it when full"""
+    if not config.TRACING_ENABLED:
+        return
+    try:
+        directory = os.path.dirname(config.TRACE_FILE)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(config.TRACE_FILE) and \
+                os.path.getsize(config.TRACE_FILE) > config.TRACE_MAX_MB * 1024 * 1024:
+            os.replace(config.TRACE_FILE, config.TRACE_FILE + '.1')
+        with open(config.TRACE_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, default=str) + "\n")
+    except OSError as e:
+        logger.warning(f"Could not write trace span: {e}")
+
+@contextmanager
+def span(name, operation=None, **attributes):
+    """Record a timed span within the current job, or as a job of its own"""
+    job = current_job.get()
+    token = None
+    if job is None:
+        job = Job(operation or name, None)
+        token = current_job.set(job)
+
+    started = time.time()
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield job
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        write_span({
+            'trace_id': job.trace_id,
+            'operation': operation or job.operation,
+            'span': name,
+            'user_id': job.user_id,
+            'start': round(started, 3),
+            'duration': round(time.perf_counter() - start, 4),
+            'status': status,
+            'attributes': {**job.attributes, **attributes}
+        })
+        if token is not None:
+            current_job.reset(token)
+
+@contextmanager
+def job_trace(operation, user_id):
+    """Run a whole job under a fresh trace; its span closes after all phases"""
+    job = Job(operation, user_id)
+    token = current_job.set(job)
+    try:
+        with span('job'):
+            yield job
+    finally:
+        current_job.reset(token)
@@ -0,0 +1,268 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import signal
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import config
+from core.lazy import preload
+from utils import profiling
+from utils.tracing import current_job
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+# Tokens of calls submitted to the current pool that have not finished
+_pool_tokens = set()
+# Pools replaced after an interrupted call, with the tokens of their unfinished calls
+_retired_pools = []
+# Retired pools allowed to keep running; beyond this the oldest is killed
+MAX_RETIRED_POOLS = 1
+# Limits processes started by run_killable, created on first use
+_killable_slots = None
+# Tasks submitted to the pool and not yet finished, read by the metrics endpoint
+tasks_in_flight = 0
+# In a worker: token of the call it is running
+_current_token = None
+# In a worker: set once a call was interrupted, leaving library state unknown
+_interrupted = False
+
+class CallCancelled(Exception):
+    """Raised inside a worker when the job that submitted its call is cancelled"""
+
+class WorkerRetired(Exception):
+    """Raised by a worker that was interrupted earlier instead of running a new call"""
+
+def _marker(token, suffix=''):
+    return os.path.join(config.WORKER_CANCEL_DIR, token + suffix)
+
+def _on_cancel_signal(signum, frame):
+    # The signal may arrive after the cancelled call finished; only the call
+    # whose token was marked is interrupted
+    if _current_token is not None and os.path.exists(_marker(_current_token)):
+        raise CallCancelled()
+
+def init_worker(modules):
+    """Pool initializer: make calls interruptible, then import the heavy modules"""
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, _on_cancel_signal)
+    preload(modules)
+
+def _tracked_call(token, call):
+    """Run call in a worker, leaving its pid where a cancelling parent can find it
+    
+    A worker whose call was interrupted may hold half-updated PyMuPDF or
+    pikepdf state, so it runs nothing else; its pool is being retired and
+    the caller resubmits to the new one.
+    """
+    global _current_token, _interrupted
+    if _interrupted:
+        raise WorkerRetired()
+    with open(_marker(token, '.pid'), 'w') as f:
+        f.write(str(os.getpid()))
+    try:
+        # Cancelled while still queued
+        if os.path.exists(_marker(token)):
+            raise CallCancelled()
+        _current_token = token
+        try:
+            return call()
+        except CallCancelled:
+            _interrupted = True
+            raise
+        finally:
+            _current_token = None
+    finally:
+        os.remove(_marker(token, '.pid'))
+
+def _remove_marker(token):
+    try:
+        os.remove(_marker(token))
+    except OSError:
+        pass
+
+def _cancel_call(token, future):
+    """Stop a call in the pool: drop it if queued, otherwise interrupt its worker
+    
+    The marker is written before the pid is read, and the worker writes its
+    pid before checking the marker, so one of the two always sees the other.
+    """
+    if future.cancel():
+        return
+    open(_marker(token), 'w').close()
+    future.add_done_callback(lambda _: _remove_marker(token))
+    try:
+        with open(_marker(token, '.pid')) as f:
+            os.kill(int(f.read()), signal.SIGUSR1)
+    except (OSError, ValueError, AttributeError):
+        # Already finished, not started yet, or no SIGUSR1 on this platform
+        return
+    _retire_executor()
+
+def _retire_executor():
+    """Send new calls to a fresh pool; the current one exits once its running calls are done
+    
+    Calls still queued in it are cancelled and resubmitted by run_in_process.
+    So that repeated cancels cannot stack up pools, only MAX_RETIRED_POOLS
+    old pools are kept and the oldest beyond that is killed; its calls are
+    resubmitted too.
+    """
+    global _executor, _pool_tokens
+    if _executor is None:
+        return
+    _retired_pools[:] = [(pool, tokens) for pool, tokens in _retired_pools if tokens]
+    _retired_pools.append((_executor, _pool_tokens))
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _executor, _pool_tokens = None, set()
+    logger.info("Worker pool replaced after a call was interrupted")
+    
+    while len(_retired_pools) > MAX_RETIRED_POOLS:
+        pool, tokens = _retired_pools.pop(0)
+        _kill_calls(tokens)
+        logger.warning(f"Killed a retired worker pool with {len(tokens)} calls still running")
+
+def _kill_calls(tokens):
+    """Kill the workers running the given calls, which breaks their pool"""
+    for token in list(tokens):
+        try:
+            with open(_marker(token, '.pid')) as f:
+                os.kill(int(f.read()), signal.SIGKILL)
+        except (OSError, ValueError, AttributeError):
+            pass
+
+def get_executor():
+    """Get the shared process pool, creating it on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=config.WORKER_PROCESSES,
+            mp_context=multiprocessing.get_context(config.WORKER_START_METHOD),
+            max_tasks_per_child=config.WORKER_MAX_TASKS or None,
+            initializer=init_worker,
+            initargs=(config.PREWARM_MODULES,)
+        )
+        logger.info(f"Worker pool started with {config.WORKER_PROCESSES} processes")
+    return _executor
+
+def _profiled(func, args, kwargs):
+    """Wrap a call in cProfile while the current job is being profiled"""
+    job = current_job.get()
+    if job is None or job.profile is None:
+        return func, args, kwargs
+    path = profiling.profile_path(job)
+    job.profile.append(path)
+    return profiling.profiled_call, (func, path, args, kwargs), {}
+
+async def run_in_process(func, *args, **kwargs):
+    """Run a blocking function in the worker pool and await its result
+    
+    If the awaiting task is cancelled, the call is interrupted in its worker
+    with CallCancelled, and the pool is replaced so that worker runs nothing
+    else. Calls caught up in a pool being replaced are resubmitted.
+    """
+    global tasks_in_flight
+    func, args, kwargs = _profiled(func, args, kwargs)
+    call = functools.partial(func, *args, **kwargs)
+    
+    token = uuid.uuid4().hex
+    tasks_in_flight += 1
+    try:
+        while True:
+            executor = get_executor()
+            future = executor.submit(_tracked_call, token, call)
+            tokens = _pool_tokens
+            tokens.add(token)
+            future.add_done_callback(lambda _, tokens=tokens: tokens.discard(token))
+            try:
+                return await asyncio.wrap_future(future)
+            except WorkerRetired:
+                # Landed on an interrupted worker of a retired pool
+                continue
+            except BrokenProcessPool:
+                if executor is _executor:
+                    raise
+                # A retired pool was killed while this call was in it
+                continue
+            except asyncio.CancelledError:
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    # Still queued when its pool was retired
+                    continue
+                _cancel_call(token, future)
+                raise
+    finally:
+        tasks_in_flight -= 1
+
+def _run_and_send(sender, func, args, kwargs):
+    """Entry point of a killable process: run func and send back its outcome"""
+    try:
+        outcome = (True, func(*args, **kwargs))
+    except BaseException as e:
+        outcome = (False, e)
+    try:
+        sender.send(outcome)
+    except Exception:
+        # The exception itself could not be pickled
+        sender.send((False, RuntimeError(repr(outcome[1]))))
+    finally:
+        sender.close()
+
+async def _wait_readable(connection):
+    """Wait until connection has data or its writer has gone away"""
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    loop.add_reader(connection.fileno(), lambda: ready.done() or ready.set_result(None))
+    try:
+        await ready
+    finally:
+        loop.remove_reader(connection.fileno())
+
+async def run_killable(func, *args, timeout=None, **kwargs):
+    """Run a blocking function in a process of its own and await its result
+    
+    Unlike the shared pool, the process is killed when the timeout passes
+    (raising asyncio.TimeoutError) or the awaiting task is cancelled, so a
+    runaway conversion cannot hold a CPU. Results travel through a pipe and
+    should be small; write large outputs to files. Profiled like pool calls,
+    except that a killed process leaves no profile.
+    """
+    global _killable_slots, tasks_in_flight
+    if _killable_slots is None:
+        _killable_slots = asyncio.Semaphore(config.WORKER_PROCESSES)
+    
+    name = func.__name__
+    func, args, kwargs = _profiled(func, args, kwargs)
+    context = multiprocessing.get_context(config.WORKER_START_METHOD)
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_and_send, args=(sender, func, args, kwargs), daemon=True)
+    
+    async with _killable_slots:
+        tasks_in_flight += 1
+        try:
+            process.start()
+            sender.close()
+            await asyncio.wait_for(_wait_readable(receiver), timeout)
+            try:
+                ok, result = receiver.recv()
+            except EOFError:
+                await asyncio.to_thread(process.join)
+                raise ChildProcessError(f"{name} exited with code {process.exitcode}")
+        finally:
+            tasks_in_flight -= 1
+            if process.is_alive():
+                process.kill()
+            receiver.close()
+            await asyncio.to_thread(process.join)
+    
+    if not ok:
+        raise result
+    return result
+
+def shutdown_executor():
+    """Stop the worker pool"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None